@@ -0,0 +1,139 @@
+"""
+Presupuesto global de agentes/browsers compartido por todos los jobs
+"""
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+from config import settings
+from coordinacion import coordinador
+import metricas
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AgentBudget:
+    """
+    Limita la cantidad de agentes (browsers cloud) corriendo a la vez en el
+    proceso y reparte los cupos de forma justa entre jobs
+
+    Cuando se libera un cupo se entrega al job con menos agentes en uso entre
+    los que están esperando, así un job con cientos de servicios no acapara
+    todos los cupos mientras otros esperan.
+
+    `max_agentes` vale para toda la flota: con varios procesos consumidores
+    cada uno usa su parte según las réplicas vivas en el broker.
+    """
+
+    def __init__(self, max_agentes: int = 10):
+        """
+        Args:
+            max_agentes: Máximo de agentes simultáneos entre todos los procesos
+        """
+        self.max_agentes = max_agentes
+        self.en_uso_total = 0
+        self._en_uso: Dict[str, int] = {}
+        self._esperando: Dict[str, Deque[asyncio.Future]] = {}
+
+    @property
+    def limite(self) -> int:
+        """Cupos de este proceso: su parte de max_agentes (al menos 1)"""
+        return max(1, self.max_agentes // coordinador.replicas)
+
+    async def acquire(self, propietario: str):
+        """
+        Espera un cupo para ejecutar un agente
+
+        Args:
+            propietario: Identificador del job que pide el cupo
+        """
+        if self.en_uso_total < self.limite and not self._hay_esperando():
+            self._asignar(propietario)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._esperando.setdefault(propietario, deque()).append(future)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # El cupo se asignó justo antes de la cancelación: devolverlo
+                self.release(propietario)
+            else:
+                self._quitar_esperando(propietario, future)
+            raise
+
+    def release(self, propietario: str):
+        """Devuelve un cupo y lo entrega al siguiente job que corresponda"""
+        self.en_uso_total -= 1
+        self._en_uso[propietario] -= 1
+        if self._en_uso[propietario] <= 0:
+            del self._en_uso[propietario]
+        self._despachar()
+
+    @asynccontextmanager
+    async def lease(self, propietario: str):
+        """Context manager que toma y libera un cupo"""
+        await self.acquire(propietario)
+        try:
+            yield
+        finally:
+            self.release(propietario)
+
+    def _asignar(self, propietario: str):
+        self.en_uso_total += 1
+        self._en_uso[propietario] = self._en_uso.get(propietario, 0) + 1
+
+    def _hay_esperando(self) -> bool:
+        return any(self._esperando.values())
+
+    def _quitar_esperando(self, propietario: str, future: asyncio.Future):
+        cola = self._esperando.get(propietario)
+        if cola and future in cola:
+            cola.remove(future)
+        if not cola:
+            self._esperando.pop(propietario, None)
+
+    def _despachar(self):
+        while self.en_uso_total < self.limite:
+            candidatos = [p for p, cola in self._esperando.items() if cola]
+            if not candidatos:
+                return
+
+            # Justicia: el job con menos agentes corriendo recibe el cupo
+            propietario = min(candidatos, key=lambda p: self._en_uso.get(p, 0))
+            cola = self._esperando[propietario]
+            future = cola.popleft()
+            if not cola:
+                del self._esperando[propietario]
+
+            if future.done():
+                continue
+
+            self._asignar(propietario)
+            future.set_result(None)
+
+    def stats(self) -> Dict:
+        """
+        Obtiene el uso actual del presupuesto
+
+        Returns:
+            Diccionario con cupos de la flota y del proceso, en uso y esperando por job
+        """
+        return {
+            "max_agentes": self.max_agentes,
+            "replicas": coordinador.replicas,
+            "limite_proceso": self.limite,
+            "en_uso": self.en_uso_total,
+            "en_uso_por_job": dict(self._en_uso),
+            "esperando_por_job": {p: len(cola) for p, cola in self._esperando.items() if cola}
+        }
+
+
+# Singleton instance
+agent_budget = AgentBudget(max_agentes=settings.MAX_AGENTES_CONCURRENTES)
+metricas.metricas.al_exponer(lambda: metricas.agentes_en_uso.set(agent_budget.en_uso_total))
+# Si un worker se cae, los demás toman su parte de los cupos
+coordinador.al_cambiar_replicas(agent_budget._despachar)
@@ -1,10 +1,20 @@
 """
 Ejecutor del agente browser-use para consultar deudas
 """
-from browser_use import Agent, Browser, ChatBrowserUse
+from browser_use import Agent, ChatBrowserUse
+from browser_use.agent.views import AgentHistoryList
 from pydantic import BaseModel
 from config import settings
-from typing import Optional, Dict
+from browser_pool import browser_pool
+from prompt_generator import PromptGenerator
+from extractores import obtener_extractor, extraer_monto_de_texto, url_portal, ExtraccionError
+from trazas import traza_store, VARIABLE_IDENTIFICADOR
+from perfil_agente import causa_de_fallo, construir_perfil, ultimo_error
+from limites_agente import limites_agente
+from circuit_breaker import es_error_de_portal, es_falla_de_portal
+import metricas
+from typing import Optional, Dict, Tuple
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,16 +27,15 @@ class DeudaOutput(BaseModel):
 class AgentRunner:
     """
     Ejecuta el agente browser-use para consultar una deuda
+
+    El browser se toma prestado del pool compartido durante cada consulta.
     """
 
     def __init__(self):
-        self.browser = None
         self.llm = None
 
     async def initialize(self):
-        """Inicializa el browser y el LLM"""
-        if not self.browser:
-            self.browser = Browser(use_cloud=settings.BROWSER_USE_CLOUD)
+        """Inicializa el LLM"""
         if not self.llm:
             self.llm = ChatBrowserUse()
 
@@ -38,18 +47,134 @@ class AgentRunner:
             prompt: Prompt generado con la información del servicio
 
         Returns:
-            Dict con 'deuda' (float) y 'error' (str) si hubo error
+            Dict con 'deuda' (float), 'error' (str) si hubo error, 'falla_portal' si
+            el error muestra que el portal no respondió y 'perfil' de la corrida
         """
         await self.initialize()
 
+        async with browser_pool.lease() as sesion:
+            resultado, _ = await self._ejecutar_agente(prompt, sesion)
+            return resultado
+
+    async def consultar_servicio(self, servicio: Dict, empresa_info: Dict) -> Dict:
+        """
+        Consulta la deuda de un servicio usando el camino más barato disponible
+
+        Orden: extractor determinístico de la empresa, luego la traza grabada
+        de una corrida exitosa anterior, y recién entonces el agente LLM.
+
+        Args:
+            servicio: Registro de la tabla 'servicios'
+            empresa_info: Registro de la tabla 'empresas_servicio'
+
+        Returns:
+            Dict con 'deuda', 'error' y 'fuente' ("script", "traza" o "agente");
+            si corrió el agente, también 'perfil' (ver perfil_agente.construir_perfil)
+            y, si falló, 'falla_portal' (lo usa el circuit breaker)
+        """
+        identificador = servicio.get("credenciales", {}).get("identificador", "")
+        extractor = obtener_extractor(empresa_info)
+
+        async with browser_pool.lease() as sesion:
+            if extractor:
+                try:
+                    deuda = await asyncio.wait_for(
+                        extractor.extraer(sesion.browser, url_portal(empresa_info), identificador, empresa_info),
+                        timeout=settings.EXTRACTOR_TIMEOUT * 3
+                    )
+                    logger.info(f"Deuda extraída por script ({empresa_info['nombre']}): {deuda}")
+                    return {"deuda": deuda, "error": None, "fuente": "script"}
+                except Exception as e:
+                    logger.warning(f"Script de {empresa_info['nombre']} falló, usando agente: {str(e)}")
+
+            await self.initialize()
+            limites = await limites_agente.obtener(empresa_info)
+
+            if settings.TRAZAS_HABILITADAS and traza_store.cargar(empresa_info["nombre"]):
+                try:
+                    deuda = await self._reproducir_traza(empresa_info["nombre"], identificador, sesion, limites["step_timeout"])
+                    traza_store.registrar_reproduccion(empresa_info["nombre"], exito=True)
+                    logger.info(f"Deuda extraída por traza ({empresa_info['nombre']}): {deuda}")
+                    return {"deuda": deuda, "error": None, "fuente": "traza"}
+                except Exception as e:
+                    traza_store.registrar_reproduccion(empresa_info["nombre"], exito=False)
+                    logger.warning(f"Traza de {empresa_info['nombre']} divergió, usando agente: {str(e)}")
+
+            prompt = PromptGenerator.generate_prompt_from_servicio(servicio, empresa_info)
+            resultado, history = await self._ejecutar_agente(prompt, sesion, limites)
+            resultado["fuente"] = "agente"
+            resultado["perfil"]["limites"] = {k: v for k, v in limites.items() if k != "origen"}
+            metricas.agente_pasos.labels(compania=empresa_info["nombre"]).observe(resultado["perfil"]["pasos"])
+
+            if settings.TRAZAS_HABILITADAS and resultado["error"] is None and history:
+                try:
+                    traza_store.guardar(empresa_info["nombre"], history, identificador)
+                except Exception as e:
+                    logger.warning(f"No se pudo guardar la traza de {empresa_info['nombre']}: {str(e)}")
+
+            return resultado
+
+    async def _reproducir_traza(self, nombre_empresa: str, identificador: str, sesion, step_timeout: Optional[int] = None) -> float:
+        """
+        Reproduce la traza grabada de una empresa y lee el monto de la página
+
+        Args:
+            step_timeout: Segundos por paso de la traza (None = STEP_TIMEOUT)
+
+        Raises:
+            ExtraccionError / RuntimeError: Si la página ya no coincide con la traza
+        """
+        traza = traza_store.cargar(nombre_empresa)
+        if not traza:
+            raise ExtraccionError(f"No hay traza para {nombre_empresa}")
+
+        agent = Agent(
+            task=f"Reproducir consulta de deuda de {nombre_empresa}",
+            llm=self.llm,
+            browser=sesion.browser,
+            sensitive_data={VARIABLE_IDENTIFICADOR: identificador},
+            directly_open_url=False,
+            output_model_schema=DeudaOutput,
+        )
+        history = AgentHistoryList.load_from_dict({"history": traza["history"]}, agent.AgentOutput)
+
+        # skip_failures=False: si un elemento no aparece, la traza divergió
+        await asyncio.wait_for(
+            agent.rerun_history(history, max_retries=2, skip_failures=False, delay_between_actions=1.0),
+            timeout=(step_timeout or settings.STEP_TIMEOUT) * max(len(history.history), 1)
+        )
+
+        page = await sesion.browser.must_get_current_page()
+        texto = await page.evaluate("() => document.body ? document.body.innerText : ''")
+        monto = extraer_monto_de_texto(texto)
+        if monto is None:
+            raise ExtraccionError("La página final de la traza no contiene un monto")
+        return monto
+
+    async def _ejecutar_agente(self, prompt: str, sesion, limites: Optional[Dict] = None) -> Tuple[Dict, Optional[AgentHistoryList]]:
+        """
+        Corre el agente LLM sobre una sesión del pool ya tomada
+
+        Args:
+            prompt: Prompt del agente
+            sesion: Sesión del pool
+            limites: step_timeout, max_failures y max_actions_per_step de la
+                empresa (ver limites_agente.obtener); None = límites globales
+
+        Returns:
+            Tupla (resultado con 'perfil', historial del agente o None si falló antes de correr)
+        """
+        limites = limites or limites_agente.por_defecto()
+        agent = None
+        history = None
         try:
             agent = Agent(
                 task=prompt,
                 llm=self.llm,
-                browser=self.browser,
-                max_failures=settings.MAX_FAILURES,
-                step_timeout=settings.STEP_TIMEOUT,
-                max_actions_per_step=settings.MAX_ACTIONS_PER_STEP,
+                browser=sesion.browser,
+                max_failures=limites["max_failures"],
+                step_timeout=limites["step_timeout"],
+                max_actions_per_step=limites["max_actions_per_step"],
                 directly_open_url=True,
                 output_model_schema=DeudaOutput,
             )
@@ -61,8 +186,8 @@ class AgentRunner:
             if history:
                 try:
                     final_data = history.final_result()
-                    logger.info(f"Final data type: {type(final_data)}")
-                    logger.info(f"Final data: {final_data}")
+                    logger.debug(f"Final data type: {type(final_data)}")
+                    logger.debug(f"Final data: {final_data}")
 
                     # El resultado puede ser:
                     # 1. Un string JSON que necesita parsing
@@ -72,14 +197,14 @@ class AgentRunner:
                             parsed_data = json.loads(final_data)
                             if isinstance(parsed_data, dict) and 'deuda' in parsed_data:
                                 logger.info(f"Deuda extraída (JSON string): {parsed_data['deuda']}")
-                                return {"deuda": float(parsed_data['deuda']), "error": None}
+                                return {"deuda": float(parsed_data['deuda']), "error": None, "perfil": construir_perfil(history)}, history
                         except json.JSONDecodeError:
                             logger.error(f"No se pudo parsear JSON: {final_data}")
 
                     # 2. Un dict directo
                     elif isinstance(final_data, dict) and 'deuda' in final_data:
                         logger.info(f"Deuda extraída (dict): {final_data['deuda']}")
-                        return {"deuda": float(final_data['deuda']), "error": None}
+                        return {"deuda": float(final_data['deuda']), "error": None, "perfil": construir_perfil(history)}, history
 
                     # 3. Un Pydantic model
                     elif hasattr(final_data, 'model_dump'):
@@ -87,25 +212,36 @@ class AgentRunner:
                         logger.info(f"Model dict: {model_dict}")
                         if 'deuda' in model_dict:
                             logger.info(f"Deuda extraída (model): {model_dict['deuda']}")
-                            return {"deuda": float(model_dict['deuda']), "error": None}
+                            return {"deuda": float(model_dict['deuda']), "error": None, "perfil": construir_perfil(history)}, history
 
                     # 4. Acceso directo al atributo
                     elif hasattr(final_data, 'deuda'):
                         logger.info(f"Deuda extraída (attr): {final_data.deuda}")
-                        return {"deuda": float(final_data.deuda), "error": None}
+                        return {"deuda": float(final_data.deuda), "error": None, "perfil": construir_perfil(history)}, history
 
                 except Exception as inner_e:
                     logger.error(f"Error procesando resultado: {str(inner_e)}")
                     import traceback
                     traceback.print_exc()
 
-            return {"deuda": 0, "error": "No se pudo obtener resultado del agente"}
+            error = "No se pudo obtener resultado del agente"
+            # Sin detalle propio, el perfil toma el último error real de los pasos
+            perfil = construir_perfil(history, causa_de_fallo(history, resultado_valido=False))
+            # El agente se rindió sin excepción: si lo que lo cortó fue un error de
+            # navegación o timeout del portal, cuenta para el circuit breaker
+            falla_portal = es_error_de_portal(ultimo_error(history))
+            return {"deuda": 0, "error": error, "falla_portal": falla_portal, "perfil": perfil}, history
 
         except Exception as e:
             logger.error(f"Error al consultar deuda: {str(e)}")
-            return {"deuda": 0, "error": str(e)}
+            # Una sesión que falló no vuelve al pool
+            sesion.marcar_error()
+            # Si la corrida se cortó a mitad, los pasos ya hechos siguen en agent.history
+            history = history or (agent.history if agent else None)
+            perfil = construir_perfil(history, causa_de_fallo(history, excepcion=e), str(e) or type(e).__name__)
+            return {"deuda": 0, "error": str(e), "falla_portal": es_falla_de_portal(e), "perfil": perfil}, history
 
     async def close(self):
-        """Cierra el browser"""
-        # El browser se cierra automáticamente al finalizar el agente
+        """Libera recursos del runner"""
+        # El browser vuelve al pool al terminar cada consulta
         pass
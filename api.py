@@ -1,17 +1,35 @@
 """
 API REST con FastAPI para consultar deudas de servicios
 """
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Query
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from batch_processor import BatchProcessor
 from database import db
+from empresa_cache import empresa_catalog
+from consulta_writer import consulta_writer
+from agent_budget import agent_budget
+from browser_pool import browser_pool
+from consulta_cache import consulta_cache
 from job_queue import job_queue
+from config import settings
+from metricas import metricas
+from perfil_agente import resumir_perfiles
+from limites_agente import limites_agente
+from circuit_breaker import circuit_breaker
+from coordinacion import coordinador
+from datetime import datetime, timedelta
+import asyncio
+import json
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Los conteos por estado son de todo el broker: los exporta solo la API
+metricas.al_exponer(job_queue.actualizar_metricas_broker)
+
 app = FastAPI(
     title="API Consulta Deudas Servicios",
     description="API para consultar deudas de servicios básicos de propiedades",
@@ -23,12 +41,14 @@ class ConsultaPropiedadRequest(BaseModel):
     propiedad_id: int
     callback_url: Optional[str] = None  # URL donde enviar resultados
     voucher_id: Optional[str] = None     # ID del voucher (para referencia)
+    carril: Optional[str] = None         # interactive, batch o background (por defecto según tipo)
 
 
 class ConsultaServiciosRequest(BaseModel):
     servicio_ids: List[int]
     callback_url: Optional[str] = None  # URL donde enviar resultados
     voucher_id: Optional[str] = None     # ID del voucher (para referencia)
+    carril: Optional[str] = None         # interactive, batch o background (por defecto según tipo)
 
 
 class ConsultaResponse(BaseModel):
@@ -36,6 +56,23 @@ class ConsultaResponse(BaseModel):
     job_id: Optional[str] = None
 
 
+@app.on_event("startup")
+async def startup():
+    """Conecta la cola al broker y pre-calienta recursos compartidos"""
+    await job_queue.start(consumir=settings.API_CONSUMIR_COLA)
+    if job_queue.consumir:
+        asyncio.create_task(browser_pool.start())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Libera recursos compartidos al detener la API"""
+    await job_queue.close()
+    await consulta_writer.close()
+    await browser_pool.close()
+    db.close()
+
+
 @app.get("/")
 async def root():
     """Endpoint raíz"""
@@ -49,10 +86,21 @@ async def root():
             "POST /consultar/servicios": "Consultar servicios específicos (encola el trabajo)",
             "POST /consultar/todas": "Consultar todas las propiedades (encola el trabajo)",
             "GET /job/{job_id}": "Ver estado de un trabajo",
+            "GET /job/{job_id}/events": "Seguir el progreso de un trabajo en vivo (Server-Sent Events)",
+            "GET /job/{job_id}/resultados": "Resultados por servicio ya disponibles de un trabajo (paginado)",
             "GET /jobs": "Listar todos los trabajos",
             "GET /queue/stats": "Ver estadísticas de la cola",
+            "GET /perfiles/agente": "Pasos, tiempos, tokens y causas de fallo del agente por empresa",
+            "GET /perfiles/agente/limites": "Límites del agente (timeout por paso, fallos, acciones) aprendidos por empresa",
+            "GET /circuitos": "Estado del circuit breaker de cada compañía",
+            "POST /circuitos/reset": "Cierra a mano el circuito de una compañía",
+            "GET /metrics": "Métricas de cola, agentes, BD y callbacks (formato Prometheus)",
             "GET /historial/propiedad/{propiedad_id}": "Ver historial de consultas",
-            "GET /servicios/propiedad/{propiedad_id}": "Listar servicios de una propiedad"
+            "GET /servicios/propiedad/{propiedad_id}": "Listar servicios de una propiedad",
+            "GET /cache/empresas/stats": "Ver estadísticas del caché de empresas",
+            "POST /cache/empresas/invalidate": "Invalidar (y opcionalmente recargar) el caché de empresas",
+            "GET /cache/consultas/stats": "Ver estadísticas del caché de consultas de deuda",
+            "POST /cache/consultas/invalidate": "Descartar deudas cacheadas en memoria"
         }
     }
 
@@ -80,7 +128,8 @@ async def consultar_propiedad(request: ConsultaPropiedadRequest):
             tipo="propiedad",
             params={"propiedad_id": request.propiedad_id},
             callback_url=request.callback_url,
-            voucher_id=request.voucher_id
+            voucher_id=request.voucher_id,
+            carril=request.carril
         )
 
         mensaje = "Consulta encolada correctamente"
@@ -95,6 +144,8 @@ async def consultar_propiedad(request: ConsultaPropiedadRequest):
             "nota": "Use GET /job/{job_id} para consultar el estado y resultado" if not request.callback_url else None
         }
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error encolando consulta de propiedad {request.propiedad_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -117,7 +168,8 @@ async def consultar_servicios(request: ConsultaServiciosRequest):
             tipo="servicios",
             params={"servicio_ids": request.servicio_ids},
             callback_url=request.callback_url,
-            voucher_id=request.voucher_id
+            voucher_id=request.voucher_id,
+            carril=request.carril
         )
 
         mensaje = "Consulta encolada correctamente"
@@ -132,6 +184,8 @@ async def consultar_servicios(request: ConsultaServiciosRequest):
             "nota": "Use GET /job/{job_id} para consultar el estado y resultado" if not request.callback_url else None
         }
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error encolando consulta de servicios: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -176,7 +230,7 @@ async def get_job_status(job_id: str):
         Información completa del trabajo
     """
     try:
-        job = job_queue.get_job_status(job_id)
+        job = await job_queue.obtener_job(job_id)
 
         if not job:
             raise HTTPException(status_code=404, detail=f"Trabajo {job_id} no encontrado")
@@ -190,6 +244,93 @@ async def get_job_status(job_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/job/{job_id}/events")
+async def job_events(
+    job_id: str,
+    request: Request,
+    after: int = Query(0, description="Última secuencia de evento ya recibida")
+):
+    """
+    Stream SSE con los cambios de estado y resultados por servicio de un trabajo
+
+    Eventos: "status" (pending, processing, completed, failed), "progreso" y
+    "resultado" (uno por servicio consultado). El stream se cierra cuando el
+    trabajo termina. Al reconectar, EventSource envía Last-Event-ID y el
+    stream continúa desde ahí.
+
+    Args:
+        job_id: ID del trabajo
+        after: Última secuencia recibida (alternativa a Last-Event-ID)
+
+    Returns:
+        Stream text/event-stream
+    """
+    try:
+        if not job_queue.get_job_status(job_id):
+            raise HTTPException(status_code=404, detail=f"Trabajo {job_id} no encontrado")
+
+        ultimo_id = request.headers.get("last-event-id")
+        despues_de = int(ultimo_id) if ultimo_id and ultimo_id.isdigit() else after
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error abriendo stream de eventos del job {job_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def stream():
+        async for evento in job_queue.seguir_job(job_id, despues_de):
+            if await request.is_disconnected():
+                break
+            if evento is None:
+                yield ": ping\n\n"
+                continue
+            datos = json.dumps(evento["datos"], default=str)
+            yield f"id: {evento['seq']}\nevent: {evento['tipo']}\ndata: {datos}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/job/{job_id}/resultados")
+async def job_resultados(
+    job_id: str,
+    after: int = Query(0, description="Cursor devuelto por la página anterior"),
+    limit: int = Query(100, ge=1, le=1000, description="Cantidad máxima de resultados")
+):
+    """
+    Resultados por servicio de un trabajo, disponibles mientras aún se procesa
+
+    Cada servicio aparece apenas termina su consulta. Para seguir leyendo,
+    pasar en `after` el valor `after` de la respuesta anterior mientras
+    `hay_mas` sea true.
+
+    Args:
+        job_id: ID del trabajo
+        after: Cursor de la página anterior (0 = desde el inicio)
+        limit: Resultados por página
+
+    Returns:
+        Página de resultados con progreso y cursor siguiente
+    """
+    try:
+        pagina = job_queue.resultados_parciales(job_id, despues_de=after, limite=limit)
+
+        if pagina is None:
+            raise HTTPException(status_code=404, detail=f"Trabajo {job_id} no encontrado")
+
+        return pagina
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error obteniendo resultados parciales del job {job_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/jobs")
 async def list_jobs(
     status: Optional[str] = Query(None, description="Filtrar por estado: pending, processing, completed, failed"),
@@ -229,6 +370,8 @@ async def queue_stats():
     """
     try:
         stats = job_queue.get_queue_stats()
+        stats["agentes"] = agent_budget.stats()
+        stats["browsers"] = browser_pool.stats()
         return stats
 
     except Exception as e:
@@ -236,6 +379,104 @@ async def queue_stats():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/circuitos")
+async def circuitos_stats():
+    """
+    Estado del circuit breaker de cada compañía en cada proceso que consulta
+
+    Con API_CONSUMIR_COLA=false las consultas las corren los workers: sus
+    circuitos llegan por el broker con la antigüedad de su último latido
+    (COORDINACION_INTERVALO_SEGUNDOS).
+
+    Returns:
+        Configuración, compañías con el circuito abierto o semi-abierto en
+        algún proceso y detalle por proceso y compañía
+    """
+    return circuit_breaker.stats_flota()
+
+
+@app.post("/circuitos/reset")
+async def reset_circuitos(compania: Optional[str] = Query(None, description="Compañía a cerrar (todas si se omite)")):
+    """
+    Cierra a mano el circuito de una compañía (ej: tras arreglar su script)
+
+    El reset se avisa por el broker: cada worker lo aplica en su próxima
+    sincronización (hasta COORDINACION_INTERVALO_SEGUNDOS).
+
+    Returns:
+        Estado de los circuitos al momento del aviso
+    """
+    await coordinador.avisar("circuito_reset", {"compania": compania})
+    return {
+        "mensaje": f"Circuito cerrado: {compania or 'todas las compañías'}",
+        "stats": circuit_breaker.stats_flota()
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    """
+    Expone las métricas de este proceso para Prometheus (texto u OpenMetrics
+    según el header Accept)
+
+    Returns:
+        Histogramas de espera en cola, duración de consultas por compañía,
+        latencia de BD por método y de callbacks, contadores de resultados y
+        los trabajos por estado de todo el broker (solo los exporta la API)
+    """
+    cuerpo, tipo = metricas.exponer(request.headers.get("accept"))
+    return Response(cuerpo, media_type=tipo)
+
+
+@app.get("/perfiles/agente")
+async def perfiles_agente(
+    dias: int = Query(7, ge=1, le=90, description="Días hacia atrás a considerar"),
+    compania: Optional[str] = Query(None, description="Filtrar por empresa"),
+    limite: int = Query(5000, ge=1, le=50000, description="Máximo de corridas a leer")
+):
+    """
+    Agrega los perfiles de corridas del agente por empresa
+
+    Muestra qué empresas gastan más pasos, tiempo y tokens, y por qué fallan,
+    para priorizar scripts determinísticos o ajustes de prompt.
+
+    Returns:
+        Resumen por empresa ordenado por pasos totales
+    """
+    try:
+        desde = datetime.now() - timedelta(days=dias)
+        filas = await db.get_perfiles_agente(desde, compania=compania, limit=limite)
+
+        return {
+            "desde": desde.isoformat(),
+            "corridas": len(filas),
+            "empresas": resumir_perfiles(filas)
+        }
+
+    except Exception as e:
+        logger.error(f"Error obteniendo perfiles del agente: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/perfiles/agente/limites")
+async def limites_agente_stats(refrescar: bool = Query(False, description="Recalcular desde el historial antes de responder")):
+    """
+    Límites del agente aprendidos por empresa (step_timeout, max_failures y
+    max_actions_per_step); las empresas sin historial suficiente usan los globales
+
+    Returns:
+        Configuración del cálculo, límites globales y límites por empresa
+    """
+    try:
+        if refrescar:
+            await limites_agente.refresh()
+        return limites_agente.stats()
+
+    except Exception as e:
+        logger.error(f"Error obteniendo límites del agente: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/historial/propiedad/{propiedad_id}")
 async def historial_propiedad(propiedad_id: int, limit: int = 10):
     """
@@ -249,7 +490,7 @@ async def historial_propiedad(propiedad_id: int, limit: int = 10):
         Historial de consultas
     """
     try:
-        historial = db.get_ultimas_consultas_propiedad(propiedad_id, limit)
+        historial = await db.get_ultimas_consultas_propiedad(propiedad_id, limit)
 
         return {
             "propiedad_id": propiedad_id,
@@ -274,7 +515,7 @@ async def listar_servicios_propiedad(propiedad_id: int):
         Lista de servicios
     """
     try:
-        servicios = db.get_servicios_propiedad(propiedad_id)
+        servicios = await db.get_servicios_propiedad(propiedad_id)
 
         return {
             "propiedad_id": propiedad_id,
@@ -287,6 +528,68 @@ async def listar_servicios_propiedad(propiedad_id: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/cache/empresas/stats")
+async def empresas_cache_stats():
+    """
+    Obtiene estadísticas del caché del catálogo de empresas
+
+    Returns:
+        Hits, misses y estado del catálogo
+    """
+    return empresa_catalog.stats()
+
+
+@app.post("/cache/empresas/invalidate")
+async def invalidar_cache_empresas(recargar: bool = Query(False, description="Recargar el catálogo inmediatamente")):
+    """
+    Invalida el caché del catálogo de empresas (en la API y, por el broker, en los workers)
+
+    Args:
+        recargar: Si es True, recarga el catálogo en la misma llamada
+
+    Returns:
+        Estadísticas del caché después de invalidar
+    """
+    try:
+        # Se aplica acá y, por el broker, en cada worker en su próxima sincronización
+        await coordinador.avisar("cache_empresas", {"recargar": recargar})
+
+        return {
+            "mensaje": "Caché de empresas invalidado",
+            "stats": empresa_catalog.stats()
+        }
+
+    except Exception as e:
+        logger.error(f"Error invalidando caché de empresas: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/cache/consultas/stats")
+async def consultas_cache_stats():
+    """
+    Obtiene estadísticas del caché de consultas de deuda
+
+    Returns:
+        Hits en memoria/BD, consultas coalescidas y misses
+    """
+    return consulta_cache.stats()
+
+
+@app.post("/cache/consultas/invalidate")
+async def invalidar_cache_consultas():
+    """
+    Descarta las deudas cacheadas en memoria (en la API y, por el broker, en los workers)
+
+    Returns:
+        Estadísticas del caché después de invalidar
+    """
+    await coordinador.avisar("cache_consultas")
+    return {
+        "mensaje": "Caché de consultas invalidado",
+        "stats": consulta_cache.stats()
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     from config import settings
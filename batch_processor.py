@@ -2,10 +2,18 @@
 Procesador batch para consultar múltiples servicios
 """
 import asyncio
-from typing import List, Dict
+from typing import AsyncIterable, Callable, Iterable, List, Dict, Optional, Union
 from database import db
-from prompt_generator import PromptGenerator
+from config import settings
+from empresa_cache import empresa_catalog
+from consulta_writer import consulta_writer
+from rate_limiter import rate_limiter
+from agent_budget import agent_budget
+from consulta_cache import consulta_cache
+from circuit_breaker import circuit_breaker
 from agent_runner import AgentRunner
+import metricas
+import time
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -17,8 +25,25 @@ class BatchProcessor:
     Procesa múltiples consultas de deuda en batch
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        concurrencia: Optional[int] = None,
+        propietario: Optional[str] = None,
+        on_servicio: Optional[Callable[[Dict], None]] = None
+    ):
+        """
+        Args:
+            concurrencia: Máximo de servicios en paralelo dentro de un batch
+                (por defecto settings.BATCH_CONCURRENCIA)
+            propietario: Identificador (ej: job_id) con el que se piden cupos
+                del presupuesto global de agentes
+            on_servicio: Función llamada con el resultado de cada servicio
+                apenas termina (para informar progreso)
+        """
         self.agent_runner = AgentRunner()
+        self.concurrencia = concurrencia or settings.BATCH_CONCURRENCIA
+        self.propietario = propietario or f"batch-{id(self)}"
+        self.on_servicio = on_servicio
 
     async def procesar_servicio(self, servicio: Dict, agent_runner: AgentRunner = None) -> Dict:
         """
@@ -35,16 +60,17 @@ class BatchProcessor:
         runner = agent_runner if agent_runner else self.agent_runner
 
         try:
-            # Obtener información de la empresa
-            empresa_info = db.get_empresa_servicio(servicio["compania"])
+            # Obtener información de la empresa (desde el catálogo en memoria)
+            empresa_info = await empresa_catalog.get(servicio["compania"])
 
             if not empresa_info:
                 error_msg = f"Empresa no registrada: {servicio['compania']}"
                 logger.warning(f"No se encontró información para la empresa: {servicio['compania']}")
+                metricas.consultas.labels(compania=servicio["compania"], resultado="error").inc()
 
                 # Guardar error en BD
                 try:
-                    consulta_guardada = db.guardar_consulta_deuda(
+                    consulta_guardada = await consulta_writer.guardar(
                         servicio_id=servicio["servicio_id"],
                         propiedad_id=servicio["propiedad_id"],
                         monto_deuda=0,
@@ -67,24 +93,52 @@ class BatchProcessor:
                     "consulta_id": consulta_id
                 }
 
-            # Generar prompt
-            prompt = PromptGenerator.generate_prompt_from_servicio(servicio, empresa_info)
-
-            logger.info(f"Consultando servicio {servicio['servicio_id']} - {servicio['compania']}")
+            async def consultar() -> Dict:
+                # Respetar el límite de tasa del portal de la compañía
+                await rate_limiter.acquire(servicio["compania"], empresa_info)
+
+                logger.info(f"Consultando servicio {servicio['servicio_id']} - {servicio['compania']}")
+
+                # Ejecutar script o agente dentro del presupuesto global de browsers
+                async with agent_budget.lease(self.propietario):
+                    inicio = time.perf_counter()
+                    fuente = "error"
+                    try:
+                        resultado_consulta = await runner.consultar_servicio(servicio, empresa_info)
+                        fuente = resultado_consulta.get("fuente") or "desconocida"
+                        return resultado_consulta
+                    finally:
+                        metricas.agente_duracion.labels(compania=servicio["compania"], fuente=fuente).observe(
+                            time.perf_counter() - inicio
+                        )
+
+            # Reutilizar una consulta fresca o en curso de la misma compañía e identificador;
+            # si el portal de la compañía viene fallando, el circuito la rechaza sin correr el agente
+            resultado = await consulta_cache.obtener(
+                servicio["compania"],
+                servicio.get("credenciales", {}).get("identificador", ""),
+                lambda: circuit_breaker.ejecutar(servicio["compania"], consultar)
+            )
 
-            # Ejecutar agente
-            resultado = await runner.consultar_deuda(prompt)
+            metadata = {"empresa": servicio["compania"], "tipo": servicio["tipo_servicio"], "fuente": resultado.get("fuente")}
+            if resultado.get("consulta_origen"):
+                metadata["consulta_origen"] = resultado["consulta_origen"]
+            if resultado.get("perfil"):
+                metadata["perfil"] = resultado["perfil"]
 
             # Guardar en base de datos y capturar consulta_id
-            consulta_guardada = db.guardar_consulta_deuda(
+            consulta_guardada = await consulta_writer.guardar(
                 servicio_id=servicio["servicio_id"],
                 propiedad_id=servicio["propiedad_id"],
                 monto_deuda=resultado["deuda"],
-                metadata={"empresa": servicio["compania"], "tipo": servicio["tipo_servicio"]},
+                metadata=metadata,
                 error=resultado["error"]
             )
 
             logger.info(f"Servicio {servicio['servicio_id']}: Deuda = ${resultado['deuda']}, Consulta ID: {consulta_guardada.get('consulta_id')}")
+            metricas.consultas.labels(
+                compania=servicio["compania"], resultado="exito" if resultado["error"] is None else "error"
+            ).inc()
 
             return {
                 "servicio_id": servicio["servicio_id"],
@@ -99,10 +153,11 @@ class BatchProcessor:
 
         except Exception as e:
             logger.error(f"Error procesando servicio {servicio['servicio_id']}: {str(e)}")
+            metricas.consultas.labels(compania=servicio.get("compania"), resultado="error").inc()
 
             # Intentar guardar el error en base de datos
             try:
-                consulta_guardada = db.guardar_consulta_deuda(
+                consulta_guardada = await consulta_writer.guardar(
                     servicio_id=servicio["servicio_id"],
                     propiedad_id=servicio["propiedad_id"],
                     monto_deuda=0,
@@ -135,7 +190,7 @@ class BatchProcessor:
         Returns:
             Lista de resultados
         """
-        servicios = db.get_servicios_propiedad(propiedad_id)
+        servicios = await db.get_servicios_propiedad(propiedad_id)
 
         if not servicios:
             logger.warning(f"No se encontraron servicios para la propiedad {propiedad_id}")
@@ -143,55 +198,124 @@ class BatchProcessor:
 
         logger.info(f"Procesando {len(servicios)} servicios para propiedad {propiedad_id}")
 
-        # Procesar servicios secuencialmente para evitar sobrecarga
-        resultados = []
-        for servicio in servicios:
-            resultado = await self.procesar_servicio(servicio)
-            resultados.append(resultado)
-            # Pequeña pausa entre consultas para no saturar el servicio
-            await asyncio.sleep(2)
+        # Procesar en paralelo, respetando el límite de tasa de cada compañía
+        resultados: List[Optional[Dict]] = [None] * len(servicios)
+
+        def guardar_resultado(indice: int, resultado: Dict):
+            resultados[indice] = resultado
+
+        await self._procesar_concurrente(servicios, guardar_resultado)
 
         return resultados
 
-    async def procesar_todas_propiedades(self) -> Dict:
+    async def procesar_todas_propiedades(self, conservar_resultados: bool = True) -> Dict:
         """
         Procesa todas las propiedades con servicios activos
 
+        Los servicios se leen como stream paginado, así que el procesamiento
+        comienza con la primera página y la memoria no crece con el portafolio.
+
+        Args:
+            conservar_resultados: Si es False, 'resultados' solo incluye los
+                servicios fallidos (útil para corridas largas como el cron)
+
         Returns:
             Dict con resumen de resultados
         """
-        servicios = db.get_todas_propiedades_con_servicios()
+        logger.info("Iniciando procesamiento de servicios activos")
 
-        if not servicios:
-            logger.warning("No se encontraron servicios activos")
-            return {"total": 0, "exitosos": 0, "fallidos": 0, "resultados": []}
+        contadores = {"exitosos": 0}
+        resultados = []
 
-        logger.info(f"Iniciando procesamiento de {len(servicios)} servicios")
+        def registrar_resultado(indice: int, resultado: Dict):
+            if resultado["exito"]:
+                contadores["exitosos"] += 1
+            if conservar_resultados or not resultado["exito"]:
+                resultados.append(resultado)
 
-        resultados = []
-        for servicio in servicios:
-            resultado = await self.procesar_servicio(servicio)
-            resultados.append(resultado)
-            # Pausa entre consultas
-            await asyncio.sleep(2)
+        total = await self._procesar_concurrente(db.iter_servicios_activos(), registrar_resultado)
+        exitosos = contadores["exitosos"]
+        # Mantener el orden por servicio_id aunque terminen en otro orden
+        resultados.sort(key=lambda r: r["servicio_id"])
+
+        if total == 0:
+            logger.warning("No se encontraron servicios activos")
+            return {"total": 0, "exitosos": 0, "fallidos": 0, "resultados": []}
 
-        exitosos = sum(1 for r in resultados if r["exito"])
-        fallidos = len(resultados) - exitosos
+        fallidos = total - exitosos
 
         resumen = {
-            "total": len(resultados),
+            "total": total,
             "exitosos": exitosos,
             "fallidos": fallidos,
             "resultados": resultados
         }
 
-        logger.info(f"Procesamiento completado: {exitosos}/{len(resultados)} exitosos")
+        logger.info(f"Procesamiento completado: {exitosos}/{total} exitosos")
 
         return resumen
 
+    async def _procesar_concurrente(
+        self,
+        servicios: Union[Iterable[Dict], AsyncIterable[Dict]],
+        on_resultado: Callable[[int, Dict], None]
+    ) -> int:
+        """
+        Procesa servicios con un tope global de concurrencia
+
+        Los servicios se consumen a medida que hay cupo, así que un stream
+        paginado no se materializa completo en memoria. El ritmo por portal
+        lo controla el rate limiter de cada compañía (ver procesar_servicio).
+
+        Args:
+            servicios: Lista o iterador asíncrono de registros de servicios
+            on_resultado: Función llamada con (índice, resultado) al terminar cada servicio
+
+        Returns:
+            Cantidad de servicios procesados
+        """
+        semaforo = asyncio.Semaphore(self.concurrencia)
+        pendientes = set()
+        indice = 0
+
+        async def ejecutar(i: int, servicio: Dict):
+            try:
+                # Cada servicio concurrente necesita su propio browser
+                runner = AgentRunner()
+                try:
+                    resultado = await self.procesar_servicio(servicio, runner)
+                finally:
+                    await runner.close()
+                on_resultado(i, resultado)
+                if self.on_servicio:
+                    self.on_servicio(resultado)
+            finally:
+                semaforo.release()
+
+        async def como_async(items):
+            if hasattr(items, "__aiter__"):
+                async for item in items:
+                    yield item
+            else:
+                for item in items:
+                    yield item
+
+        try:
+            async for servicio in como_async(servicios):
+                await semaforo.acquire()
+                tarea = asyncio.create_task(ejecutar(indice, servicio))
+                pendientes.add(tarea)
+                tarea.add_done_callback(pendientes.discard)
+                indice += 1
+        finally:
+            if pendientes:
+                await asyncio.gather(*pendientes, return_exceptions=True)
+
+        return indice
+
     async def procesar_servicios_especificos(self, servicio_ids: List[int]) -> List[Dict]:
         """
-        Procesa una lista específica de servicios en paralelo
+        Procesa una lista específica de servicios en paralelo (acotado)
 
         Args:
             servicio_ids: Lista de IDs de servicios
@@ -199,22 +323,17 @@ class BatchProcessor:
         Returns:
             Lista de resultados
         """
-        servicios = db.get_servicios_por_ids(servicio_ids)
+        servicios = await db.get_servicios_por_ids(servicio_ids)
 
-        # Crear un AgentRunner independiente para cada servicio (paralelización real)
-        async def procesar_con_runner(servicio):
-            runner = AgentRunner()
-            try:
-                resultado = await self.procesar_servicio(servicio, runner)
-                return resultado
-            finally:
-                await runner.close()
+        # Fan-out acotado: el cupo de browsers lo reparte el presupuesto global
+        resultados: List[Optional[Dict]] = [None] * len(servicios)
 
-        # Procesar servicios en paralelo usando asyncio.gather
-        tareas = [procesar_con_runner(servicio) for servicio in servicios]
-        resultados = await asyncio.gather(*tareas)
+        def guardar_resultado(indice: int, resultado: Dict):
+            resultados[indice] = resultado
 
-        return list(resultados)
+        await self._procesar_concurrente(servicios, guardar_resultado)
+
+        return resultados
 
     async def close(self):
         """Cierra recursos"""
@@ -0,0 +1,835 @@
+"""
+Benchmark offline de la cola y el procesamiento de consultas de deuda
+
+Reemplaza Supabase por un cliente en memoria y el AgentRunner por un agente
+simulado con latencias y fallos configurables, así los cambios de cola y
+concurrencia se pueden medir en un notebook sin red. Escenarios:
+
+    batch   BatchProcessor.procesar_todas_propiedades sobre todo el portafolio
+    cola    trabajos encolados directo en JobQueue (propiedad y servicios)
+    api     clientes concurrentes contra la app FastAPI (POST + polling de /job)
+
+Y dos escenarios contra el portal simulado de servipag_mock.py (se levanta
+en un puerto local, o se usa --portal-url):
+
+    parseo  páginas del portal por HTTP, montos leídos con extraer_monto_de_texto
+    portal  extracción de punta a punta con browser local (ServipagScriptExtractor,
+            o AgentRunner con --portal-agente); requiere Chromium
+
+Reporta throughput, latencias p50/p95/p99 y memoria pico (tracemalloc y RSS);
+los escenarios del portal además reportan páginas por minuto y precisión.
+
+Uso:
+    python benchmark.py
+    python benchmark.py --escenarios cola api --propiedades 500 --agente-mediana 1.5
+    python benchmark.py --store sqlite --json resultados.json
+    python benchmark.py --escenarios parseo portal --portal-variante aleatoria --portal-tasa-error 0.05
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import resource
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+ESCENARIOS = ["batch", "cola", "api"]
+ESCENARIOS_PORTAL = ["parseo", "portal"]
+
+
+def percentil(valores: List[float], p: float) -> Optional[float]:
+    """Percentil por rango más cercano (p entre 0 y 1)"""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(p * len(ordenados)) - 1)]
+
+
+def resumir_latencias(valores: List[float]) -> Dict:
+    """Cantidad, promedio, p50/p95/p99 y máximo de una lista de latencias en segundos"""
+    if not valores:
+        return {"n": 0}
+    return {
+        "n": len(valores),
+        "promedio": round(sum(valores) / len(valores), 4),
+        "p50": round(percentil(valores, 0.50), 4),
+        "p95": round(percentil(valores, 0.95), 4),
+        "p99": round(percentil(valores, 0.99), 4),
+        "max": round(max(valores), 4)
+    }
+
+
+class SupabaseEnMemoria:
+    """
+    Reemplazo en memoria de SupabaseClient con la misma interfaz asíncrona
+
+    Genera un portafolio sintético (propiedades, servicios y empresas) y
+    simula la latencia de red de cada llamada, acotada por un pool del mismo
+    tamaño que DB_POOL_SIZE.
+    """
+
+    def __init__(
+        self,
+        propiedades: int,
+        servicios_por_propiedad: int,
+        empresas: int,
+        latencia_ms: float,
+        pool: int,
+        rate_por_minuto: float,
+        duplicados: float,
+        rng: random.Random
+    ):
+        """
+        Args:
+            propiedades: Cantidad de propiedades
+            servicios_por_propiedad: Servicios activos por propiedad
+            empresas: Cantidad de empresas de servicio
+            latencia_ms: Latencia simulada de cada llamada
+            pool: Llamadas simultáneas máximas (como DB_POOL_SIZE)
+            rate_por_minuto: Límite por compañía de cada empresa (rate_limit_por_minuto)
+            duplicados: Fracción de servicios que comparten identificador con otro
+            rng: Generador aleatorio con semilla
+        """
+        self.latencia = latencia_ms / 1000
+        self._pool = asyncio.Semaphore(pool)
+        self.llamadas = 0
+
+        self.empresas = [
+            {
+                "empresa_id": i,
+                "nombre": f"Empresa {i}",
+                "tipo_servicio": ("Agua", "Luz", "Gas")[i % 3],
+                "url_servipag": f"https://portal.servipag.com/paymentexpress/category/servicios/company/empresa-{i}",
+                "campo_identificador": "Número de Cliente",
+                "activo": True,
+                "rate_limit_por_minuto": rate_por_minuto,
+                "rate_limit_rafaga": max(1, int(rate_por_minuto // 60))
+            }
+            for i in range(1, empresas + 1)
+        ]
+
+        self.servicios: Dict[int, Dict] = {}
+        servicio_id = 0
+        for propiedad_id in range(1, propiedades + 1):
+            for _ in range(servicios_por_propiedad):
+                servicio_id += 1
+                empresa = self.empresas[rng.randrange(empresas)]
+                identificador = str(rng.randint(1, servicio_id)) if servicio_id > 1 and rng.random() < duplicados else f"C{servicio_id}"
+                self.servicios[servicio_id] = {
+                    "servicio_id": servicio_id,
+                    "propiedad_id": propiedad_id,
+                    "tipo_servicio": empresa["tipo_servicio"],
+                    "compania": empresa["nombre"],
+                    "credenciales": {"identificador": identificador},
+                    "activo": True,
+                    "propiedades": {"propiedad_id": propiedad_id, "calle": "Calle", "numero": propiedad_id, "comuna": "Santiago"}
+                }
+
+        self.consultas: List[Dict] = []
+
+    async def _latencia(self):
+        self.llamadas += 1
+        async with self._pool:
+            await asyncio.sleep(self.latencia)
+
+    async def get_empresa_servicio(self, nombre_empresa: str) -> Optional[Dict]:
+        await self._latencia()
+        return next((e for e in self.empresas if e["nombre"] == nombre_empresa), None)
+
+    async def get_empresas_servicio(self) -> List[Dict]:
+        await self._latencia()
+        return list(self.empresas)
+
+    async def get_servicios_propiedad(self, propiedad_id: int) -> List[Dict]:
+        await self._latencia()
+        return [s for s in self.servicios.values() if s["propiedad_id"] == propiedad_id]
+
+    async def get_todas_propiedades_con_servicios(self) -> List[Dict]:
+        return [servicio async for servicio in self.iter_servicios_activos()]
+
+    async def iter_servicios_activos(self, page_size: Optional[int] = None):
+        from config import settings
+
+        page_size = page_size or settings.SERVICIOS_PAGE_SIZE
+        ids = sorted(self.servicios)
+        for inicio in range(0, len(ids), page_size):
+            await self._latencia()
+            for servicio_id in ids[inicio:inicio + page_size]:
+                yield self.servicios[servicio_id]
+
+    @staticmethod
+    def construir_consulta(
+        servicio_id: int,
+        propiedad_id: int,
+        monto_deuda: float,
+        metadata: Optional[Dict] = None,
+        error: Optional[str] = None
+    ) -> Dict:
+        return {
+            "servicio_id": servicio_id,
+            "propiedad_id": propiedad_id,
+            "monto_deuda": monto_deuda,
+            "fecha_consulta": datetime.now().isoformat(),
+            "metadata": metadata or {},
+            "error": error
+        }
+
+    async def guardar_consulta_deuda(self, servicio_id, propiedad_id, monto_deuda, metadata=None, error=None) -> Dict:
+        insertadas = await self.guardar_consultas_deuda(
+            [self.construir_consulta(servicio_id, propiedad_id, monto_deuda, metadata, error)]
+        )
+        return {"consulta_id": insertadas[0]["consulta_id"], "guardado": True}
+
+    async def guardar_consultas_deuda(self, filas: List[Dict]) -> List[Dict]:
+        await self._latencia()
+        insertadas = []
+        for fila in filas:
+            insertada = {**fila, "consulta_id": len(self.consultas) + 1}
+            self.consultas.append(insertada)
+            insertadas.append(insertada)
+        return insertadas
+
+    async def get_ultimas_consultas_propiedad(self, propiedad_id: int, limit: int = 10) -> List[Dict]:
+        await self._latencia()
+        filas = [c for c in self.consultas if c["propiedad_id"] == propiedad_id]
+        return sorted(filas, key=lambda c: c["fecha_consulta"], reverse=True)[:limit]
+
+    async def get_consulta_reciente(self, compania: str, identificador: str, desde: datetime) -> Optional[Dict]:
+        await self._latencia()
+        for consulta in reversed(self.consultas):
+            if consulta["fecha_consulta"] < desde.isoformat():
+                break
+            servicio = self.servicios.get(consulta["servicio_id"], {})
+            if (
+                consulta["error"] is None
+                and consulta["metadata"].get("fuente") != "cache"
+                and servicio.get("compania") == compania
+                and servicio.get("credenciales", {}).get("identificador") == identificador
+            ):
+                return consulta
+        return None
+
+    async def get_servicios_por_ids(self, servicio_ids: List[int]) -> List[Dict]:
+        await self._latencia()
+        return [self.servicios[i] for i in servicio_ids if i in self.servicios]
+
+    async def get_perfiles_agente(self, desde: datetime, compania: Optional[str] = None, limit: int = 5000) -> List[Dict]:
+        await self._latencia()
+        return []
+
+    def close(self):
+        pass
+
+
+class AgentRunnerSimulado:
+    """
+    Reemplazo de AgentRunner con latencia log-normal y fallos aleatorios
+
+    Una fracción de las consultas sale "por script" (rápidas) y el resto
+    "por agente"; no abre browsers ni llama al LLM.
+    """
+
+    config: Dict = {}
+    rng = random.Random(0)
+    latencias: List[float] = []
+
+    def __init__(self):
+        self.llm = None
+
+    @classmethod
+    def _duracion(cls, mediana: float) -> float:
+        return cls.rng.lognormvariate(math.log(mediana), cls.config["agente_sigma"])
+
+    async def consultar_servicio(self, servicio: Dict, empresa_info: Dict) -> Dict:
+        config = self.config
+        por_script = self.rng.random() < config["fraccion_script"]
+        duracion = self._duracion(config["script_mediana"] if por_script else config["agente_mediana"])
+        sorteo = self.rng.random()
+
+        inicio = time.perf_counter()
+        await asyncio.sleep(duracion)
+        self.latencias.append(time.perf_counter() - inicio)
+
+        if sorteo < config["tasa_excepcion"]:
+            raise RuntimeError("Fallo simulado del browser")
+        if sorteo < config["tasa_excepcion"] + config["tasa_fallo"]:
+            return {"deuda": 0, "error": "No se pudo obtener resultado del agente", "fuente": "agente"}
+        return {
+            "deuda": float(self.rng.randrange(0, 200000, 10)),
+            "error": None,
+            "fuente": "script" if por_script else "agente"
+        }
+
+    async def consultar_deuda(self, prompt: str) -> Dict:
+        return await self.consultar_servicio({}, {})
+
+    async def close(self):
+        pass
+
+
+class Medicion:
+    """Mide duración, memoria pico de Python (tracemalloc) y RSS de un escenario"""
+
+    def __enter__(self):
+        tracemalloc.reset_peak()
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.segundos = time.perf_counter() - self.inicio
+        self.memoria_pico_mb = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+        # ru_maxrss está en KB en Linux y en bytes en macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.rss_pico_mb = round(rss / 1024 / (1024 if sys.platform == "darwin" else 1), 2)
+        return False
+
+    def resumen(self) -> Dict:
+        return {
+            "segundos": round(self.segundos, 3),
+            "memoria_pico_mb": self.memoria_pico_mb,
+            "rss_pico_mb": self.rss_pico_mb
+        }
+
+
+class _TextoVisible(HTMLParser):
+    """Aproxima el innerText de una página: ignora script/style y separa bloques"""
+
+    BLOQUES = {"p", "div", "tr", "li", "h1", "h2", "h3", "section", "header", "footer", "table", "br", "form"}
+
+    def __init__(self):
+        super().__init__()
+        self.partes: List[str] = []
+        self._oculto = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self._oculto += 1
+        elif tag in self.BLOQUES:
+            self.partes.append("\n")
+        elif tag in ("td", "th"):
+            self.partes.append("\t")
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style"):
+            self._oculto -= 1
+        elif tag in self.BLOQUES:
+            self.partes.append("\n")
+
+    def handle_data(self, data):
+        if not self._oculto:
+            self.partes.append(data)
+
+
+def texto_visible(contenido_html: str) -> str:
+    """Texto visible de un HTML (sin browser)"""
+    parser = _TextoVisible()
+    parser.feed(contenido_html)
+    return "".join(parser.partes)
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _configurar_entorno(args):
+    """Ajusta Settings vía variables de entorno antes de importar los módulos del servicio"""
+    os.environ.setdefault("SUPABASE_URL", "https://benchmark.invalid")
+    os.environ.setdefault("SUPABASE_KEY", "benchmark")
+    os.environ["TRAZAS_HABILITADAS"] = "false"
+    os.environ["JOB_RESULTADOS_DIR"] = ""
+    os.environ["COLA_BROKER"] = args.store if args.store == "redis" else "sqlite"
+    os.environ["COLA_POLL_SEGUNDOS"] = str(args.poll_ms / 1000)
+
+    if args.store == "sqlite":
+        os.environ["JOB_STORE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="benchmark-"), "jobs.db")
+    elif args.store == "memoria":
+        os.environ["JOB_STORE_PATH"] = ""
+
+    opcionales = {
+        "JOB_MAX_WORKERS": args.workers,
+        "BATCH_CONCURRENCIA": args.concurrencia,
+        "MAX_AGENTES_CONCURRENTES": args.agentes,
+        "CONSULTA_FRESCURA_MINUTOS": args.frescura_minutos
+    }
+    for variable, valor in opcionales.items():
+        if valor is not None:
+            os.environ[variable] = str(valor)
+
+    if set(args.escenarios) & set(ESCENARIOS_PORTAL):
+        if args.portal_url:
+            os.environ["SERVIPAG_BASE_URL"] = args.portal_url
+        else:
+            # Portal simulado en este proceso; un browser en la nube no alcanza localhost
+            args.portal_puerto = _puerto_libre()
+            os.environ["SERVIPAG_BASE_URL"] = f"http://127.0.0.1:{args.portal_puerto}"
+            os.environ["BROWSER_USE_CLOUD"] = "false"
+
+
+async def escenario_batch(args, db_falsa) -> Dict:
+    """Procesa todo el portafolio con un BatchProcessor"""
+    from batch_processor import BatchProcessor
+
+    with Medicion() as medicion:
+        resumen = await BatchProcessor().procesar_todas_propiedades(conservar_resultados=False)
+
+    return {
+        **medicion.resumen(),
+        "servicios": resumen["total"],
+        "exitosos": resumen["exitosos"],
+        "servicios_por_segundo": round(resumen["total"] / medicion.segundos, 2)
+    }
+
+
+async def _esperar_job(job_queue, job_id: str):
+    async for evento in job_queue.seguir_job(job_id):
+        if evento and evento["tipo"] == "status" and evento["datos"]["status"] in ("completed", "failed"):
+            return evento["datos"]["status"]
+
+
+async def escenario_cola(args, db_falsa) -> Dict:
+    """Encola trabajos directo en JobQueue y espera a que terminen"""
+    from job_queue import job_queue
+
+    rng = random.Random(args.semilla + 1)
+    propiedades = sorted({s["propiedad_id"] for s in db_falsa.servicios.values()})
+    servicio_ids = sorted(db_falsa.servicios)
+    latencias = []
+    estados = {"completed": 0, "failed": 0}
+
+    async def ejecutar(i: int):
+        inicio = time.perf_counter()
+        if i % 4 == 3:
+            job_id = await job_queue.add_job("servicios", {"servicio_ids": rng.sample(servicio_ids, min(args.servicios_por_job, len(servicio_ids)))})
+        else:
+            job_id = await job_queue.add_job("propiedad", {"propiedad_id": rng.choice(propiedades)})
+        estado = await _esperar_job(job_queue, job_id)
+        latencias.append(time.perf_counter() - inicio)
+        estados[estado] += 1
+
+    with Medicion() as medicion:
+        await asyncio.gather(*(ejecutar(i) for i in range(args.jobs)))
+
+    return {
+        **medicion.resumen(),
+        "jobs": args.jobs,
+        **estados,
+        "jobs_por_segundo": round(args.jobs / medicion.segundos, 2),
+        "latencia_job": resumir_latencias(latencias)
+    }
+
+
+async def escenario_api(args, db_falsa) -> Dict:
+    """Clientes concurrentes que encolan por HTTP y consultan /job hasta el final"""
+    import httpx
+    from api import app
+
+    rng = random.Random(args.semilla + 2)
+    propiedades = sorted({s["propiedad_id"] for s in db_falsa.servicios.values()})
+    latencias_post, latencias_get, latencias_job = [], [], []
+
+    async def cliente(c: httpx.AsyncClient, n: int):
+        for _ in range(n):
+            inicio = time.perf_counter()
+            respuesta = await c.post("/consultar/propiedad", json={"propiedad_id": rng.choice(propiedades)})
+            latencias_post.append(time.perf_counter() - inicio)
+            job_id = respuesta.json()["job_id"]
+
+            while True:
+                inicio_get = time.perf_counter()
+                job = (await c.get(f"/job/{job_id}")).json()
+                latencias_get.append(time.perf_counter() - inicio_get)
+                if job["status"] in ("completed", "failed"):
+                    break
+                await asyncio.sleep(args.poll_ms / 1000)
+            latencias_job.append(time.perf_counter() - inicio)
+
+    por_cliente = max(1, args.jobs // args.clientes)
+    transporte = httpx.ASGITransport(app=app)
+    with Medicion() as medicion:
+        async with httpx.AsyncClient(transport=transporte, base_url="http://benchmark") as c:
+            await asyncio.gather(*(cliente(c, por_cliente) for _ in range(args.clientes)))
+
+    total = por_cliente * args.clientes
+    return {
+        **medicion.resumen(),
+        "jobs": total,
+        "requests": len(latencias_post) + len(latencias_get),
+        "jobs_por_segundo": round(total / medicion.segundos, 2),
+        "latencia_post": resumir_latencias(latencias_post),
+        "latencia_get_job": resumir_latencias(latencias_get),
+        "latencia_job": resumir_latencias(latencias_job)
+    }
+
+
+def _muestra_portal(args, db_falsa) -> List[Dict]:
+    """Servicios (con su empresa) a consultar en los escenarios del portal"""
+    rng = random.Random(args.semilla + 4)
+    empresas = {e["nombre"]: e for e in db_falsa.empresas}
+    servicios = list(db_falsa.servicios.values())
+    return [
+        {"servicio": servicio, "empresa": empresas[servicio["compania"]]}
+        for servicio in (rng.choice(servicios) for _ in range(args.portal_consultas))
+    ]
+
+
+async def _consultas_portal(args, db_falsa, consultar) -> Dict:
+    """
+    Ejecuta las consultas del portal con concurrencia acotada y mide precisión
+
+    Args:
+        consultar: Corrutina (servicio, empresa_info, url) -> monto leído
+    """
+    import httpx
+    from config import settings
+    from extractores import url_portal
+    from servipag_mock import slug_empresa
+
+    semaforo = asyncio.Semaphore(args.clientes)
+    resultados = {"correctos": 0, "incorrectos": 0, "sin_monto": 0, "errores": 0}
+    latencias = []
+    diferencias = []
+
+    async with httpx.AsyncClient(base_url=settings.SERVIPAG_BASE_URL, timeout=30) as portal:
+        async def ejecutar(item: Dict):
+            servicio, empresa = item["servicio"], item["empresa"]
+            url = url_portal(empresa)
+            identificador = servicio["credenciales"]["identificador"]
+            async with semaforo:
+                inicio = time.perf_counter()
+                try:
+                    monto = await consultar(servicio, empresa, url)
+                except Exception as e:
+                    logger.info(f"Consulta al portal falló ({url}): {str(e)}")
+                    resultados["errores"] += 1
+                    return
+                finally:
+                    latencias.append(time.perf_counter() - inicio)
+
+            esperado = (await portal.get(
+                "/__mock/esperado", params={"empresa": slug_empresa(url), "identificador": identificador}
+            )).json()["deuda"]
+            if monto is None:
+                resultados["sin_monto"] += 1
+            elif abs(monto - esperado) < 0.5:
+                resultados["correctos"] += 1
+            else:
+                resultados["incorrectos"] += 1
+                diferencias.append({"url": url, "identificador": identificador, "leido": monto, "esperado": esperado})
+
+        with Medicion() as medicion:
+            await asyncio.gather(*(ejecutar(item) for item in _muestra_portal(args, db_falsa)))
+
+    leidas = resultados["correctos"] + resultados["incorrectos"] + resultados["sin_monto"]
+    return {
+        **medicion.resumen(),
+        **resultados,
+        "consultas": args.portal_consultas,
+        "paginas_por_minuto": round(args.portal_consultas / medicion.segundos * 60, 1),
+        "precision": round(resultados["correctos"] / leidas, 4) if leidas else None,
+        "latencia_consulta": resumir_latencias(latencias),
+        "diferencias": diferencias[:20]
+    }
+
+
+async def escenario_parseo(args, db_falsa) -> Dict:
+    """Lee las páginas del portal por HTTP y parsea el monto como los scripts (sin browser)"""
+    import httpx
+    from extractores import extraer_monto_de_texto
+    from servipag_mock import VARIANTES, slug_empresa
+
+    rng = random.Random(args.semilla + 5)
+
+    async with httpx.AsyncClient(timeout=30) as cliente:
+        async def consultar(servicio: Dict, empresa: Dict, url: str) -> Optional[float]:
+            identificador = servicio["credenciales"]["identificador"]
+            # Con "aleatoria" la variante se fija por consulta para que formulario y
+            # resultado coincidan; "por_empresa" la resuelve el portal
+            variante = args.portal_variante if args.portal_variante in VARIANTES else None
+            if args.portal_variante == "aleatoria":
+                variante = rng.choice(VARIANTES)
+            params = {"variante": variante} if variante else {}
+
+            formulario = await cliente.get(url, params=params)
+            formulario.raise_for_status()
+            if 'method="get"' in formulario.text:
+                respuesta = await cliente.get(f"{url}/resultado", params={"identificador": identificador, **params})
+                respuesta.raise_for_status()
+                contenido = respuesta.text
+            else:
+                base = url.split("/paymentexpress/")[0]
+                respuesta = await cliente.get(f"{base}/paymentexpress/api/consulta", params={
+                    "empresa": slug_empresa(url), "identificador": identificador, **params
+                })
+                respuesta.raise_for_status()
+                contenido = respuesta.json()["html"]
+
+            return extraer_monto_de_texto(texto_visible(contenido), texto_visible(formulario.text))
+
+        return await _consultas_portal(args, db_falsa, consultar)
+
+
+async def escenario_portal(args, db_falsa) -> Dict:
+    """Extracción de punta a punta con browser local contra el portal simulado"""
+    from browser_pool import browser_pool
+    from config import settings
+    from extractores import ServipagScriptExtractor
+
+    extractor = ServipagScriptExtractor(timeout=settings.EXTRACTOR_TIMEOUT)
+
+    async def por_script(servicio: Dict, empresa: Dict, url: str) -> Optional[float]:
+        async with browser_pool.lease() as sesion:
+            return await extractor.extraer(sesion.browser, url, servicio["credenciales"]["identificador"], empresa)
+
+    async def por_agente(servicio: Dict, empresa: Dict, url: str) -> Optional[float]:
+        # El AgentRunner real (no el simulado): prompt con url_portal, browser del pool y LLM
+        from agent_runner import AgentRunner
+
+        resultado = await AgentRunner().consultar_servicio(servicio, empresa)
+        if resultado["error"]:
+            raise RuntimeError(resultado["error"])
+        return resultado["deuda"]
+
+    await browser_pool.start()
+    try:
+        return await _consultas_portal(args, db_falsa, por_agente if args.portal_agente else por_script)
+    finally:
+        await browser_pool.close()
+
+
+async def _levantar_portal(args):
+    """Levanta el portal simulado en este proceso (si no se pasó --portal-url)"""
+    import uvicorn
+    from servipag_mock import ConfigMock, crear_app
+
+    config = ConfigMock(
+        latencia_ms=args.portal_latencia_ms,
+        tasa_error=args.portal_tasa_error,
+        variante=args.portal_variante,
+        semilla=args.semilla
+    )
+    servidor = uvicorn.Server(uvicorn.Config(
+        crear_app(config), host="127.0.0.1", port=args.portal_puerto, log_level="warning"
+    ))
+    tarea = asyncio.create_task(servidor.serve())
+    while not servidor.started:
+        if tarea.done():
+            await tarea
+        await asyncio.sleep(0.05)
+    return servidor, tarea
+
+
+async def ejecutar_benchmark(args) -> Dict:
+    """Instala los reemplazos, corre los escenarios pedidos y arma el reporte"""
+    rng = random.Random(args.semilla)
+
+    # database debe importarse (y reemplazarse) antes que los módulos que hacen `from database import db`
+    import database
+    from config import settings
+
+    db_falsa = SupabaseEnMemoria(
+        propiedades=args.propiedades,
+        servicios_por_propiedad=args.servicios_por_propiedad,
+        empresas=args.empresas,
+        latencia_ms=args.db_latencia_ms,
+        pool=settings.DB_POOL_SIZE,
+        rate_por_minuto=args.rate_por_minuto,
+        duplicados=args.duplicados,
+        rng=rng
+    )
+    database.db = db_falsa
+
+    import batch_processor
+    AgentRunnerSimulado.config = vars(args)
+    AgentRunnerSimulado.rng = random.Random(args.semilla + 3)
+    batch_processor.AgentRunner = AgentRunnerSimulado
+
+    # Latencia de punta a punta de cada servicio (incluye rate limit, presupuesto y BD)
+    latencias_servicio = []
+    procesar_servicio = batch_processor.BatchProcessor.procesar_servicio
+
+    async def procesar_servicio_medido(self, servicio, agent_runner=None):
+        inicio = time.perf_counter()
+        try:
+            return await procesar_servicio(self, servicio, agent_runner)
+        finally:
+            latencias_servicio.append(time.perf_counter() - inicio)
+
+    batch_processor.BatchProcessor.procesar_servicio = procesar_servicio_medido
+
+    from job_queue import job_queue
+    from consulta_writer import consulta_writer
+
+    escenarios = {
+        "batch": escenario_batch,
+        "cola": escenario_cola,
+        "api": escenario_api,
+        "parseo": escenario_parseo,
+        "portal": escenario_portal
+    }
+    reporte = {
+        "config": {
+            **{k: v for k, v in vars(args).items() if k != "json"},
+            "job_max_workers": job_queue.max_workers,
+            "batch_concurrencia": settings.BATCH_CONCURRENCIA,
+            "max_agentes": settings.MAX_AGENTES_CONCURRENTES,
+            "servicios_total": len(db_falsa.servicios)
+        },
+        "escenarios": {}
+    }
+
+    portal = None
+    if set(args.escenarios) & set(ESCENARIOS_PORTAL) and not args.portal_url:
+        portal = await _levantar_portal(args)
+
+    tracemalloc.start()
+    await job_queue.start()
+    try:
+        for nombre in args.escenarios:
+            latencias_servicio.clear()
+            AgentRunnerSimulado.latencias.clear()
+            llamadas_db = db_falsa.llamadas
+
+            logger.info(f"Ejecutando escenario {nombre}")
+            resultado = await escenarios[nombre](args, db_falsa)
+            await consulta_writer.flush()
+
+            resultado["latencia_servicio"] = resumir_latencias(latencias_servicio)
+            resultado["latencia_agente"] = resumir_latencias(AgentRunnerSimulado.latencias)
+            resultado["llamadas_db"] = db_falsa.llamadas - llamadas_db
+            reporte["escenarios"][nombre] = resultado
+    finally:
+        await job_queue.close()
+        await consulta_writer.close()
+        tracemalloc.stop()
+        if portal:
+            servidor, tarea = portal
+            servidor.should_exit = True
+            await tarea
+
+    return reporte
+
+
+def imprimir_reporte(reporte: Dict):
+    """Muestra el reporte como tabla legible"""
+    config = reporte["config"]
+    print(
+        f"\nPortafolio: {config['servicios_total']} servicios, {config['empresas']} empresas | "
+        f"workers={config['job_max_workers']} concurrencia={config['batch_concurrencia']} "
+        f"agentes={config['max_agentes']} store={config['store']}"
+    )
+    print(
+        f"Agente simulado: mediana {config['agente_mediana']}s (script {config['script_mediana']}s, "
+        f"{config['fraccion_script']:.0%}), fallos {config['tasa_fallo']:.0%}, excepciones {config['tasa_excepcion']:.0%}\n"
+    )
+
+    for nombre, resultado in reporte["escenarios"].items():
+        throughput = {k: v for k, v in resultado.items() if k.endswith("_por_segundo")}
+        print(f"== {nombre} ==")
+        print(
+            f"  duración {resultado['segundos']}s"
+            + "".join(f" | {k.replace('_', ' ')} {v}" for k, v in throughput.items())
+            + f" | memoria pico {resultado['memoria_pico_mb']} MB (RSS {resultado['rss_pico_mb']} MB)"
+            + f" | llamadas BD {resultado['llamadas_db']}"
+        )
+        if "precision" in resultado:
+            print(
+                f"  {resultado['consultas']} consultas | {resultado['paginas_por_minuto']} páginas/min | "
+                f"precisión {resultado['precision']} | correctos {resultado['correctos']} "
+                f"incorrectos {resultado['incorrectos']} sin monto {resultado['sin_monto']} errores {resultado['errores']}"
+            )
+            for diferencia in resultado["diferencias"][:5]:
+                print(f"    leído {diferencia['leido']} esperado {diferencia['esperado']} en {diferencia['url']}")
+        for clave, valor in resultado.items():
+            if clave.startswith("latencia_") and valor.get("n"):
+                print(
+                    f"  {clave:<18} n={valor['n']:<6} p50={valor['p50']:.3f}s "
+                    f"p95={valor['p95']:.3f}s p99={valor['p99']:.3f}s max={valor['max']:.3f}s"
+                )
+        print()
+
+
+def parsear_argumentos(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark offline de cola, batch y API con Supabase en memoria y agente simulado")
+    parser.add_argument("--escenarios", nargs="+", choices=ESCENARIOS + ESCENARIOS_PORTAL, default=ESCENARIOS)
+    parser.add_argument("--store", choices=["memoria", "sqlite", "redis"], default="memoria",
+                        help="Cola solo en memoria, broker SQLite temporal o Redis (REDIS_URL)")
+
+    portafolio = parser.add_argument_group("portafolio sintético")
+    portafolio.add_argument("--propiedades", type=int, default=100)
+    portafolio.add_argument("--servicios-por-propiedad", type=int, default=3)
+    portafolio.add_argument("--empresas", type=int, default=8)
+    portafolio.add_argument("--duplicados", type=float, default=0.0,
+                            help="Fracción de servicios que comparten identificador (ejercita el caché)")
+    portafolio.add_argument("--rate-por-minuto", type=float, default=600,
+                            help="Límite por compañía (producción usa COMPANIA_RATE_POR_MINUTO=20)")
+    portafolio.add_argument("--db-latencia-ms", type=float, default=20)
+
+    agente = parser.add_argument_group("agente simulado")
+    agente.add_argument("--agente-mediana", type=float, default=2.0, help="Mediana de la consulta por agente (s)")
+    agente.add_argument("--script-mediana", type=float, default=0.3, help="Mediana de la consulta por script (s)")
+    agente.add_argument("--agente-sigma", type=float, default=0.5, help="Dispersión log-normal de las duraciones")
+    agente.add_argument("--fraccion-script", type=float, default=0.5)
+    agente.add_argument("--tasa-fallo", type=float, default=0.05, help="Fracción de consultas que terminan con error")
+    agente.add_argument("--tasa-excepcion", type=float, default=0.01, help="Fracción de consultas que lanzan excepción")
+
+    carga = parser.add_argument_group("carga")
+    carga.add_argument("--jobs", type=int, default=40, help="Trabajos de los escenarios cola y api")
+    carga.add_argument("--servicios-por-job", type=int, default=25, help="IDs por trabajo 'servicios' (escenario cola)")
+    carga.add_argument("--clientes", type=int, default=8, help="Clientes HTTP concurrentes (escenario api)")
+    carga.add_argument("--poll-ms", type=float, default=50, help="Intervalo de polling de /job y del broker")
+
+    portal = parser.add_argument_group("portal simulado (escenarios parseo y portal)")
+    portal.add_argument("--portal-url", help="Usar un servipag_mock.py ya levantado en vez de uno en este proceso")
+    portal.add_argument("--portal-consultas", type=int, default=40)
+    portal.add_argument("--portal-latencia-ms", type=float, default=300)
+    portal.add_argument("--portal-tasa-error", type=float, default=0.0)
+    portal.add_argument("--portal-variante", default="aleatoria",
+                        choices=["estandar", "clasica", "spa", "decimales", "aleatoria", "por_empresa"])
+    portal.add_argument("--portal-agente", action="store_true",
+                        help="Escenario portal con AgentRunner (LLM) en vez del script determinístico")
+
+    ajustes = parser.add_argument_group("ajustes (por defecto, los de Settings/.env)")
+    ajustes.add_argument("--workers", type=int, help="JOB_MAX_WORKERS")
+    ajustes.add_argument("--concurrencia", type=int, help="BATCH_CONCURRENCIA")
+    ajustes.add_argument("--agentes", type=int, help="MAX_AGENTES_CONCURRENTES")
+    ajustes.add_argument("--frescura-minutos", type=int, default=0,
+                         help="CONSULTA_FRESCURA_MINUTOS (0 por defecto: cada escenario consulta de verdad)")
+
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--json", help="Guardar el reporte completo en este archivo")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar los logs del servicio")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parsear_argumentos(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    _configurar_entorno(args)
+
+    reporte = asyncio.run(ejecutar_benchmark(args))
+    imprimir_reporte(reporte)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reporte, f, indent=2, ensure_ascii=False)
+        print(f"Reporte guardado en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
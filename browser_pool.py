@@ -0,0 +1,228 @@
+"""
+Pool de sesiones de browser (browser-use) pre-calentadas y reutilizables
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+from browser_use import Browser
+from config import settings
+import metricas
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SesionBrowser:
+    """Una sesión de browser del pool con su historial de uso"""
+
+    def __init__(self, browser: Browser):
+        self.browser = browser
+        self.usos = 0
+        self.error = False
+        self.creada_en = time.monotonic()
+        self.liberada_en = time.monotonic()
+
+    def marcar_error(self):
+        """Marca la sesión para reciclarla al devolverla al pool"""
+        self.error = True
+
+
+class BrowserPool:
+    """
+    Mantiene sesiones de browser abiertas (keep_alive) para que cada consulta
+    no pague el tiempo de arranque de una sesión nueva
+
+    Las sesiones se verifican antes de entregarse y se reciclan después de
+    `max_usos` consultas, si quedaron inactivas demasiado tiempo o si la
+    consulta que la usó terminó con error.
+    """
+
+    def __init__(self, min_size: int = 1, max_size: int = 10, max_usos: int = 20, max_inactividad: int = 300):
+        """
+        Args:
+            min_size: Sesiones que se mantienen calientes
+            max_size: Máximo de sesiones abiertas a la vez
+            max_usos: Consultas por sesión antes de reciclarla
+            max_inactividad: Segundos sin uso tras los cuales una sesión se descarta
+        """
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_usos = max_usos
+        self.max_inactividad = max_inactividad
+        self._libres: Deque[SesionBrowser] = deque()
+        self._total = 0
+        self._condicion = asyncio.Condition()
+        self._cerrado = False
+
+        # Métricas
+        self.leases = 0
+        self.creadas = 0
+        self.recicladas = 0
+        self.fallas_health_check = 0
+        self._esperas: Deque[float] = deque(maxlen=500)
+
+    async def _crear(self) -> SesionBrowser:
+        browser = Browser(use_cloud=settings.BROWSER_USE_CLOUD, keep_alive=True)
+        await browser.start()
+        self.creadas += 1
+        return SesionBrowser(browser)
+
+    async def _descartar(self, sesion: SesionBrowser):
+        try:
+            await sesion.browser.kill()
+        except Exception as e:
+            logger.warning(f"Error cerrando sesión de browser: {str(e)}")
+
+    async def _saludable(self, sesion: SesionBrowser) -> bool:
+        """Verifica que la sesión siga conectada y la deja en una página en blanco"""
+        if time.monotonic() - sesion.liberada_en > self.max_inactividad:
+            return False
+        try:
+            await asyncio.wait_for(sesion.browser.cdp_client.send.Browser.getVersion(), timeout=5)
+            await asyncio.wait_for(sesion.browser.navigate_to("about:blank"), timeout=10)
+            return True
+        except Exception as e:
+            logger.info(f"Sesión de browser no saludable, se recicla: {str(e)}")
+            return False
+
+    async def acquire(self) -> SesionBrowser:
+        """
+        Obtiene una sesión saludable del pool, creando una si hay cupo
+
+        Returns:
+            SesionBrowser lista para usar
+        """
+        inicio = time.monotonic()
+
+        while True:
+            async with self._condicion:
+                while not self._libres and self._total >= self.max_size:
+                    await self._condicion.wait()
+
+                if self._libres:
+                    sesion = self._libres.popleft()
+                    crear = False
+                else:
+                    self._total += 1
+                    crear = True
+
+            if crear:
+                try:
+                    sesion = await self._crear()
+                except Exception:
+                    await self._liberar_cupo()
+                    raise
+            elif not await self._saludable(sesion):
+                self.fallas_health_check += 1
+                await self._descartar(sesion)
+                await self._liberar_cupo()
+                continue
+
+            self.leases += 1
+            self._esperas.append(time.monotonic() - inicio)
+            return sesion
+
+    async def release(self, sesion: SesionBrowser):
+        """Devuelve una sesión al pool (o la recicla si corresponde)"""
+        sesion.usos += 1
+        sesion.liberada_en = time.monotonic()
+
+        if self._cerrado or sesion.error or sesion.usos >= self.max_usos:
+            self.recicladas += 1
+            await self._descartar(sesion)
+            await self._liberar_cupo()
+            if not self._cerrado:
+                asyncio.create_task(self._calentar())
+            return
+
+        async with self._condicion:
+            self._libres.append(sesion)
+            self._condicion.notify()
+
+    @asynccontextmanager
+    async def lease(self):
+        """
+        Context manager que entrega una sesión y la devuelve al terminar
+
+        Si el bloque lanza una excepción la sesión se recicla.
+        """
+        sesion = await self.acquire()
+        try:
+            yield sesion
+        except BaseException:
+            sesion.marcar_error()
+            raise
+        finally:
+            await self.release(sesion)
+
+    async def _liberar_cupo(self):
+        async with self._condicion:
+            self._total -= 1
+            self._condicion.notify()
+
+    async def _calentar(self):
+        """Crea sesiones hasta tener `min_size` disponibles"""
+        while not self._cerrado:
+            async with self._condicion:
+                if len(self._libres) >= self.min_size or self._total >= self.max_size:
+                    return
+                self._total += 1
+            try:
+                sesion = await self._crear()
+            except Exception as e:
+                logger.warning(f"No se pudo pre-calentar sesión de browser: {str(e)}")
+                await self._liberar_cupo()
+                return
+            async with self._condicion:
+                self._libres.append(sesion)
+                self._condicion.notify()
+
+    async def start(self):
+        """Pre-calienta las sesiones mínimas"""
+        self._cerrado = False
+        await self._calentar()
+        logger.info(f"BrowserPool iniciado ({len(self._libres)} sesiones calientes, máx {self.max_size})")
+
+    async def close(self):
+        """Cierra todas las sesiones libres; las que estén en uso se cierran al devolverse"""
+        self._cerrado = True
+        async with self._condicion:
+            libres, self._libres = list(self._libres), deque()
+            self._total -= len(libres)
+        for sesion in libres:
+            await self._descartar(sesion)
+
+    def stats(self) -> Dict:
+        """
+        Obtiene métricas del pool
+
+        Returns:
+            Diccionario con tamaño, uso y tiempos de espera de leases
+        """
+        esperas = sorted(self._esperas)
+        return {
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "abiertas": self._total,
+            "libres": len(self._libres),
+            "en_uso": self._total - len(self._libres),
+            "leases": self.leases,
+            "creadas": self.creadas,
+            "recicladas": self.recicladas,
+            "fallas_health_check": self.fallas_health_check,
+            "espera_promedio_segundos": round(sum(esperas) / len(esperas), 3) if esperas else None,
+            "espera_p95_segundos": round(esperas[min(len(esperas) - 1, int(len(esperas) * 0.95))], 3) if esperas else None,
+            "espera_max_segundos": round(esperas[-1], 3) if esperas else None
+        }
+
+
+# Singleton instance
+browser_pool = BrowserPool(
+    min_size=settings.BROWSER_POOL_MIN,
+    max_size=settings.BROWSER_POOL_MAX,
+    max_usos=settings.BROWSER_POOL_MAX_USOS,
+    max_inactividad=settings.BROWSER_POOL_MAX_INACTIVIDAD
+)
+metricas.metricas.al_exponer(lambda: metricas.browsers_en_uso.set(browser_pool.stats()["en_uso"]))
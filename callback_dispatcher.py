@@ -0,0 +1,239 @@
+"""
+Despacho asíncrono de callbacks con cliente HTTP compartido y reintentos persistentes
+"""
+import asyncio
+import random
+import time
+from typing import Callable, Dict, Optional
+from urllib.parse import urlparse
+import httpx
+from config import settings
+import metricas
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CallbackDispatcher:
+    """
+    Entrega los callbacks de los trabajos fuera de los workers de la cola
+
+    Usa un único httpx.AsyncClient con conexiones keep-alive, reintenta con
+    backoff exponencial con jitter y limita las entregas simultáneas por
+    destino (host), así un endpoint lento no acapara conexiones. Cada entrega
+    pendiente se persiste en el JobStore con un lease del consumidor que la
+    entrega, renovado mientras sigue viva: si el proceso muere, otro
+    consumidor la reclama cuando el lease vence y ninguna se entrega dos veces.
+    """
+
+    def __init__(
+        self,
+        store=None,
+        on_resultado: Optional[Callable[[str, bool, Optional[str]], None]] = None,
+        consumidor: Optional[str] = None,
+        lease: Optional[float] = None,
+        max_intentos: Optional[int] = None,
+        por_destino: Optional[int] = None,
+        timeout: Optional[float] = None,
+        backoff_base: Optional[float] = None,
+        backoff_max: Optional[float] = None
+    ):
+        """
+        Args:
+            store: JobStore donde persistir las entregas pendientes (None = solo en memoria)
+            on_resultado: Función llamada con (job_id, enviado, error) al terminar cada entrega
+            consumidor: Identificador de este proceso ante el store (dueño de sus entregas)
+            lease: Segundos de validez del reclamo de cada entrega si no se renueva
+            max_intentos: Intentos por callback antes de darlo por fallido
+            por_destino: Entregas simultáneas máximas por host
+            timeout: Timeout de cada POST en segundos
+            backoff_base: Espera base del backoff en segundos
+            backoff_max: Espera máxima entre intentos en segundos
+        """
+        self.store = store
+        self.on_resultado = on_resultado
+        self.consumidor = consumidor or "local"
+        self.lease = lease or settings.COLA_LEASE_SEGUNDOS
+        self.max_intentos = max_intentos or settings.CALLBACK_MAX_INTENTOS
+        self.por_destino = por_destino or settings.CALLBACK_POR_DESTINO
+        self.timeout = timeout or settings.CALLBACK_TIMEOUT
+        self.backoff_base = backoff_base or settings.CALLBACK_BACKOFF_BASE
+        self.backoff_max = backoff_max or settings.CALLBACK_BACKOFF_MAX
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaforos: Dict[str, asyncio.Semaphore] = {}
+        self._tareas: Dict[str, asyncio.Task] = {}
+        self._reclamos: Optional[asyncio.Task] = None
+        self._stats = {"enviados": 0, "fallidos": 0, "reintentos": 0}
+
+    def _cliente(self) -> httpx.AsyncClient:
+        """Cliente HTTP compartido (se crea al primer uso)"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+            )
+        return self._client
+
+    def _semaforo(self, url: str) -> asyncio.Semaphore:
+        """Semáforo de concurrencia del destino (host) de un callback"""
+        destino = urlparse(url).netloc
+        if destino not in self._semaforos:
+            self._semaforos[destino] = asyncio.Semaphore(self.por_destino)
+        return self._semaforos[destino]
+
+    async def start(self):
+        """
+        Reclama las entregas pendientes sin dueño (de antes de un reinicio o
+        de un consumidor caído) y mantiene vivos los leases de las propias
+        """
+        if not self.store or self._reclamos is not None:
+            return
+
+        self._reclamar()
+        self._reclamos = asyncio.create_task(self._mantener_reclamos())
+
+    def _reclamar(self):
+        """Programa las entregas que este proceso logra reclamar en el store"""
+        try:
+            reclamadas = self.store.reclamar_callbacks(self.consumidor, self.lease)
+        except Exception as e:
+            logger.error(f"Error reclamando callbacks pendientes: {str(e)}")
+            return
+
+        for entrada in reclamadas:
+            self._programar(
+                entrada["job_id"],
+                entrada["url"],
+                entrada["payload"],
+                entrada["intentos"],
+                entrada["proximo_intento"]
+            )
+
+        if reclamadas:
+            logger.info(f"CallbackDispatcher retoma {len(reclamadas)} callbacks pendientes")
+
+    async def _mantener_reclamos(self):
+        """Renueva los leases de las entregas en curso y reclama las que quedaron sin dueño"""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                self.store.renovar_callbacks(self.consumidor, list(self._tareas), self.lease)
+            except Exception as e:
+                logger.error(f"Error renovando leases de callbacks: {str(e)}")
+            self._reclamar()
+
+    def enviar(self, job_id: str, url: str, payload: Dict):
+        """
+        Encola la entrega de un callback y retorna de inmediato
+
+        Args:
+            job_id: ID del trabajo
+            url: URL del callback
+            payload: Cuerpo JSON a enviar
+        """
+        ahora = time.time()
+        self._persistir(job_id, url, payload, 0, ahora)
+        self._programar(job_id, url, payload, 0, ahora)
+
+    def _persistir(self, job_id: str, url: str, payload: Dict, intentos: int, proximo_intento: float):
+        """Guarda el estado de una entrega pendiente"""
+        if not self.store:
+            return
+        try:
+            self.store.guardar_callback(job_id, url, payload, intentos, proximo_intento, self.consumidor, self.lease)
+        except Exception as e:
+            logger.error(f"Error persistiendo callback del job {job_id}: {str(e)}")
+
+    def _programar(self, job_id: str, url: str, payload: Dict, intentos: int, proximo_intento: float):
+        """Crea la tarea de entrega (reemplaza una anterior del mismo trabajo)"""
+        anterior = self._tareas.get(job_id)
+        if anterior:
+            anterior.cancel()
+
+        tarea = asyncio.create_task(self._entregar(job_id, url, payload, intentos, proximo_intento))
+        self._tareas[job_id] = tarea
+        tarea.add_done_callback(
+            lambda t: self._tareas.pop(job_id, None) if self._tareas.get(job_id) is t else None
+        )
+
+    async def _entregar(self, job_id: str, url: str, payload: Dict, intentos: int, proximo_intento: float):
+        """
+        Envía un callback reintentando hasta agotar los intentos
+
+        La espera entre intentos no ocupa cupo del destino ni un worker.
+        """
+        espera = proximo_intento - time.time()
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+        while True:
+            intentos += 1
+            inicio = None
+            try:
+                async with self._semaforo(url):
+                    inicio = time.perf_counter()
+                    response = await self._cliente().post(url, json=payload)
+                    response.raise_for_status()
+                metricas.callback_latencia.labels(resultado="ok").observe(time.perf_counter() - inicio)
+
+                logger.info(f"Callback enviado exitosamente para job {job_id} a {url}")
+                self._stats["enviados"] += 1
+                metricas.callbacks.labels(resultado="enviado").inc()
+                self._terminar(job_id, True, None)
+                return
+
+            except Exception as e:
+                if inicio is not None:
+                    metricas.callback_latencia.labels(resultado="error").observe(time.perf_counter() - inicio)
+                logger.warning(f"Error enviando callback para job {job_id}: Intento {intentos}/{self.max_intentos} falló: {str(e)}")
+
+                if intentos >= self.max_intentos:
+                    logger.error(f"Callback falló definitivamente para job {job_id}: {str(e)}")
+                    self._stats["fallidos"] += 1
+                    metricas.callbacks.labels(resultado="fallido").inc()
+                    self._terminar(job_id, False, f"Falló después de {intentos} intentos: {str(e)}")
+                    return
+
+                # Backoff exponencial con jitter completo
+                espera = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (intentos - 1)))
+                self._stats["reintentos"] += 1
+                metricas.callback_reintentos.inc()
+                self._persistir(job_id, url, payload, intentos, time.time() + espera)
+                await asyncio.sleep(espera)
+
+    def _terminar(self, job_id: str, enviado: bool, error: Optional[str]):
+        """Quita la entrega del store y notifica el resultado"""
+        if self.store:
+            try:
+                self.store.eliminar_callback(job_id)
+            except Exception as e:
+                logger.error(f"Error eliminando callback del job {job_id}: {str(e)}")
+
+        if self.on_resultado:
+            self.on_resultado(job_id, enviado, error)
+
+    def stats(self) -> Dict:
+        """Entregas pendientes y totales enviados, fallidos y reintentados"""
+        return {"pendientes": len(self._tareas), **self._stats}
+
+    async def close(self):
+        """Detiene las entregas en curso (quedan persistidas) y cierra el cliente HTTP"""
+        tareas = list(self._tareas.values())
+        if self._reclamos is not None:
+            tareas.append(self._reclamos)
+            self._reclamos = None
+        if self.store and self._tareas:
+            # Vencer los leases propios para que otro consumidor retome las entregas de inmediato
+            try:
+                self.store.renovar_callbacks(self.consumidor, list(self._tareas), 0)
+            except Exception as e:
+                logger.error(f"Error liberando leases de callbacks: {str(e)}")
+
+        for tarea in tareas:
+            tarea.cancel()
+        if tareas:
+            await asyncio.gather(*tareas, return_exceptions=True)
+
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
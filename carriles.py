@@ -0,0 +1,132 @@
+"""
+Planificador de la cola por carriles de prioridad con capacidad reservada y envejecimiento
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Carriles en orden de prioridad base (menor = más prioritario)
+CARRILES = ["interactive", "batch", "background"]
+
+
+class PlanificadorCarriles:
+    """
+    Reparte los workers entre carriles de prioridad
+
+    - Cada carril tiene workers reservados: un carril solo puede usar un
+      worker libre si no invade la reserva no utilizada de los demás.
+    - Entre los carriles elegibles gana el de menor prioridad efectiva:
+      la prioridad base baja un nivel por cada `aging_segundos` que lleve
+      esperando el primer trabajo del carril, así nada espera para siempre.
+    """
+
+    def __init__(self, max_workers: int, reservas: Dict[str, int], aging_segundos: float = 300):
+        """
+        Args:
+            max_workers: Total de workers que consumen del planificador
+            reservas: Workers reservados por carril
+            aging_segundos: Segundos de espera que equivalen a subir un nivel de prioridad
+        """
+        self.max_workers = max_workers
+        self.reservas = {carril: reservas.get(carril, 0) for carril in CARRILES}
+        self.aging_segundos = aging_segundos
+        self._pendientes: Dict[str, Deque[Tuple[float, Any]]] = {carril: deque() for carril in CARRILES}
+        self._corriendo: Dict[str, int] = {carril: 0 for carril in CARRILES}
+        self._condicion = asyncio.Condition()
+
+        if sum(self.reservas.values()) > max_workers:
+            logger.warning(f"Las reservas de carriles ({self.reservas}) superan los {max_workers} workers")
+
+    def pendientes(self, carril: Optional[str] = None) -> int:
+        """Cantidad de trabajos esperando (en un carril o en total)"""
+        if carril:
+            return len(self._pendientes[carril])
+        return sum(len(cola) for cola in self._pendientes.values())
+
+    def libres(self, carril: Optional[str] = None) -> int:
+        """
+        Workers sin trabajo asignado ni esperando (capacidad para tomar más)
+
+        Con un carril: trabajos que ese carril podría empezar de inmediato
+        (su reserva sin usar o los workers libres que no son reserva de
+        otros carriles), descontando los que ya esperan en él. Así las
+        sub-tareas encoladas en un carril no impiden tomar trabajos de otro.
+        """
+        if carril is None:
+            return self.max_workers - sum(self._corriendo.values()) - self.pendientes()
+
+        libres = self.max_workers - sum(self._corriendo.values())
+        reserva_propia = max(0, self.reservas[carril] - self._corriendo[carril])
+        reserva_ajena = sum(
+            max(0, self.reservas[otro] - self._corriendo[otro])
+            for otro in CARRILES
+            if otro != carril
+        )
+        return min(libres, max(reserva_propia, libres - reserva_ajena)) - len(self._pendientes[carril])
+
+    async def put(self, carril: str, item: Any):
+        """Encola un trabajo en un carril"""
+        if carril not in self._pendientes:
+            raise ValueError(f"Carril no soportado: {carril}")
+        async with self._condicion:
+            self._pendientes[carril].append((time.monotonic(), item))
+            self._condicion.notify_all()
+
+    def _elegibles(self) -> List[str]:
+        libres = self.max_workers - sum(self._corriendo.values())
+        elegibles = []
+        for carril in CARRILES:
+            if not self._pendientes[carril] or libres <= 0:
+                continue
+            reserva_ajena = sum(
+                max(0, self.reservas[otro] - self._corriendo[otro])
+                for otro in CARRILES
+                if otro != carril
+            )
+            # Dentro de su propia reserva un carril siempre puede correr
+            if self._corriendo[carril] < self.reservas[carril] or libres - reserva_ajena > 0:
+                elegibles.append(carril)
+        return elegibles
+
+    def _prioridad_efectiva(self, carril: str, ahora: float) -> float:
+        encolado_en, _ = self._pendientes[carril][0]
+        return CARRILES.index(carril) - (ahora - encolado_en) / self.aging_segundos
+
+    async def get(self) -> Tuple[str, Any]:
+        """
+        Espera el siguiente trabajo que corresponde ejecutar
+
+        Returns:
+            Tupla (carril, item); llamar a task_done(carril) al terminarlo
+        """
+        async with self._condicion:
+            while True:
+                elegibles = self._elegibles()
+                if elegibles:
+                    ahora = time.monotonic()
+                    carril = min(elegibles, key=lambda c: self._prioridad_efectiva(c, ahora))
+                    _, item = self._pendientes[carril].popleft()
+                    self._corriendo[carril] += 1
+                    return carril, item
+                await self._condicion.wait()
+
+    async def task_done(self, carril: str):
+        """Libera el worker que ocupaba un trabajo del carril"""
+        async with self._condicion:
+            self._corriendo[carril] -= 1
+            self._condicion.notify_all()
+
+    def stats(self) -> Dict:
+        """Pendientes, en ejecución y reserva de cada carril"""
+        return {
+            carril: {
+                "pendientes": len(self._pendientes[carril]),
+                "corriendo": self._corriendo[carril],
+                "reservados": self.reservas[carril]
+            }
+            for carril in CARRILES
+        }
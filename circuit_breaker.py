@@ -0,0 +1,261 @@
+"""
+Circuit breaker por compañía para no gastar agentes en un portal caído
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional
+import httpx
+from config import settings
+from coordinacion import coordinador
+import metricas
+import logging
+
+logger = logging.getLogger(__name__)
+
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+SEMI_ABIERTO = "semi_abierto"
+
+# Valor del gauge deudas_circuito_estado por estado
+_VALOR_ESTADO = {CERRADO: 0, SEMI_ABIERTO: 1, ABIERTO: 2}
+
+# Fragmentos del mensaje de los errores de portal: navegación del browser
+# (Chromium/CDP), timeouts y conexiones rechazadas o cortadas
+MARCAS_PORTAL = (
+    "net::err_", "navigation", "navegación", "page.goto",
+    "timeout", "timed out", "connection refused", "connection reset"
+)
+
+
+def es_error_de_portal(mensaje: Optional[str]) -> bool:
+    """Indica si un mensaje de error (ej: el de un paso del agente) es de portal"""
+    mensaje = (mensaje or "").lower()
+    return any(marca in mensaje for marca in MARCAS_PORTAL)
+
+
+def es_falla_de_portal(excepcion: BaseException) -> bool:
+    """
+    Indica si una excepción muestra que el portal no respondió
+
+    Cuentan los timeouts, los errores HTTP y de conexión y los de navegación
+    del browser; un error de extracción o del identificador consultado no dice
+    nada de la salud del portal.
+    """
+    if isinstance(excepcion, (asyncio.TimeoutError, httpx.HTTPError, ConnectionError)):
+        return True
+    return es_error_de_portal(str(excepcion))
+
+
+class _Circuito:
+    def __init__(self):
+        self.estado = CERRADO
+        self.fallos_consecutivos = 0
+        self.abierto_en: Optional[float] = None
+        self.sondas_en_vuelo = 0
+        self.ultimo_error: Optional[str] = None
+        self.aperturas = 0
+        self.rechazadas = 0
+
+
+class CompaniaCircuitBreaker:
+    """
+    Mantiene un circuito por compañía
+
+    Tras `umbral_fallos` fallas de portal seguidas el circuito se abre y las
+    consultas de esa compañía se rechazan de inmediato con un error claro, sin
+    tomar cupo de agente ni browser. Pasado `enfriamiento_segundos` queda
+    semi-abierto: deja pasar hasta `sondas` consultas de prueba; si una
+    termina bien se cierra, si falla se vuelve a abrir. Solo cuentan las
+    fallas de portal (ver es_falla_de_portal); una consulta que falló por el
+    identificador o la extracción no mueve el circuito. Cada proceso que
+    consulta tiene sus propios circuitos; stats_flota() los junta desde el
+    broker y un reset se avisa a todos los procesos.
+    """
+
+    def __init__(self, umbral_fallos: int = 5, enfriamiento_segundos: float = 300, sondas: int = 1):
+        """
+        Args:
+            umbral_fallos: Fallas de portal consecutivas que abren el circuito
+            enfriamiento_segundos: Segundos abierto antes de permitir sondas
+            sondas: Consultas de prueba simultáneas mientras está semi-abierto
+        """
+        self.umbral_fallos = umbral_fallos
+        self.enfriamiento_segundos = enfriamiento_segundos
+        self.sondas = sondas
+        self._circuitos: Dict[str, _Circuito] = {}
+
+    def _circuito(self, compania: str) -> _Circuito:
+        if compania not in self._circuitos:
+            self._circuitos[compania] = _Circuito()
+        return self._circuitos[compania]
+
+    def _permitir(self, compania: str, circuito: _Circuito) -> Optional[bool]:
+        """
+        Decide si una consulta puede pasar
+
+        Returns:
+            False si pasa normalmente, True si pasa como sonda, None si se rechaza
+        """
+        if circuito.estado == ABIERTO and time.monotonic() - circuito.abierto_en >= self.enfriamiento_segundos:
+            circuito.estado = SEMI_ABIERTO
+            logger.info(f"Circuito de {compania} semi-abierto: probando si el portal se recuperó")
+
+        if circuito.estado == CERRADO:
+            return False
+        if circuito.estado == SEMI_ABIERTO and circuito.sondas_en_vuelo < self.sondas:
+            circuito.sondas_en_vuelo += 1
+            return True
+        return None
+
+    def _rechazo(self, compania: str, circuito: _Circuito) -> Dict:
+        circuito.rechazadas += 1
+        if circuito.estado == ABIERTO:
+            restante = max(0, self.enfriamiento_segundos - (time.monotonic() - circuito.abierto_en))
+            espera = f"próxima prueba en {restante:.0f}s"
+        else:
+            espera = "prueba de recuperación en curso"
+        error = (
+            f"Circuito abierto para {compania}: {circuito.fallos_consecutivos} fallas de portal seguidas "
+            f"({espera}). Último error: {circuito.ultimo_error}"
+        )
+        return {"deuda": 0, "error": error, "fuente": "circuito"}
+
+    def _registrar(self, compania: str, circuito: _Circuito, exito: bool, error: Optional[str]):
+        if exito:
+            if circuito.estado != CERRADO:
+                logger.info(f"Circuito de {compania} cerrado: el portal respondió")
+            circuito.estado = CERRADO
+            circuito.fallos_consecutivos = 0
+            circuito.abierto_en = None
+            return
+
+        circuito.fallos_consecutivos += 1
+        circuito.ultimo_error = error[:300] if error else None
+        # Una sonda fallida reabre de inmediato; cerrado, al llegar al umbral
+        if circuito.estado == SEMI_ABIERTO or (
+            circuito.estado == CERRADO and circuito.fallos_consecutivos >= self.umbral_fallos
+        ):
+            circuito.estado = ABIERTO
+            circuito.abierto_en = time.monotonic()
+            circuito.aperturas += 1
+            logger.warning(
+                f"Circuito de {compania} abierto tras {circuito.fallos_consecutivos} fallas de portal seguidas "
+                f"(reintento en {self.enfriamiento_segundos:.0f}s): {error}"
+            )
+
+    async def ejecutar(self, compania: str, consultar: Callable[[], Awaitable[Dict]]) -> Dict:
+        """
+        Ejecuta una consulta de la compañía si su circuito lo permite
+
+        Args:
+            compania: Nombre de la compañía (servicios.compania)
+            consultar: Función que consulta la deuda y retorna un dict con 'error'
+                y, si falló, 'falla_portal' (True si el portal no respondió)
+
+        Returns:
+            Resultado de la consulta, o {'deuda': 0, 'error': ..., 'fuente': 'circuito'}
+            si el circuito está abierto
+        """
+        if not settings.CIRCUITO_HABILITADO:
+            return await consultar()
+
+        circuito = self._circuito(compania)
+        sonda = self._permitir(compania, circuito)
+        if sonda is None:
+            return self._rechazo(compania, circuito)
+
+        try:
+            resultado = await consultar()
+        except asyncio.CancelledError:
+            # Una consulta cancelada no dice nada del portal
+            raise
+        except Exception as e:
+            if es_falla_de_portal(e):
+                self._registrar(compania, circuito, False, str(e) or type(e).__name__)
+            raise
+        else:
+            if resultado["error"] is None:
+                self._registrar(compania, circuito, True, None)
+            elif resultado.get("falla_portal"):
+                self._registrar(compania, circuito, False, resultado["error"])
+            return resultado
+        finally:
+            if sonda:
+                circuito.sondas_en_vuelo -= 1
+
+    def reset(self, compania: Optional[str] = None):
+        """
+        Cierra a mano el circuito de una compañía (o todos)
+
+        Args:
+            compania: Nombre de la compañía; None cierra todos
+        """
+        for nombre in [compania] if compania else list(self._circuitos):
+            if nombre in self._circuitos:
+                self._circuitos[nombre] = _Circuito()
+        logger.info(f"Circuito reiniciado: {compania or 'todas las compañías'}")
+
+    def actualizar_metricas(self):
+        """Actualiza el gauge de estado por compañía (recolector de /metrics)"""
+        for compania, circuito in self._circuitos.items():
+            metricas.circuito_estado.labels(compania=compania).set(_VALOR_ESTADO[circuito.estado])
+
+    def stats(self) -> Dict:
+        """Estado, fallos seguidos y rechazos del circuito de cada compañía"""
+        ahora = time.monotonic()
+        companias = {}
+        for compania, circuito in self._circuitos.items():
+            # Reflejar el paso a semi-abierto aunque no haya llegado otra consulta
+            estado = circuito.estado
+            if estado == ABIERTO and ahora - circuito.abierto_en >= self.enfriamiento_segundos:
+                estado = SEMI_ABIERTO
+            companias[compania] = {
+                "estado": estado,
+                "fallos_consecutivos": circuito.fallos_consecutivos,
+                "abierto_hace_segundos": round(ahora - circuito.abierto_en, 1) if circuito.abierto_en else None,
+                "proxima_sonda_segundos": (
+                    round(max(0, self.enfriamiento_segundos - (ahora - circuito.abierto_en)), 1)
+                    if circuito.abierto_en else None
+                ),
+                "sondas_en_vuelo": circuito.sondas_en_vuelo,
+                "aperturas": circuito.aperturas,
+                "rechazadas": circuito.rechazadas,
+                "ultimo_error": circuito.ultimo_error
+            }
+        return {
+            "habilitado": settings.CIRCUITO_HABILITADO,
+            "umbral_fallos": self.umbral_fallos,
+            "enfriamiento_segundos": self.enfriamiento_segundos,
+            "sondas": self.sondas,
+            "abiertos": [c for c, s in companias.items() if s["estado"] != CERRADO],
+            "companias": companias
+        }
+
+
+    def stats_flota(self) -> Dict:
+        """
+        Circuitos de todos los procesos que consultan (API y workers)
+
+        Con broker, cada proceso consumidor comparte sus circuitos en su
+        latido; sin broker, son los de este proceso.
+        """
+        procesos = coordinador.estados("circuitos")
+        return {
+            "habilitado": settings.CIRCUITO_HABILITADO,
+            "umbral_fallos": self.umbral_fallos,
+            "enfriamiento_segundos": self.enfriamiento_segundos,
+            "sondas": self.sondas,
+            "abiertos": sorted({compania for stats in procesos.values() for compania in stats["abiertos"]}),
+            "procesos": {consumidor: stats["companias"] for consumidor, stats in procesos.items()}
+        }
+
+
+# Singleton instance (compartido por todos los jobs del proceso)
+circuit_breaker = CompaniaCircuitBreaker(
+    umbral_fallos=settings.CIRCUITO_UMBRAL_FALLOS,
+    enfriamiento_segundos=settings.CIRCUITO_ENFRIAMIENTO_SEGUNDOS,
+    sondas=settings.CIRCUITO_SONDAS
+)
+metricas.metricas.al_exponer(circuit_breaker.actualizar_metricas)
+coordinador.compartir_estado("circuitos", circuit_breaker.stats)
+coordinador.al_avisar("circuito_reset", lambda datos: circuit_breaker.reset(datos.get("compania")))
@@ -0,0 +1,76 @@
+"""
+Índice de posiciones en cola (árbol de Fenwick) para consultas en O(log n)
+"""
+from typing import Dict, Hashable, List
+
+
+class IndicePosiciones:
+    """
+    Mantiene el orden de llegada de los elementos pendientes de una cola
+
+    Cada elemento recibe un número de secuencia; un árbol de Fenwick sobre
+    esas secuencias permite agregar, quitar y obtener la posición (1-based)
+    de cualquier elemento en O(log n), sin recorrer ni ordenar la cola.
+    """
+
+    def __init__(self, capacidad: int = 1024):
+        self._capacidad = capacidad
+        self._arbol: List[int] = [0] * (capacidad + 1)
+        self._secuencias: Dict[Hashable, int] = {}
+        self._siguiente = 1
+
+    def __len__(self) -> int:
+        return len(self._secuencias)
+
+    def __contains__(self, clave: Hashable) -> bool:
+        return clave in self._secuencias
+
+    def _actualizar(self, indice: int, delta: int):
+        while indice <= self._capacidad:
+            self._arbol[indice] += delta
+            indice += indice & -indice
+
+    def _prefijo(self, indice: int) -> int:
+        total = 0
+        while indice > 0:
+            total += self._arbol[indice]
+            indice -= indice & -indice
+        return total
+
+    def _reconstruir(self):
+        """Compacta las secuencias activas y, si hace falta, duplica la capacidad"""
+        activos = sorted(self._secuencias.items(), key=lambda item: item[1])
+        if len(activos) * 2 > self._capacidad:
+            self._capacidad *= 2
+
+        self._arbol = [0] * (self._capacidad + 1)
+        self._secuencias = {}
+        for nueva, (clave, _) in enumerate(activos, start=1):
+            self._secuencias[clave] = nueva
+            self._actualizar(nueva, 1)
+        self._siguiente = len(activos) + 1
+
+    def agregar(self, clave: Hashable):
+        """Agrega un elemento al final de la cola"""
+        if clave in self._secuencias:
+            return
+        if self._siguiente > self._capacidad:
+            self._reconstruir()
+        self._secuencias[clave] = self._siguiente
+        self._actualizar(self._siguiente, 1)
+        self._siguiente += 1
+
+    def quitar(self, clave: Hashable):
+        """Quita un elemento (sale de la cola o se elimina)"""
+        secuencia = self._secuencias.pop(clave, None)
+        if secuencia is not None:
+            self._actualizar(secuencia, -1)
+
+    def posicion(self, clave: Hashable) -> int:
+        """
+        Posición 1-based del elemento en la cola, o 0 si no está
+        """
+        secuencia = self._secuencias.get(clave)
+        if secuencia is None:
+            return 0
+        return self._prefijo(secuencia)
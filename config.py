@@ -2,7 +2,7 @@
 Configuración del sistema de consulta de deudas de servicios
 """
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
 
 
 class Settings(BaseSettings):
@@ -10,14 +10,138 @@ class Settings(BaseSettings):
     SUPABASE_URL: str
     SUPABASE_KEY: str
 
+    # Pool de threads para llamadas a Supabase (no bloquean el event loop)
+    DB_POOL_SIZE: int = 10
+
+    # Segundos que se mantiene en memoria el catálogo de empresas_servicio
+    EMPRESAS_CACHE_TTL: int = 300
+
+    # Escritura en lotes de consultas_deuda (group commit: las filas que llegan
+    # durante un insert salen juntas en el siguiente); FLUSH_SEGUNDOS > 0 agrega
+    # una espera para juntar más filas a costa de latencia por servicio
+    CONSULTAS_LOTE_MAX: int = 50
+    CONSULTAS_FLUSH_SEGUNDOS: float = 0.0
+
+    # Filas por página al recorrer todos los servicios activos
+    SERVICIOS_PAGE_SIZE: int = 500
+
+    # Minutos que una deuda consultada se reutiliza para la misma compañía e identificador (0 = desactivado)
+    CONSULTA_FRESCURA_MINUTOS: int = 30
+
+    # Concurrencia de batch y límites de tasa por compañía para toda la flota:
+    # cada proceso consumidor usa su parte según las réplicas vivas
+    # (empresas_servicio.rate_limit_por_minuto / rate_limit_rafaga tienen prioridad)
+    BATCH_CONCURRENCIA: int = 5
+    COMPANIA_RATE_POR_MINUTO: float = 20
+    COMPANIA_RATE_RAFAGA: int = 2
+
+    # Circuit breaker por compañía: tras UMBRAL_FALLOS consultas fallidas seguidas
+    # se rechazan sus consultas sin correr el agente; pasado el enfriamiento
+    # deja pasar SONDAS consultas de prueba para detectar que el portal volvió
+    CIRCUITO_HABILITADO: bool = True
+    CIRCUITO_UMBRAL_FALLOS: int = 5
+    CIRCUITO_ENFRIAMIENTO_SEGUNDOS: float = 300
+    CIRCUITO_SONDAS: int = 1
+
+    # Máximo de agentes/browsers simultáneos entre todos los procesos consumidores
+    # (cada uno usa su parte según las réplicas vivas; compartido entre jobs)
+    MAX_AGENTES_CONCURRENTES: int = 10
+
     # Browser-Use Cloud
     BROWSER_USE_CLOUD: bool = True
 
+    # Pool de sesiones de browser reutilizables
+    BROWSER_POOL_MIN: int = 1
+    BROWSER_POOL_MAX: int = 10
+    BROWSER_POOL_MAX_USOS: int = 20
+    BROWSER_POOL_MAX_INACTIVIDAD: int = 300
+
+    # Extractores determinísticos por empresa (fallback al agente LLM si fallan)
+    EXTRACTORES_HABILITADOS: bool = True
+    EXTRACTOR_TIMEOUT: float = 15.0
+    # Monto (CLP) sobre el cual la lectura de un script se descarta y se usa el agente
+    EXTRACTOR_MONTO_MAXIMO: float = 10_000_000
+    # Reemplaza esquema y host de url_servipag (ej: http://localhost:8100 para
+    # el portal simulado de servipag_mock.py); vacío = portal real
+    SERVIPAG_BASE_URL: str = ""
+
+    # Trazas de acciones del agente reproducibles sin LLM
+    TRAZAS_HABILITADAS: bool = True
+    TRAZAS_DIR: str = "trazas"
+    TRAZA_MAX_FALLOS: int = 3
+
     # Agent settings
     MAX_FAILURES: int = 3
     STEP_TIMEOUT: int = 30
     MAX_ACTIONS_PER_STEP: int = 5
 
+    # Límites del agente por empresa aprendidos de corridas exitosas: percentil
+    # de lo que necesitó cada corrida más un margen, con al menos MIN_CORRIDAS,
+    # recalculados cada TTL segundos y acotados a [mínimo, global × FACTOR_MAX]
+    # (empresas_servicio.agente_step_timeout / agente_max_failures /
+    # agente_max_acciones_paso tienen prioridad)
+    AGENTE_LIMITES_ADAPTATIVOS: bool = True
+    AGENTE_LIMITES_PERCENTIL: float = 0.95
+    AGENTE_LIMITES_MARGEN: float = 0.5
+    AGENTE_LIMITES_MIN_CORRIDAS: int = 10
+    AGENTE_LIMITES_DIAS: int = 14
+    AGENTE_LIMITES_TTL: int = 3600
+    AGENTE_LIMITES_STEP_TIMEOUT_MIN: int = 10
+    AGENTE_LIMITES_FACTOR_MAX: float = 3
+
+    # Archivo SQLite donde se persisten los trabajos de la cola ("" = solo memoria)
+    JOB_STORE_PATH: str = "data/jobs.db"
+
+    # Carriles de prioridad de la cola: workers reservados y envejecimiento
+    CARRIL_RESERVAS: Dict[str, int] = {"interactive": 1, "batch": 0, "background": 0}
+    CARRIL_AGING_SEGUNDOS: float = 300
+    # Trabajos "servicios" con más IDs que esto van al carril batch
+    CARRIL_BATCH_UMBRAL: int = 20
+
+    # Broker de la cola compartido por API y workers: "sqlite" (JOB_STORE_PATH)
+    # o "redis" (REDIS_URL, requiere uv sync --extra redis)
+    COLA_BROKER: str = "sqlite"
+    REDIS_URL: str = "redis://localhost:6379/0"
+    REDIS_PREFIJO: str = "deudas"
+    # Segundos de validez del reclamo de un trabajo (se renueva mientras corre)
+    # y cada cuánto un consumidor revisa si hay trabajos nuevos
+    COLA_LEASE_SEGUNDOS: float = 60
+    COLA_POLL_SEGUNDOS: float = 1.0
+    # False = la API solo encola y los trabajos los procesan procesos worker.py
+    API_CONSUMIR_COLA: bool = True
+    # Cada cuánto cada proceso deja su latido en el broker y lee los avisos de
+    # los demás (circuitos, réplicas consumidoras, invalidación de cachés)
+    COORDINACION_INTERVALO_SEGUNDOS: float = 5
+    # Segundos sin eventos tras los cuales el stream SSE envía un ping
+    SSE_PING_SEGUNDOS: float = 15
+    # Puerto donde worker.py expone /metrics para Prometheus (0 = deshabilitado;
+    # la API lo expone en su propio puerto)
+    WORKER_METRICS_PORT: int = 0
+
+    # Workers de la cola (cada sub-tarea de un trabajo masivo ocupa uno)
+    JOB_MAX_WORKERS: int = 6
+    # Trabajos "servicios" con más IDs que esto (y todo "todas") se reparten
+    # en sub-tareas por servicio; tope de sub-tareas encoladas por trabajo
+    SUBTAREAS_UMBRAL: int = 10
+    SUBTAREAS_EN_VUELO: int = 20
+
+    # Entrega de callbacks: intentos, backoff con jitter (segundos),
+    # entregas simultáneas por host y timeout de cada POST
+    CALLBACK_MAX_INTENTOS: int = 5
+    CALLBACK_BACKOFF_BASE: float = 1.0
+    CALLBACK_BACKOFF_MAX: float = 60.0
+    CALLBACK_POR_DESTINO: int = 4
+    CALLBACK_TIMEOUT: float = 30.0
+
+    # Retención de trabajos terminados (por antigüedad y cantidad) y tope de
+    # memoria para resultados; los grandes se guardan comprimidos en disco
+    JOB_RETENCION_HORAS: int = 24
+    JOB_RETENCION_MAX: int = 500
+    JOB_LIMPIEZA_INTERVALO: int = 600
+    JOB_RESULTADOS_DIR: str = "data/resultados"
+    JOB_RESULTADO_SPILL_KB: int = 256
+    JOB_RESULTADOS_MEMORIA_MB: int = 64
+
     # API settings
     API_HOST: str = "0.0.0.0"
     API_PORT: int = 8000
@@ -0,0 +1,169 @@
+"""
+Caché de frescura y single-flight para consultas de deuda idénticas
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from database import db
+from config import settings
+from coordinacion import coordinador
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ConsultaCache:
+    """
+    Evita consultar dos veces la misma deuda en poco tiempo
+
+    La llave es (compañía, identificador). Un resultado exitoso se reutiliza
+    mientras tenga menos de `frescura_minutos`, buscándolo primero en memoria
+    y luego en las filas recientes de consultas_deuda. Además, las consultas
+    concurrentes de la misma llave comparten una sola ejecución del agente.
+    """
+
+    def __init__(self, frescura_minutos: int = 30, max_entradas: int = 10000):
+        """
+        Args:
+            frescura_minutos: Antigüedad máxima de un resultado reutilizable (0 desactiva el caché)
+            max_entradas: Máximo de resultados guardados en memoria
+        """
+        self.frescura_minutos = frescura_minutos
+        self.max_entradas = max_entradas
+        self._recientes: "OrderedDict[Tuple[str, str], Tuple[float, Dict]]" = OrderedDict()
+        self._en_vuelo: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.hits_memoria = 0
+        self.hits_bd = 0
+        self.coalescidas = 0
+        self.misses = 0
+
+    def _vigente(self, momento: float) -> bool:
+        return time.time() - momento < self.frescura_minutos * 60
+
+    def _recordar(self, llave: Tuple[str, str], momento: float, resultado: Dict):
+        self._recientes[llave] = (momento, resultado)
+        self._recientes.move_to_end(llave)
+        while len(self._recientes) > self.max_entradas:
+            self._recientes.popitem(last=False)
+
+    def _desde_memoria(self, llave: Tuple[str, str]) -> Optional[Dict]:
+        entrada = self._recientes.get(llave)
+        if not entrada:
+            return None
+        momento, resultado = entrada
+        if not self._vigente(momento):
+            del self._recientes[llave]
+            return None
+        return resultado
+
+    async def _desde_bd(self, compania: str, identificador: str) -> Optional[Tuple[float, Dict]]:
+        desde = datetime.now() - timedelta(minutes=self.frescura_minutos)
+        fila = await db.get_consulta_reciente(compania, identificador, desde)
+        if not fila:
+            return None
+        momento = datetime.fromisoformat(fila["fecha_consulta"]).timestamp()
+        return momento, {
+            "deuda": float(fila["monto_deuda"]),
+            "error": None,
+            "consulta_origen": fila["consulta_id"]
+        }
+
+    async def obtener(
+        self,
+        compania: str,
+        identificador: str,
+        ejecutar: Callable[[], Awaitable[Dict]]
+    ) -> Dict:
+        """
+        Obtiene la deuda de (compañía, identificador) reutilizando resultados frescos
+
+        Args:
+            compania: Nombre de la compañía
+            identificador: Número de cliente/RUT
+            ejecutar: Función que consulta la deuda si no hay resultado reutilizable
+
+        Returns:
+            Dict con 'deuda', 'error' y 'fuente'; si vino del caché, 'fuente' es
+            "cache" y 'consulta_origen' indica la consulta original
+        """
+        if self.frescura_minutos <= 0 or not identificador:
+            return await ejecutar()
+
+        llave = (compania, identificador)
+
+        resultado = self._desde_memoria(llave)
+        if resultado:
+            self.hits_memoria += 1
+            return {**resultado, "fuente": "cache"}
+
+        en_vuelo = self._en_vuelo.get(llave)
+        if en_vuelo:
+            # Otra tarea ya está consultando esta misma deuda: compartir su resultado
+            self.coalescidas += 1
+            resultado = await asyncio.shield(en_vuelo)
+            # El perfil del agente pertenece solo a la consulta que lo corrió
+            resultado = {k: v for k, v in resultado.items() if k != "perfil"}
+            return {**resultado, "fuente": "cache"} if resultado["error"] is None else resultado
+
+        future = asyncio.get_running_loop().create_future()
+        self._en_vuelo[llave] = future
+
+        try:
+            try:
+                desde_bd = await self._desde_bd(compania, identificador)
+            except Exception as e:
+                logger.warning(f"No se pudo consultar el caché en BD para {compania}: {str(e)}")
+                desde_bd = None
+
+            if desde_bd:
+                self.hits_bd += 1
+                momento, resultado = desde_bd
+                self._recordar(llave, momento, resultado)
+                future.set_result(resultado)
+                return {**resultado, "fuente": "cache"}
+
+            self.misses += 1
+            resultado = await ejecutar()
+            if resultado["error"] is None:
+                self._recordar(llave, time.time(), {"deuda": resultado["deuda"], "error": None})
+            future.set_result(resultado)
+            return resultado
+
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                # Evitar el warning de "exception was never retrieved" si nadie esperaba
+                future.exception()
+            raise
+
+        finally:
+            self._en_vuelo.pop(llave, None)
+
+    def invalidate(self):
+        """Descarta los resultados guardados en memoria"""
+        self._recientes.clear()
+
+    def stats(self) -> Dict:
+        """
+        Obtiene estadísticas del caché
+
+        Returns:
+            Diccionario con hits (memoria/BD), consultas coalescidas y misses
+        """
+        return {
+            "frescura_minutos": self.frescura_minutos,
+            "entradas": len(self._recientes),
+            "en_vuelo": len(self._en_vuelo),
+            "hits_memoria": self.hits_memoria,
+            "hits_bd": self.hits_bd,
+            "coalescidas": self.coalescidas,
+            "misses": self.misses
+        }
+
+
+# Singleton instance
+consulta_cache = ConsultaCache(frescura_minutos=settings.CONSULTA_FRESCURA_MINUTOS)
+# POST /cache/consultas/invalidate llega a todos los procesos por el broker
+coordinador.al_avisar("cache_consultas", lambda datos: consulta_cache.invalidate())
@@ -0,0 +1,155 @@
+"""
+Escritura diferida (write-behind) de consultas de deuda en lotes
+"""
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+from database import db
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ConsultaWriter:
+    """
+    Acumula filas de consultas_deuda y las inserta en lotes multi-fila
+
+    Funciona como group commit: si no hay un insert en curso, la fila se
+    escribe de inmediato; las que llegan mientras un insert está en curso
+    se juntan y salen en el siguiente lote. Así un servicio no retiene su
+    cupo de agente esperando un intervalo fijo y, con carga, los inserts
+    siguen siendo multi-fila.
+    """
+
+    def __init__(self, max_lote: int = 50, intervalo_segundos: float = 0.0):
+        """
+        Args:
+            max_lote: Filas máximas por insert (llegar a este tamaño dispara un flush inmediato)
+            intervalo_segundos: Espera opcional antes de escribir para juntar más
+                filas (0 = escribir apenas el writer está libre)
+        """
+        self.max_lote = max_lote
+        self.intervalo_segundos = intervalo_segundos
+        self._buffer: List[Tuple[Dict, asyncio.Future]] = []
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        # Referencias a los flush lanzados en segundo plano (el loop solo guarda referencias débiles)
+        self._tareas: Set[asyncio.Task] = set()
+        self._cerrado = False
+        self.filas_escritas = 0
+        self.lotes_escritos = 0
+
+    async def guardar(
+        self,
+        servicio_id: int,
+        propiedad_id: int,
+        monto_deuda: float,
+        metadata: Optional[Dict] = None,
+        error: Optional[str] = None
+    ) -> Dict:
+        """
+        Encola una consulta de deuda y espera a que su lote sea insertado
+
+        Misma firma y retorno que SupabaseClient.guardar_consulta_deuda.
+
+        Returns:
+            Dict con consulta_id y guardado status
+        """
+        if self._cerrado:
+            # Después del cierre se escribe directo para no perder filas
+            return await db.guardar_consulta_deuda(servicio_id, propiedad_id, monto_deuda, metadata, error)
+
+        data = db.construir_consulta(servicio_id, propiedad_id, monto_deuda, metadata, error)
+
+        future = asyncio.get_running_loop().create_future()
+        self._buffer.append((data, future))
+
+        if len(self._buffer) >= self.max_lote:
+            self._lanzar(self.flush())
+        else:
+            self._programar_flush()
+
+        return await future
+
+    def _lanzar(self, corrutina) -> asyncio.Task:
+        """Crea una tarea en segundo plano conservando su referencia hasta que termine"""
+        tarea = asyncio.create_task(corrutina)
+        self._tareas.add(tarea)
+        tarea.add_done_callback(self._tareas.discard)
+        return tarea
+
+    def _programar_flush(self):
+        """Inicia un flush si no hay uno programado o en curso (el que está en curso recoge la fila)"""
+        if self._flusher is None or self._flusher.done():
+            self._flusher = self._lanzar(self._flush_programado())
+
+    async def _flush_programado(self):
+        if self.intervalo_segundos > 0:
+            await asyncio.sleep(self.intervalo_segundos)
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Error en flush de consultas: {str(e)}")
+
+    async def flush(self):
+        """Inserta todas las filas pendientes del buffer"""
+        async with self._flush_lock:
+            while self._buffer:
+                lote, self._buffer = self._buffer[:self.max_lote], self._buffer[self.max_lote:]
+                await self._escribir_lote(lote)
+
+    async def _escribir_lote(self, lote: List[Tuple[Dict, asyncio.Future]]):
+        filas = [data for data, _ in lote]
+
+        try:
+            insertadas = await db.guardar_consultas_deuda(filas)
+        except Exception as e:
+            # Una fila inválida no debe perder el lote completo: reintentar una por una
+            logger.warning(f"Falló insert en lote de {len(filas)} consultas, reintentando individualmente: {str(e)}")
+            await self._escribir_individualmente(lote)
+            return
+
+        # El insert ya se hizo: aunque retorne otra cantidad de filas no se reintenta (duplicaría)
+        if len(insertadas) != len(filas):
+            logger.warning(f"Insert de {len(filas)} consultas retornó {len(insertadas)} filas; sin consulta_id para las faltantes")
+        for indice, (_, future) in enumerate(lote):
+            if not future.done():
+                fila = insertadas[indice] if indice < len(insertadas) else {}
+                future.set_result({"consulta_id": fila.get("consulta_id"), "guardado": True})
+
+        self.filas_escritas += len(filas)
+        self.lotes_escritos += 1
+        logger.info(f"Lote de {len(filas)} consultas guardado en BD")
+
+    async def _escribir_individualmente(self, lote: List[Tuple[Dict, asyncio.Future]]):
+        """Inserta cada fila de un lote fallido por separado"""
+        for data, future in lote:
+            try:
+                insertadas = await db.guardar_consultas_deuda([data])
+                self.filas_escritas += 1
+                if not future.done():
+                    future.set_result({
+                        "consulta_id": insertadas[0].get("consulta_id") if insertadas else None,
+                        "guardado": bool(insertadas)
+                    })
+            except Exception as row_error:
+                if not future.done():
+                    future.set_exception(row_error)
+
+    async def close(self):
+        """Escribe lo que quede en el buffer y espera los flush en curso"""
+        self._cerrado = True
+        if self._flusher and not self._flusher.done() and not self._flush_lock.locked():
+            # Solo está esperando el intervalo: el flush de abajo escribe sus filas
+            self._flusher.cancel()
+        await self.flush()
+        if self._tareas:
+            await asyncio.gather(*self._tareas, return_exceptions=True)
+        logger.info(f"ConsultaWriter cerrado ({self.filas_escritas} filas en {self.lotes_escritos} lotes)")
+
+
+# Singleton instance
+consulta_writer = ConsultaWriter(
+    max_lote=settings.CONSULTAS_LOTE_MAX,
+    intervalo_segundos=settings.CONSULTAS_FLUSH_SEGUNDOS
+)
@@ -0,0 +1,168 @@
+"""
+Coordinación entre los procesos que comparten el broker (API y workers)
+
+Cada proceso consumidor deja en el broker un latido periódico con su estado
+(ej: sus circuitos por compañía) y todos leen los avisos que publican los
+demás (ej: cerrar un circuito o invalidar un caché). Sin broker, los avisos
+se aplican solo en este proceso y el único estado es el propio.
+"""
+import asyncio
+import inspect
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Coordinador:
+    """
+    Latidos, réplicas consumidoras y avisos entre procesos
+
+    Los módulos registran qué estado comparten (compartir_estado) y cómo
+    aplicar cada tipo de aviso (al_avisar), igual que los recolectores de
+    métricas. `replicas` es la cantidad de procesos consumidores vivos según
+    los latidos (al menos 1): los límites que valen para toda la flota se
+    reparten entre ellos.
+    """
+
+    def __init__(self, intervalo_segundos: float = 5):
+        """
+        Args:
+            intervalo_segundos: Cada cuánto se envía el latido y se leen los avisos
+        """
+        self.intervalo_segundos = intervalo_segundos
+        self.store = None
+        self.consumidor: Optional[str] = None
+        self.consume = False
+        self.replicas = 1
+        self._estados: Dict[str, Callable[[], Dict]] = {}
+        self._manejadores: Dict[str, List[Callable[[Dict], Union[None, Awaitable[None]]]]] = {}
+        self._al_cambiar_replicas: List[Callable[[], None]] = []
+        self._ultimo_aviso = 0
+        self._tarea: Optional[asyncio.Task] = None
+
+    def compartir_estado(self, clave: str, obtener: Callable[[], Dict]):
+        """Incluye `obtener()` bajo `clave` en el latido de este proceso"""
+        self._estados[clave] = obtener
+
+    def al_avisar(self, tipo: str, manejador: Callable[[Dict], Union[None, Awaitable[None]]]):
+        """Registra cómo aplicar en este proceso los avisos de un tipo"""
+        self._manejadores.setdefault(tipo, []).append(manejador)
+
+    def al_cambiar_replicas(self, funcion: Callable[[], None]):
+        """Registra una función a llamar cuando cambia la cantidad de réplicas"""
+        self._al_cambiar_replicas.append(funcion)
+
+    async def start(self, store, consumidor: str, consume: bool):
+        """
+        Conecta el proceso al broker y empieza a latir y leer avisos
+
+        Args:
+            store: Broker compartido (None = proceso aislado)
+            consumidor: Identificador de este proceso ante el broker
+            consume: True si el proceso procesa trabajos (cuenta como réplica)
+        """
+        self.store = store
+        self.consumidor = consumidor
+        self.consume = consume
+        if not store or self._tarea:
+            return
+
+        # Los avisos anteriores al arranque ya no aplican a este proceso
+        try:
+            self._ultimo_aviso = store.ultimo_aviso()
+        except Exception as e:
+            logger.error(f"Error leyendo avisos del broker: {str(e)}")
+        await self._sincronizar()
+        self._tarea = asyncio.create_task(self._latir())
+
+    async def _latir(self):
+        while True:
+            await asyncio.sleep(self.intervalo_segundos)
+            await self._sincronizar()
+
+    async def _sincronizar(self):
+        """Envía el latido, actualiza las réplicas y aplica los avisos nuevos"""
+        try:
+            if self.consume:
+                self.store.latido(self.consumidor, self._estado_propio(), self.intervalo_segundos * 3)
+                self._actualizar_replicas(len(self.store.consumidores()))
+            avisos = self.store.avisos(self._ultimo_aviso)
+        except Exception as e:
+            logger.error(f"Error sincronizando con el broker: {str(e)}")
+            return
+
+        for aviso in avisos:
+            self._ultimo_aviso = aviso["seq"]
+            # Quien publica un aviso ya lo aplicó al publicarlo
+            if aviso["datos"].get("origen") != self.consumidor:
+                await self._aplicar(aviso["tipo"], aviso["datos"])
+
+    def _actualizar_replicas(self, replicas: int):
+        replicas = max(1, replicas)
+        if replicas == self.replicas:
+            return
+        logger.info(f"Réplicas consumidoras: {self.replicas} -> {replicas}")
+        self.replicas = replicas
+        for funcion in self._al_cambiar_replicas:
+            funcion()
+
+    def _estado_propio(self) -> Dict:
+        return {clave: obtener() for clave, obtener in self._estados.items()}
+
+    async def _aplicar(self, tipo: str, datos: Dict):
+        for manejador in self._manejadores.get(tipo, []):
+            try:
+                resultado = manejador(datos)
+                if inspect.isawaitable(resultado):
+                    await resultado
+            except Exception as e:
+                logger.error(f"Error aplicando aviso {tipo}: {str(e)}")
+
+    async def avisar(self, tipo: str, datos: Optional[Dict] = None):
+        """
+        Aplica un aviso en este proceso y lo publica para los demás
+
+        Los otros procesos lo aplican en su próxima sincronización (hasta
+        `intervalo_segundos` después).
+        """
+        datos = datos or {}
+        await self._aplicar(tipo, datos)
+        if self.store:
+            self.store.publicar_aviso(tipo, {**datos, "origen": self.consumidor})
+
+    def estados(self, clave: str) -> Dict[str, Dict]:
+        """
+        Estado compartido bajo `clave` por cada proceso consumidor
+
+        Returns:
+            Dict consumidor -> estado; el de este proceso está al día y el
+            de los demás tiene la antigüedad de su último latido
+        """
+        estados = {}
+        if self.store:
+            estados = {
+                consumidor: estado[clave]
+                for consumidor, estado in self.store.consumidores().items()
+                if clave in estado
+            }
+        if (self.consume or not self.store) and clave in self._estados:
+            estados[self.consumidor or "local"] = self._estados[clave]()
+        return estados
+
+    async def close(self):
+        """Deja de latir y se da de baja del broker"""
+        if self._tarea:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+            self._tarea = None
+        if self.store and self.consume:
+            try:
+                self.store.quitar_consumidor(self.consumidor)
+            except Exception as e:
+                logger.error(f"Error dando de baja el consumidor: {str(e)}")
+
+
+# Singleton instance
+coordinador = Coordinador(intervalo_segundos=settings.COORDINACION_INTERVALO_SEGUNDOS)
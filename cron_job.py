@@ -4,6 +4,8 @@ Consulta todas las deudas de servicios periódicamente
 """
 import asyncio
 from batch_processor import BatchProcessor
+from consulta_writer import consulta_writer
+from browser_pool import browser_pool
 import logging
 from datetime import datetime
 
@@ -30,7 +32,8 @@ async def ejecutar_cron():
 
     try:
         processor = BatchProcessor()
-        resumen = await processor.procesar_todas_propiedades()
+        # Solo se conservan los fallidos: el resto ya quedó en consultas_deuda
+        resumen = await processor.procesar_todas_propiedades(conservar_resultados=False)
         await processor.close()
 
         logger.info("=" * 80)
@@ -55,6 +58,11 @@ async def ejecutar_cron():
         logger.error(f"Error crítico en cron job: {str(e)}", exc_info=True)
         raise
 
+    finally:
+        # Escribir las consultas que aún estén en el buffer antes de salir
+        await consulta_writer.close()
+        await browser_pool.close()
+
 
 if __name__ == "__main__":
     asyncio.run(ejecutar_cron())
@@ -3,46 +3,122 @@ Cliente de base de datos Supabase
 """
 from supabase import create_client, Client
 from config import settings
-from typing import List, Dict, Optional
+from typing import Any, AsyncIterator, Callable, List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import asyncio
+import time
+import metricas
 
 
 class SupabaseClient:
+    """
+    Capa de acceso a datos asíncrona sobre el cliente síncrono de Supabase.
+
+    Cada consulta se ejecuta en un pool de threads dedicado para no bloquear
+    el event loop. El cliente (y su pool de conexiones HTTP keep-alive) es
+    compartido por todos los threads del pool.
+    """
+
     def __init__(self):
         self.client: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.DB_POOL_SIZE,
+            thread_name_prefix="supabase"
+        )
+
+    async def _run(self, metodo: str, fn: Callable[[], Any]) -> Any:
+        """
+        Ejecuta una llamada bloqueante de Supabase en el pool de threads
 
-    def get_empresa_servicio(self, nombre_empresa: str) -> Optional[Dict]:
+        Args:
+            metodo: Nombre del método que hace la llamada (label de la métrica de latencia)
+            fn: Llamada bloqueante a ejecutar
+        """
+        loop = asyncio.get_running_loop()
+        inicio = time.perf_counter()
+        resultado = "error"
+        try:
+            respuesta = await loop.run_in_executor(self._executor, fn)
+            resultado = "ok"
+            return respuesta
+        finally:
+            metricas.db_latencia.labels(metodo=metodo, resultado=resultado).observe(time.perf_counter() - inicio)
+
+    async def get_empresa_servicio(self, nombre_empresa: str) -> Optional[Dict]:
         """Obtiene la información de una empresa de servicio por nombre"""
-        response = self.client.table("empresas_servicio").select("*").eq("nombre", nombre_empresa).eq("activo", True).execute()
+        response = await self._run(
+            "get_empresa_servicio",
+            lambda: self.client.table("empresas_servicio").select("*").eq("nombre", nombre_empresa).eq("activo", True).execute()
+        )
         return response.data[0] if response.data else None
 
-    def get_servicios_propiedad(self, propiedad_id: int) -> List[Dict]:
+    async def get_empresas_servicio(self) -> List[Dict]:
+        """Obtiene el catálogo completo de empresas de servicio activas"""
+        response = await self._run(
+            "get_empresas_servicio",
+            lambda: self.client.table("empresas_servicio").select("*").eq("activo", True).execute()
+        )
+        return response.data
+
+    async def get_servicios_propiedad(self, propiedad_id: int) -> List[Dict]:
         """Obtiene todos los servicios activos de una propiedad"""
-        response = self.client.table("servicios").select("*").eq("propiedad_id", propiedad_id).eq("activo", True).execute()
+        response = await self._run(
+            "get_servicios_propiedad",
+            lambda: self.client.table("servicios").select("*").eq("propiedad_id", propiedad_id).eq("activo", True).execute()
+        )
         return response.data
 
-    def get_todas_propiedades_con_servicios(self) -> List[Dict]:
+    async def get_todas_propiedades_con_servicios(self) -> List[Dict]:
         """Obtiene todas las propiedades que tienen servicios activos"""
-        response = self.client.table("servicios").select(
-            "servicio_id, propiedad_id, tipo_servicio, compania, credenciales, propiedades(propiedad_id, calle, numero, comuna)"
-        ).eq("activo", True).execute()
-        return response.data
+        return [servicio async for servicio in self.iter_servicios_activos()]
 
-    def guardar_consulta_deuda(
-        self,
+    async def iter_servicios_activos(self, page_size: Optional[int] = None) -> AsyncIterator[Dict]:
+        """
+        Itera todos los servicios activos (con su propiedad) página por página
+
+        Usa paginación por keyset sobre servicio_id, así que no depende del
+        límite de filas por defecto de PostgREST y solo mantiene una página
+        en memoria a la vez. Termina recién con una página vacía: PostgREST
+        puede devolver menos filas que page_size (max-rows del servidor) sin
+        que sea la última página.
+
+        Args:
+            page_size: Filas por página (por defecto settings.SERVICIOS_PAGE_SIZE)
+
+        Yields:
+            Registros de servicios en orden de servicio_id
+        """
+        page_size = page_size or settings.SERVICIOS_PAGE_SIZE
+        ultimo_id = 0
+
+        while True:
+            response = await self._run(
+                "iter_servicios_activos",
+                lambda desde=ultimo_id: self.client.table("servicios").select(
+                    "servicio_id, propiedad_id, tipo_servicio, compania, credenciales, propiedades(propiedad_id, calle, numero, comuna)"
+                ).eq("activo", True).gt("servicio_id", desde).order("servicio_id").limit(page_size).execute()
+            )
+            pagina = response.data or []
+
+            if not pagina:
+                break
+
+            for servicio in pagina:
+                yield servicio
+
+            ultimo_id = pagina[-1]["servicio_id"]
+
+    @staticmethod
+    def construir_consulta(
         servicio_id: int,
         propiedad_id: int,
         monto_deuda: float,
         metadata: Optional[Dict] = None,
         error: Optional[str] = None
     ) -> Dict:
-        """
-        Guarda el resultado de una consulta de deuda
-
-        Returns:
-            Dict con consulta_id y guardado status
-        """
-        data = {
+        """Arma la fila de consultas_deuda para un resultado de consulta"""
+        return {
             "servicio_id": servicio_id,
             "propiedad_id": propiedad_id,
             "monto_deuda": monto_deuda,
@@ -50,28 +126,109 @@ class SupabaseClient:
             "metadata": metadata or {},
             "error": error
         }
-        response = self.client.table("consultas_deuda").insert(data).execute()
+
+    async def guardar_consulta_deuda(
+        self,
+        servicio_id: int,
+        propiedad_id: int,
+        monto_deuda: float,
+        metadata: Optional[Dict] = None,
+        error: Optional[str] = None
+    ) -> Dict:
+        """
+        Guarda el resultado de una consulta de deuda
+
+        Returns:
+            Dict con consulta_id y guardado status
+        """
+        data = self.construir_consulta(servicio_id, propiedad_id, monto_deuda, metadata, error)
+        insertadas = await self.guardar_consultas_deuda([data])
 
         # Retornar el consulta_id generado
-        if response.data and len(response.data) > 0:
+        if insertadas:
             return {
-                "consulta_id": response.data[0].get("consulta_id"),
+                "consulta_id": insertadas[0].get("consulta_id"),
                 "guardado": True
             }
         return {"consulta_id": None, "guardado": False}
 
-    def get_ultimas_consultas_propiedad(self, propiedad_id: int, limit: int = 10) -> List[Dict]:
+    async def guardar_consultas_deuda(self, filas: List[Dict]) -> List[Dict]:
+        """
+        Inserta varias consultas de deuda en un solo request (insert multi-fila)
+
+        Returns:
+            Filas insertadas, en el mismo orden recibido
+        """
+        response = await self._run(
+            "guardar_consultas_deuda",
+            lambda: self.client.table("consultas_deuda").insert(filas).execute()
+        )
+        return response.data or []
+
+    async def get_ultimas_consultas_propiedad(self, propiedad_id: int, limit: int = 10) -> List[Dict]:
         """Obtiene las últimas consultas de deuda de una propiedad"""
-        response = self.client.table("consultas_deuda").select(
-            "*, servicios(tipo_servicio, compania)"
-        ).eq("propiedad_id", propiedad_id).order("fecha_consulta", desc=True).limit(limit).execute()
+        response = await self._run(
+            "get_ultimas_consultas_propiedad",
+            lambda: self.client.table("consultas_deuda").select(
+                "*, servicios(tipo_servicio, compania)"
+            ).eq("propiedad_id", propiedad_id).order("fecha_consulta", desc=True).limit(limit).execute()
+        )
         return response.data
 
-    def get_servicios_por_ids(self, servicio_ids: List[int]) -> List[Dict]:
+    async def get_consulta_reciente(self, compania: str, identificador: str, desde: datetime) -> Optional[Dict]:
+        """
+        Obtiene la consulta exitosa más reciente de una compañía e identificador
+
+        Solo considera consultas reales (no las servidas desde el caché) hechas
+        después de `desde`, de cualquier servicio con esas credenciales.
+        """
+        response = await self._run(
+            "get_consulta_reciente",
+            lambda: self.client.table("consultas_deuda").select(
+                "consulta_id, monto_deuda, fecha_consulta, servicios!inner(compania, credenciales)"
+            ).eq("servicios.compania", compania).eq(
+                "servicios.credenciales->>identificador", identificador
+            ).is_("error", "null").or_(
+                "metadata->>fuente.is.null,metadata->>fuente.neq.cache"
+            ).gte("fecha_consulta", desde.isoformat()).order("fecha_consulta", desc=True).limit(1).execute()
+        )
+        return response.data[0] if response.data else None
+
+    async def get_perfiles_agente(self, desde: datetime, compania: Optional[str] = None, limit: int = 5000) -> List[Dict]:
+        """
+        Obtiene los perfiles de corridas del agente guardados en metadata
+
+        Args:
+            desde: Solo consultas posteriores a esta fecha
+            compania: Filtrar por empresa (metadata.empresa)
+            limit: Máximo de consultas a leer (las más recientes)
+
+        Returns:
+            Filas con consulta_id, fecha_consulta, empresa y perfil
+        """
+        def consulta():
+            query = self.client.table("consultas_deuda").select(
+                "consulta_id, fecha_consulta, empresa:metadata->>empresa, perfil:metadata->perfil"
+            ).not_.is_("metadata->perfil", "null").gte("fecha_consulta", desde.isoformat())
+            if compania:
+                query = query.eq("metadata->>empresa", compania)
+            return query.order("fecha_consulta", desc=True).limit(limit).execute()
+
+        response = await self._run("get_perfiles_agente", consulta)
+        return response.data or []
+
+    async def get_servicios_por_ids(self, servicio_ids: List[int]) -> List[Dict]:
         """Obtiene información de servicios por sus IDs (solo activos)"""
-        response = self.client.table("servicios").select("*").in_("servicio_id", servicio_ids).eq("activo", True).execute()
+        response = await self._run(
+            "get_servicios_por_ids",
+            lambda: self.client.table("servicios").select("*").in_("servicio_id", servicio_ids).eq("activo", True).execute()
+        )
         return response.data
 
+    def close(self):
+        """Libera el pool de threads"""
+        self._executor.shutdown(wait=True)
+
 
 # Singleton instance
 db = SupabaseClient()
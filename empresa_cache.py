@@ -0,0 +1,106 @@
+"""
+Caché en memoria del catálogo de empresas de servicio (tabla empresas_servicio)
+"""
+import asyncio
+import time
+from typing import Dict, Optional
+from database import db
+from config import settings
+from coordinacion import coordinador
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class EmpresaCatalog:
+    """
+    Carga el catálogo completo de empresas activas en una sola consulta y lo
+    sirve desde memoria hasta que expire el TTL o se invalide explícitamente
+    """
+
+    def __init__(self, ttl_segundos: int = 300):
+        """
+        Args:
+            ttl_segundos: Segundos que el catálogo se considera vigente
+        """
+        self.ttl_segundos = ttl_segundos
+        self._empresas: Dict[str, Dict] = {}
+        self._cargado_en: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.recargas = 0
+
+    def _vigente(self) -> bool:
+        return self._cargado_en is not None and (time.monotonic() - self._cargado_en) < self.ttl_segundos
+
+    async def refresh(self):
+        """Recarga el catálogo completo desde la base de datos"""
+        async with self._lock:
+            await self._cargar()
+
+    async def _cargar(self):
+        empresas = await db.get_empresas_servicio()
+        self._empresas = {empresa["nombre"]: empresa for empresa in empresas}
+        self._cargado_en = time.monotonic()
+        self.recargas += 1
+        logger.info(f"Catálogo de empresas cargado: {len(self._empresas)} empresas activas")
+
+    async def get(self, nombre_empresa: str) -> Optional[Dict]:
+        """
+        Obtiene una empresa del catálogo, recargándolo si expiró
+
+        Args:
+            nombre_empresa: Valor de servicios.compania
+
+        Returns:
+            Registro de empresas_servicio o None si no existe o está inactiva
+        """
+        if self._vigente():
+            self.hits += 1
+        else:
+            self.misses += 1
+            async with self._lock:
+                # Otro llamador pudo haber recargado mientras esperábamos el lock
+                if not self._vigente():
+                    await self._cargar()
+
+        return self._empresas.get(nombre_empresa)
+
+    def invalidate(self):
+        """Marca el catálogo como expirado; la próxima consulta lo recarga"""
+        self._cargado_en = None
+        logger.info("Catálogo de empresas invalidado")
+
+    def stats(self) -> Dict:
+        """
+        Obtiene estadísticas del caché
+
+        Returns:
+            Diccionario con contadores de hits/misses y estado del catálogo
+        """
+        total = self.hits + self.misses
+        return {
+            "empresas": len(self._empresas),
+            "vigente": self._vigente(),
+            "ttl_segundos": self.ttl_segundos,
+            "edad_segundos": round(time.monotonic() - self._cargado_en, 1) if self._cargado_en else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+            "recargas": self.recargas
+        }
+
+
+# Singleton instance
+empresa_catalog = EmpresaCatalog(ttl_segundos=settings.EMPRESAS_CACHE_TTL)
+
+
+async def _al_invalidar(datos: Dict):
+    empresa_catalog.invalidate()
+    if datos.get("recargar"):
+        await empresa_catalog.refresh()
+
+
+# POST /cache/empresas/invalidate llega a todos los procesos por el broker
+coordinador.al_avisar("cache_empresas", _al_invalidar)
@@ -0,0 +1,310 @@
+"""
+Extractores determinísticos de deuda por empresa (sin LLM)
+
+Cada empresa de Servipag sigue el mismo flujo: ingresar el identificador,
+hacer clic en continuar y leer el monto. El script es opcional por empresa
+(columna script_extraccion, con selectores verificados contra su página):
+un selector que apunta al elemento equivocado devolvería un monto errado
+como éxito. El agente LLM se usa para empresas sin script y cuando el
+script falla o lee un monto no plausible.
+"""
+import asyncio
+import re
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ExtraccionError(Exception):
+    """El script no pudo obtener el monto (se hace fallback al agente)"""
+
+
+# Frases con las que Servipag indica que no hay nada que pagar
+FRASES_SIN_DEUDA = [
+    "no registra deuda",
+    "no registra deudas",
+    "no tiene deuda",
+    "no posee deuda",
+    "no presenta deuda",
+    "sin deuda",
+    "no existen documentos",
+    "no hay documentos",
+]
+
+# Monto de la deuda: con símbolo peso ("$ 4.713", "$500") o con separador de
+# miles ("4.713", "4.713,50"). Un número suelto ("2", "0") no es un monto: así
+# "Total documentos: 2" o "Saldo 0" no se confunden con la deuda.
+_MONTO = r"(?:\$\s*(?P<pesos>\d+(?:[.,]\d+)*)|(?P<miles>\d{1,3}(?:\.\d{3})+(?:,\d+)?)(?!\d|\.\d))"
+
+# Monto precedido por una etiqueta de total/deuda (ej: "Total a pagar: $ 4.713")
+PATRON_MONTO_ETIQUETADO = re.compile(
+    r"\b(?P<etiqueta>total\s+a\s+pagar|monto\s+a\s+pagar|deuda\s+total|total|monto|deuda|saldo)\b[^\d$]{0,40}" + _MONTO,
+    re.IGNORECASE
+)
+# Cualquier monto con símbolo peso (ej: "$4.713,50")
+PATRON_MONTO_PESOS = re.compile(r"\$\s*(?P<pesos>\d+(?:[.,]\d+)*)")
+
+# Etiquetas que nombran el monto a pagar; con ellas en la página, las demás
+# ("Total", "Saldo", "Deuda") suelen ser subtotales o saldos anteriores
+ETIQUETAS_PREFERIDAS = ("total a pagar", "monto a pagar", "deuda total")
+
+
+def url_portal(empresa_info: Dict) -> str:
+    """
+    URL de consulta de una empresa, apuntando al portal configurado
+
+    Con SERVIPAG_BASE_URL (ej: el mock local de servipag_mock.py) se conserva
+    la ruta /paymentexpress/... de empresas_servicio.url_servipag y se
+    reemplaza el esquema y el host.
+
+    Args:
+        empresa_info: Registro de empresas_servicio
+
+    Returns:
+        URL a la que deben navegar scripts y agente
+    """
+    url = empresa_info["url_servipag"]
+    if not settings.SERVIPAG_BASE_URL:
+        return url
+
+    original = urlsplit(url)
+    base = urlsplit(settings.SERVIPAG_BASE_URL)
+    return urlunsplit((base.scheme, base.netloc, base.path.rstrip("/") + original.path, original.query, original.fragment))
+
+
+def parsear_monto_clp(texto: str) -> float:
+    """
+    Convierte un monto en formato chileno a float
+
+    Ejemplos: "$ 4.713" -> 4713.0, "4.713,50" -> 4713.5, "$1.234.567" -> 1234567.0
+
+    Args:
+        texto: Monto con o sin símbolo de moneda
+
+    Returns:
+        Monto como float
+
+    Raises:
+        ValueError: Si el texto no contiene un monto
+    """
+    limpio = re.sub(r"[^\d.,]", "", texto or "")
+    if not limpio or not re.search(r"\d", limpio):
+        raise ValueError(f"Monto inválido: {texto!r}")
+
+    if "," in limpio:
+        # Punto como separador de miles, coma decimal
+        entero, _, decimal = limpio.rpartition(",")
+        return float(f"{entero.replace('.', '').replace(',', '')}.{decimal}")
+
+    partes = limpio.split(".")
+    if len(partes) > 1 and all(len(p) == 3 for p in partes[1:]):
+        # Solo separadores de miles
+        return float("".join(partes))
+
+    return float(limpio)
+
+
+def _montos(patron: re.Pattern, texto: str) -> List[tuple]:
+    """(etiqueta normalizada, monto) de cada coincidencia del patrón en el texto"""
+    montos = []
+    for coincidencia in patron.finditer(texto):
+        grupos = coincidencia.groupdict()
+        etiqueta = " ".join(grupos["etiqueta"].lower().split()) if grupos.get("etiqueta") else None
+        montos.append((etiqueta, parsear_monto_clp(grupos.get("pesos") or grupos.get("miles"))))
+    return montos
+
+
+def extraer_monto_de_texto(texto: str, texto_previo: str = "") -> Optional[float]:
+    """
+    Busca el monto de la deuda en el texto visible de la página
+
+    Primero se buscan montos etiquetados ("Total a pagar", "Deuda total",
+    "Total", ...), prefiriendo las etiquetas de ETIQUETAS_PREFERIDAS; si no
+    hay ninguno, cualquier monto con símbolo peso. Varios montos distintos
+    con el mismo nivel de preferencia son ambiguos.
+
+    Args:
+        texto: Texto de la página con el resultado
+        texto_previo: Texto de la página antes de consultar; lo que ya estaba
+            ahí (banners, montos de ejemplo) no se considera resultado
+
+    Returns:
+        Monto encontrado, 0 si la página indica que no hay deuda, o None
+
+    Raises:
+        ExtraccionError: Si la página muestra montos distintos que no se
+            pueden desambiguar
+    """
+    normalizado = " ".join((texto or "").split())
+    previo = " ".join((texto_previo or "").split())
+    minusculas, previo_minusculas = normalizado.lower(), previo.lower()
+
+    if any(frase in minusculas and frase not in previo_minusculas for frase in FRASES_SIN_DEUDA):
+        return 0.0
+
+    for patron in (PATRON_MONTO_ETIQUETADO, PATRON_MONTO_PESOS):
+        montos_previos = {monto for _, monto in _montos(patron, previo)}
+        montos = [(etiqueta, monto) for etiqueta, monto in _montos(patron, normalizado) if monto not in montos_previos]
+        if not montos:
+            continue
+
+        preferidos = [monto for etiqueta, monto in montos if etiqueta in ETIQUETAS_PREFERIDAS]
+        candidatos = set(preferidos) if preferidos else {monto for _, monto in montos}
+        if len(candidatos) > 1:
+            raise ExtraccionError(
+                f"Montos distintos en la página: {', '.join(f'{m:g}' for m in sorted(candidatos))}"
+            )
+        return candidatos.pop()
+
+    return None
+
+
+class Extractor:
+    """
+    Interfaz de un extractor de deuda
+
+    Un extractor puede automatizar la página directamente con el browser del
+    pool o consultar por HTTP (en cuyo caso ignora el browser).
+    """
+
+    async def extraer(self, browser, url: str, identificador: str, empresa_info: Dict) -> float:
+        """
+        Obtiene el monto de la deuda
+
+        Args:
+            browser: Sesión de browser-use prestada por el pool
+            url: URL de la empresa en Servipag
+            identificador: Número de cliente/RUT
+            empresa_info: Registro de empresas_servicio
+
+        Returns:
+            Monto de la deuda
+
+        Raises:
+            ExtraccionError: Si no se pudo obtener el monto
+        """
+        raise NotImplementedError
+
+
+class ServipagScriptExtractor(Extractor):
+    """
+    Script del flujo estándar de Servipag: ingresar identificador, continuar y
+    leer el monto, usando selectores CSS (configurables por empresa)
+    """
+
+    def __init__(
+        self,
+        selector_input: str = "input[type='text'], input[type='number'], input:not([type])",
+        selector_boton: str = "button[type='submit'], button",
+        selector_monto: Optional[str] = None,
+        timeout: float = 15.0,
+        monto_maximo: float = 10_000_000
+    ):
+        self.selector_input = selector_input
+        self.selector_boton = selector_boton
+        self.selector_monto = selector_monto
+        self.timeout = timeout
+        self.monto_maximo = monto_maximo
+
+    def _validar(self, monto: float, identificador: str) -> float:
+        """
+        Descarta montos que no pueden ser la deuda (el agente reintenta)
+
+        Raises:
+            ExtraccionError: Si el monto supera monto_maximo o es el propio
+                identificador (el selector leyó el eco del formulario)
+        """
+        if monto > self.monto_maximo:
+            raise ExtraccionError(f"Monto no plausible: {monto:g} supera {self.monto_maximo:g}")
+        digitos = re.sub(r"\D", "", identificador or "")
+        if monto and digitos and monto.is_integer() and str(int(monto)) == digitos.lstrip("0"):
+            raise ExtraccionError(f"Monto no plausible: {monto:g} es el identificador consultado")
+        return monto
+
+    async def _esperar_elementos(self, page, selector: str) -> List:
+        limite = asyncio.get_running_loop().time() + self.timeout
+        while True:
+            elementos = await page.get_elements_by_css_selector(selector)
+            if elementos:
+                return elementos
+            if asyncio.get_running_loop().time() > limite:
+                raise ExtraccionError(f"No se encontró el elemento '{selector}'")
+            await asyncio.sleep(0.25)
+
+    async def _leer_texto(self, page) -> str:
+        if self.selector_monto:
+            return await page.evaluate(
+                "(selector) => Array.from(document.querySelectorAll(selector)).map(e => e.innerText).join(' ')",
+                self.selector_monto
+            )
+        return await page.evaluate("() => document.body ? document.body.innerText : ''")
+
+    async def extraer(self, browser, url: str, identificador: str, empresa_info: Dict) -> float:
+        await browser.navigate_to(url)
+        page = await browser.must_get_current_page()
+
+        texto_inicial = await self._leer_texto(page)
+
+        campo = (await self._esperar_elementos(page, self.selector_input))[0]
+        await campo.fill(identificador)
+
+        boton = (await self._esperar_elementos(page, self.selector_boton))[0]
+        await boton.click()
+
+        # Esperar a que el contenido cambie y aparezca un monto o un "sin deuda"
+        limite = asyncio.get_running_loop().time() + self.timeout
+        while asyncio.get_running_loop().time() < limite:
+            await asyncio.sleep(0.5)
+            texto = await self._leer_texto(page)
+            if texto == texto_inicial:
+                continue
+            monto = extraer_monto_de_texto(texto, texto_inicial)
+            if monto is not None:
+                return self._validar(monto, identificador)
+
+        raise ExtraccionError(f"No se encontró el monto en la página de {empresa_info.get('nombre')}")
+
+
+# Registro de extractores por nombre de empresa (empresas_servicio.nombre)
+_REGISTRO: Dict[str, Extractor] = {}
+
+
+def registrar_extractor(nombre_empresa: str, extractor: Extractor):
+    """Registra el extractor a usar para una empresa"""
+    _REGISTRO[nombre_empresa] = extractor
+
+
+def obtener_extractor(empresa_info: Dict) -> Optional[Extractor]:
+    """
+    Obtiene el extractor de una empresa
+
+    Prioridad: extractor registrado en código, luego la columna opcional
+    `script_extraccion` (JSON con selectores) de empresas_servicio. Ninguna
+    empresa tiene script por defecto: se habilita por fila una vez
+    verificados sus selectores contra una página grabada.
+
+    Returns:
+        Extractor o None si la empresa debe consultarse con el agente
+    """
+    if not settings.EXTRACTORES_HABILITADOS:
+        return None
+
+    nombre = empresa_info.get("nombre")
+    if nombre in _REGISTRO:
+        return _REGISTRO[nombre]
+
+    config = empresa_info.get("script_extraccion")
+    if config:
+        return ServipagScriptExtractor(
+            selector_input=config.get("selector_input", "input[type='text'], input[type='number'], input:not([type])"),
+            selector_boton=config.get("selector_boton", "button[type='submit'], button"),
+            selector_monto=config.get("selector_monto"),
+            timeout=config.get("timeout", settings.EXTRACTOR_TIMEOUT),
+            monto_maximo=config.get("monto_maximo", settings.EXTRACTOR_MONTO_MAXIMO)
+        )
+
+    return None
+
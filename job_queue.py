@@ -2,11 +2,22 @@
 Sistema de cola de trabajos para procesar consultas de deuda de forma controlada
 """
 import asyncio
-from typing import Dict, Optional, List
+import json
+import os
+import socket
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Optional, List, Tuple
 from datetime import datetime
 import uuid
 import logging
-import httpx
+from config import settings
+from job_store import JobStore, ArchivoResultados, crear_job_store
+from cola_posiciones import IndicePosiciones
+from carriles import PlanificadorCarriles, CARRILES
+from callback_dispatcher import CallbackDispatcher
+from coordinacion import coordinador
+import metricas
 
 logger = logging.getLogger(__name__)
 
@@ -14,21 +25,392 @@ logger = logging.getLogger(__name__)
 class JobQueue:
     """
     Cola de trabajos para procesar consultas de deuda con control de concurrencia
+
+    Con un store (SQLite o Redis) la cola funciona como broker compartido: la
+    API publica trabajos y cualquier proceso consumidor (la propia API o
+    worker.py) los reclama cuando tiene workers libres. Sin store, todo vive
+    en memoria de este proceso.
     """
 
-    def __init__(self, max_workers: int = 3):
+    def __init__(
+        self,
+        max_workers: int = 3,
+        store: Optional[JobStore] = None,
+        resultados_dir: Optional[str] = None,
+        consumidor: Optional[str] = None
+    ):
         """
         Args:
             max_workers: Número máximo de trabajos procesándose simultáneamente
+            store: Store/broker de trabajos (None = solo en memoria)
+            resultados_dir: Carpeta donde volcar resultados grandes (None = siempre en memoria)
+            consumidor: Identificador de este proceso ante el broker (por defecto host-pid)
         """
-        self.queue = asyncio.Queue()
+        self.queue = PlanificadorCarriles(
+            max_workers=max_workers,
+            reservas=settings.CARRIL_RESERVAS,
+            aging_segundos=settings.CARRIL_AGING_SEGUNDOS
+        )
         self.max_workers = max_workers
         self.jobs: Dict[str, Dict] = {}
+        self.store = store
+        # Contadores por estado e índice de pendientes, mantenidos en cada transición
+        self._conteo_status: Dict[str, int] = {"pending": 0, "processing": 0, "completed": 0, "failed": 0}
+        self._pendientes: Dict[str, IndicePosiciones] = {carril: IndicePosiciones() for carril in CARRILES}
+        # Trabajos descompuestos: estado de sus sub-tareas y tarea coordinadora
+        self._subtareas: Dict[str, Dict] = {}
+        self._coordinadores: Dict[str, asyncio.Task] = {}
+        self.consumidor = consumidor or f"{socket.gethostname()}-{os.getpid()}"
+        self.callbacks = CallbackDispatcher(
+            store=store,
+            on_resultado=self._registrar_callback,
+            consumidor=self.consumidor,
+            lease=settings.COLA_LEASE_SEGUNDOS
+        )
+        # Resultados finales: los grandes o más antiguos se vuelcan a disco
+        self.archivo_resultados = ArchivoResultados(resultados_dir) if resultados_dir else None
+        self._resultados_en_memoria: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes_en_memoria = 0
+        self._limpieza: Optional[asyncio.Task] = None
+        # Eventos de progreso (en memoria si no hay store) y oyentes locales
+        self._eventos: Dict[str, List[Dict]] = {}
+        self._oyentes: Dict[str, set] = {}
+        # Consumo desde el broker compartido
+        self.consumir = True
+        self._hay_trabajo = asyncio.Event()
         self.workers_started = False
         self._workers = []
         logger.info(f"JobQueue inicializado con {max_workers} workers")
 
-    async def add_job(self, tipo: str, params: Dict, callback_url: Optional[str] = None, voucher_id: Optional[str] = None) -> str:
+    def _registrar_job(self, job: Dict):
+        """Incorpora un trabajo nuevo o rehidratado a los contadores"""
+        self.jobs[job["job_id"]] = job
+        self._conteo_status[job["status"]] = self._conteo_status.get(job["status"], 0) + 1
+        if job["status"] == "pending":
+            self._pendientes[job["carril"]].agregar(job["job_id"])
+
+    def _cambiar_status(self, job_id: str, status: str):
+        """Cambia el estado de un trabajo manteniendo contadores e índice de pendientes"""
+        job = self.jobs[job_id]
+        anterior = job["status"]
+        if anterior == status:
+            return
+
+        self._conteo_status[anterior] -= 1
+        self._conteo_status[status] = self._conteo_status.get(status, 0) + 1
+        job["status"] = status
+
+        if anterior == "pending":
+            self._pendientes[job["carril"]].quitar(job_id)
+        if status == "pending":
+            self._pendientes[job["carril"]].agregar(job_id)
+
+    def _olvidar_job(self, job_id: str):
+        """Quita un trabajo de memoria y de los contadores"""
+        job = self.jobs.pop(job_id)
+        self._conteo_status[job["status"]] -= 1
+        self._pendientes[job["carril"]].quitar(job_id)
+        self._bytes_en_memoria -= self._resultados_en_memoria.pop(job_id, 0)
+        self._eventos.pop(job_id, None)
+
+    def _eliminar_job(self, job_id: str):
+        """Elimina un trabajo de memoria, del store y su resultado en disco"""
+        job = self.jobs[job_id]
+        self._olvidar_job(job_id)
+        if self.store:
+            self.store.eliminar(job_id)
+        if job.get("resultado_archivo") and self.archivo_resultados:
+            self.archivo_resultados.eliminar(job["resultado_archivo"])
+
+    def _retener_resultado(self, job_id: str):
+        """
+        Contabiliza el resultado final de un trabajo dentro del tope de memoria
+
+        Los resultados sobre JOB_RESULTADO_SPILL_KB se vuelcan a disco de
+        inmediato; el resto queda en memoria hasta que el total supere
+        JOB_RESULTADOS_MEMORIA_MB, y entonces se vuelcan los más antiguos.
+        """
+        job = self.jobs[job_id]
+        if not self.archivo_resultados or job.get("resultado") is None:
+            return
+
+        contenido = json.dumps(job["resultado"], default=str)
+        if len(contenido) > settings.JOB_RESULTADO_SPILL_KB * 1024:
+            self._volcar_resultado(job_id, contenido)
+            return
+
+        self._resultados_en_memoria[job_id] = len(contenido)
+        self._bytes_en_memoria += len(contenido)
+
+        tope = settings.JOB_RESULTADOS_MEMORIA_MB * 1024 * 1024
+        while self._bytes_en_memoria > tope and self._resultados_en_memoria:
+            antiguo = next(iter(self._resultados_en_memoria))
+            self._volcar_resultado(antiguo)
+
+    def _volcar_resultado(self, job_id: str, contenido: Optional[str] = None):
+        """Mueve el resultado de un trabajo de memoria a un archivo comprimido"""
+        job = self.jobs[job_id]
+        self._bytes_en_memoria -= self._resultados_en_memoria.pop(job_id, 0)
+        try:
+            if contenido is None:
+                contenido = json.dumps(job["resultado"], default=str)
+            job["resultado_archivo"] = self.archivo_resultados.guardar(job_id, contenido)
+        except Exception as e:
+            logger.error(f"Error volcando resultado del job {job_id} a disco: {str(e)}")
+            return
+        job["resultado"] = None
+        self._persistir(job_id)
+
+    def _emitir(self, job_id: str, tipo: str, datos: Dict):
+        """
+        Registra un evento de progreso del trabajo y despierta a sus oyentes
+
+        Con broker el evento queda en el store, así que lo ven clientes
+        conectados a cualquier réplica de la API.
+
+        Args:
+            job_id: ID del trabajo
+            tipo: "status", "progreso" o "resultado"
+            datos: Contenido del evento
+        """
+        try:
+            if self.store:
+                self.store.agregar_evento(job_id, tipo, datos)
+            else:
+                eventos = self._eventos.setdefault(job_id, [])
+                eventos.append({"seq": len(eventos) + 1, "tipo": tipo, "datos": datos})
+        except Exception as e:
+            logger.error(f"Error registrando evento {tipo} del job {job_id}: {str(e)}")
+
+        for oyente in self._oyentes.get(job_id, ()):
+            oyente.set()
+
+    def _leer_eventos(
+        self,
+        job_id: str,
+        despues_de: int,
+        tipo: Optional[str] = None,
+        limite: Optional[int] = None
+    ) -> List[Dict]:
+        """Eventos de un trabajo posteriores a una secuencia (opcionalmente de un tipo)"""
+        if self.store:
+            return self.store.eventos(job_id, despues_de, tipo=tipo, limite=limite)
+
+        eventos = self._eventos.get(job_id, [])[despues_de:]
+        if tipo:
+            eventos = [evento for evento in eventos if evento["tipo"] == tipo]
+        return eventos[:limite] if limite is not None else eventos
+
+    def _registrar_resultado_servicio(self, job_id: str, resultado: Dict):
+        """
+        Suma al progreso del trabajo el resultado de un servicio recién consultado
+
+        El resultado queda disponible de inmediato en /job/{id}/resultados y
+        en el stream de eventos, sin esperar a que termine el trabajo.
+        """
+        job = self.jobs.get(job_id)
+        if not job:
+            return
+
+        job["progreso"]["completados"] += 1
+        if self.store:
+            # El progreso se lee desde el broker
+            self._persistir(job_id)
+        self._emitir(job_id, "resultado", {"resultado": resultado, "progreso": dict(job["progreso"])})
+
+    def resultados_parciales(self, job_id: str, despues_de: int = 0, limite: int = 100) -> Optional[Dict]:
+        """
+        Resultados por servicio de un trabajo, disponibles mientras aún corre
+
+        Args:
+            job_id: ID del trabajo
+            despues_de: Cursor devuelto por la página anterior (0 = desde el inicio)
+            limite: Cantidad máxima de resultados por página
+
+        Returns:
+            Página con resultados, cursor siguiente y progreso, o None si el
+            trabajo no existe
+        """
+        job = self.get_job_status(job_id)
+        if not job:
+            return None
+
+        eventos = self._leer_eventos(job_id, despues_de, tipo="resultado", limite=limite)
+        terminado = job["status"] in ("completed", "failed")
+
+        return {
+            "job_id": job_id,
+            "status": job["status"],
+            "progreso": job.get("progreso"),
+            "resultados": [evento["datos"]["resultado"] for evento in eventos],
+            "after": eventos[-1]["seq"] if eventos else despues_de,
+            "hay_mas": len(eventos) == limite or not terminado
+        }
+
+    async def seguir_job(self, job_id: str, despues_de: int = 0) -> AsyncIterator[Optional[Dict]]:
+        """
+        Genera los eventos de un trabajo a medida que ocurren, hasta que termina
+
+        Los eventos emitidos en este proceso llegan de inmediato; los de otros
+        procesos (workers con broker) se leen cada COLA_POLL_SEGUNDOS.
+
+        Args:
+            job_id: ID del trabajo
+            despues_de: Última secuencia ya recibida (para reconectar)
+
+        Yields:
+            Eventos {"seq", "tipo", "datos"}, o None cada SSE_PING_SEGUNDOS
+            sin novedades (para mantener viva la conexión)
+        """
+        oyente = asyncio.Event()
+        self._oyentes.setdefault(job_id, set()).add(oyente)
+        ultimo = time.monotonic()
+        try:
+            while True:
+                oyente.clear()
+                for evento in self._leer_eventos(job_id, despues_de):
+                    despues_de = evento["seq"]
+                    ultimo = time.monotonic()
+                    yield evento
+                    if evento["tipo"] == "status" and evento["datos"]["status"] in ("completed", "failed"):
+                        return
+
+                try:
+                    await asyncio.wait_for(oyente.wait(), timeout=settings.COLA_POLL_SEGUNDOS)
+                except asyncio.TimeoutError:
+                    if time.monotonic() - ultimo >= settings.SSE_PING_SEGUNDOS:
+                        ultimo = time.monotonic()
+                        yield None
+        finally:
+            oyentes = self._oyentes.get(job_id)
+            if oyentes is not None:
+                oyentes.discard(oyente)
+                if not oyentes:
+                    del self._oyentes[job_id]
+
+    def _persistir(self, job_id: str):
+        """Guarda el estado actual de un trabajo en el store persistente"""
+        if not self.store:
+            return
+        try:
+            self.store.guardar(self.jobs[job_id])
+        except Exception as e:
+            logger.error(f"Error persistiendo job {job_id}: {str(e)}")
+
+    async def start(self, consumir: bool = True):
+        """
+        Inicia la retención periódica y, si este proceso consume, los workers
+
+        Los trabajos que otro proceso dejó a medio procesar (caída o deploy)
+        se retoman cuando vence su lease en el broker.
+
+        Args:
+            consumir: False para una API que solo encola (los trabajos los
+                procesan procesos worker.py)
+        """
+        self.consumir = consumir or not self.store
+
+        if self._limpieza is None:
+            self._limpieza = asyncio.create_task(self._limpiar_periodicamente())
+
+        # Latido en el broker (si consume) y avisos de los demás procesos
+        await coordinador.start(self.store, self.consumidor, consume=self.consumir)
+
+        if not self.consumir:
+            logger.info("JobQueue en modo solo encolar: los trabajos los procesan los workers")
+            return
+
+        await self.callbacks.start()
+
+        if self.store and not self.workers_started:
+            self._start_workers()
+
+    def _prioridad(self, carril: str) -> float:
+        """
+        Prioridad de un trabajo nuevo en el broker (menor = antes)
+
+        Cada nivel de carril equivale a CARRIL_AGING_SEGUNDOS de espera, igual
+        que el envejecimiento del planificador local.
+        """
+        return CARRILES.index(carril) * settings.CARRIL_AGING_SEGUNDOS + time.time()
+
+    async def _alimentar(self):
+        """
+        Reclama trabajos del broker mientras algún carril tenga capacidad en este proceso
+
+        La capacidad se mira por carril: las sub-tareas de un trabajo masivo
+        ocupan su carril, pero no impiden reclamar trabajos de los demás
+        (por ejemplo, uno interactivo con worker reservado).
+        """
+        while True:
+            try:
+                while True:
+                    carriles = [carril for carril in CARRILES if self.queue.libres(carril) > 0]
+                    if not carriles:
+                        break
+                    job = self.store.reclamar(self.consumidor, settings.COLA_LEASE_SEGUNDOS, carriles)
+                    if not job:
+                        break
+                    await self._tomar_job(job)
+            except Exception as e:
+                logger.error(f"Error reclamando trabajos del broker: {str(e)}")
+
+            self._hay_trabajo.clear()
+            try:
+                await asyncio.wait_for(self._hay_trabajo.wait(), timeout=settings.COLA_POLL_SEGUNDOS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _tomar_job(self, job: Dict):
+        """Incorpora un trabajo reclamado al planificador local"""
+        job_id = job["job_id"]
+        job.setdefault("carril", self._carril_para(job["tipo"], job["params"]))
+
+        if job["status"] == "processing":
+            logger.warning(f"Job {job_id} quedó interrumpido en worker {job.get('worker_id')}, se retoma")
+            job["status"] = "pending"
+            job["started_at"] = None
+            job["worker_id"] = None
+            job["reintentos"] = job.get("reintentos", 0) + 1
+            self._emitir(job_id, "status", {"status": "pending", "reintentos": job["reintentos"]})
+
+        job["consumidor"] = self.consumidor
+        self._registrar_job(job)
+        self._persistir(job_id)
+        await self.queue.put(job["carril"], {"job_id": job_id, "tipo": job["tipo"], "params": job["params"]})
+
+    async def _renovar_reclamos(self):
+        """Renueva el lease de los trabajos que este proceso tiene en curso"""
+        while True:
+            await asyncio.sleep(settings.COLA_LEASE_SEGUNDOS / 3)
+            try:
+                self.store.renovar(self.consumidor, list(self.jobs), settings.COLA_LEASE_SEGUNDOS)
+            except Exception as e:
+                logger.error(f"Error renovando leases en el broker: {str(e)}")
+
+    @staticmethod
+    def _carril_para(tipo: str, params: Dict) -> str:
+        """
+        Carril por defecto de un trabajo
+
+        Consultas de una propiedad o de pocos servicios son interactivas (las
+        pide el frontend), listas grandes de servicios van a batch y la
+        consulta de todas las propiedades a background.
+        """
+        if tipo == "todas":
+            return "background"
+        if tipo == "servicios" and len(params.get("servicio_ids") or []) > settings.CARRIL_BATCH_UMBRAL:
+            return "batch"
+        return "interactive"
+
+    async def add_job(
+        self,
+        tipo: str,
+        params: Dict,
+        callback_url: Optional[str] = None,
+        voucher_id: Optional[str] = None,
+        carril: Optional[str] = None
+    ) -> str:
         """
         Agrega un trabajo a la cola
 
@@ -37,13 +419,19 @@ class JobQueue:
             params: Parámetros del trabajo (propiedad_id, servicio_ids, etc)
             callback_url: URL donde enviar resultados cuando termine
             voucher_id: ID del voucher (para referencia)
+            carril: Carril de prioridad ("interactive", "batch", "background");
+                por defecto se deduce del tipo
 
         Returns:
             job_id: ID único del trabajo
         """
+        carril = carril or self._carril_para(tipo, params)
+        if carril not in CARRILES:
+            raise ValueError(f"Carril no soportado: {carril}")
+
         job_id = str(uuid.uuid4())
 
-        self.jobs[job_id] = {
+        job = {
             "job_id": job_id,
             "tipo": tipo,
             "params": params,
@@ -53,74 +441,81 @@ class JobQueue:
             "completed_at": None,
             "resultado": None,
             "error": None,
-            "queue_position": self.queue.qsize() + 1,
+            "carril": carril,
+            "queue_position": None,
             "callback_url": callback_url,
             "voucher_id": voucher_id,
             "callback_sent": False,
             "callback_error": None
         }
 
-        await self.queue.put((job_id, tipo, params))
-        logger.info(f"Job {job_id} encolado - Tipo: {tipo}, Posición en cola: {self.jobs[job_id]['queue_position']}, Callback: {callback_url is not None}")
+        if self.store:
+            # Publicar en el broker; lo reclama el primer consumidor con workers libres
+            self.store.publicar(job, self._prioridad(carril))
+            self._hay_trabajo.set()
+            posicion = self.store.posicion(job_id)
+        else:
+            job["queue_position"] = len(self._pendientes[carril]) + 1
+            self._registrar_job(job)
+            await self.queue.put(carril, {"job_id": job_id, "tipo": tipo, "params": params})
+            posicion = job["queue_position"]
+
+        self._emitir(job_id, "status", {"status": "pending", "carril": carril})
+        logger.info(f"Job {job_id} encolado - Tipo: {tipo}, Carril: {carril}, Posición en cola: {posicion}, Callback: {callback_url is not None}")
 
         # Iniciar workers si aún no están corriendo
-        if not self.workers_started:
+        if self.consumir and not self.workers_started:
             self._start_workers()
 
         return job_id
 
-    async def _send_callback(self, job_id: str, max_retries: int = 3) -> bool:
+    @staticmethod
+    def _preparar_callback(job: Dict) -> Optional[Tuple[str, Dict]]:
         """
-        Envía el callback al finalizar un trabajo
-
-        Args:
-            job_id: ID del trabajo
-            max_retries: Número máximo de reintentos
+        URL y payload del callback de un trabajo terminado
 
         Returns:
-            True si se envió exitosamente, False si falló
+            (url, payload) o None si el trabajo no tiene callback
         """
-        job = self.jobs.get(job_id)
-        if not job or not job.get("callback_url"):
-            return False
-
-        callback_url = job["callback_url"]
+        if not job.get("callback_url"):
+            return None
 
         # Preparar payload según formato esperado por Next.js
-        # Next.js espera solo { resultados: [...] }
+        # Next.js espera solo { resultados: [...] }; un trabajo fallido no tiene resultado
         payload = {
-            "resultados": job.get("resultado", [])
+            "resultados": job.get("resultado") or []
         }
+        return job["callback_url"], payload
 
-        logger.info(f"Enviando callback con {len(payload['resultados'])} resultados para job {job_id}")
-
-        # Reintentar con backoff exponencial
-        for attempt in range(max_retries):
-            try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.post(callback_url, json=payload)
-                    response.raise_for_status()
-
-                logger.info(f"Callback enviado exitosamente para job {job_id} a {callback_url}")
-                self.jobs[job_id]["callback_sent"] = True
-                self.jobs[job_id]["callback_error"] = None
-                return True
+    def _encolar_callback(self, job_id: str, url: str, payload: Dict):
+        """
+        Entrega el resultado del trabajo al dispatcher de callbacks
 
-            except Exception as e:
-                error_msg = f"Intento {attempt + 1}/{max_retries} falló: {str(e)}"
-                logger.warning(f"Error enviando callback para job {job_id}: {error_msg}")
+        El worker no espera la entrega: los reintentos corren en el dispatcher.
 
-                if attempt < max_retries - 1:
-                    # Backoff exponencial: 1s, 2s, 4s
-                    wait_time = 2 ** attempt
-                    await asyncio.sleep(wait_time)
-                else:
-                    # Último intento falló
-                    self.jobs[job_id]["callback_sent"] = False
-                    self.jobs[job_id]["callback_error"] = f"Falló después de {max_retries} intentos: {str(e)}"
-                    logger.error(f"Callback falló definitivamente para job {job_id}: {str(e)}")
+        Args:
+            job_id: ID del trabajo
+            url: URL del callback
+            payload: Cuerpo JSON a enviar
+        """
+        logger.info(f"Encolando callback con {len(payload['resultados'])} resultados para job {job_id}")
+        self.callbacks.enviar(job_id, url, payload)
 
-        return False
+    def _registrar_callback(self, job_id: str, enviado: bool, error: Optional[str]):
+        """Registra en el trabajo el resultado de la entrega de su callback"""
+        job = self.jobs.get(job_id)
+        if job:
+            job["callback_sent"] = enviado
+            job["callback_error"] = error
+            self._persistir(job_id)
+            return
+
+        # El trabajo ya terminó y solo vive en el broker
+        job = self.store.obtener(job_id) if self.store else None
+        if job:
+            job["callback_sent"] = enviado
+            job["callback_error"] = error
+            self.store.guardar(job)
 
     def _start_workers(self):
         """Inicia los workers para procesar la cola"""
@@ -129,80 +524,294 @@ class JobQueue:
             for i in range(self.max_workers):
                 worker = asyncio.create_task(self._worker(i))
                 self._workers.append(worker)
-            logger.info(f"{self.max_workers} workers iniciados")
+            if self.store:
+                self._workers.append(asyncio.create_task(self._alimentar()))
+                self._workers.append(asyncio.create_task(self._renovar_reclamos()))
+            logger.info(f"{self.max_workers} workers iniciados (consumidor {self.consumidor})")
 
     async def _worker(self, worker_id: int):
         """
-        Worker que procesa trabajos de la cola
+        Worker que procesa trabajos y sub-tareas de la cola
 
         Args:
             worker_id: ID del worker
         """
-        from batch_processor import BatchProcessor
-
         logger.info(f"Worker {worker_id} iniciado")
 
         while True:
             try:
-                # Obtener trabajo de la cola
-                job_id, tipo, params = await self.queue.get()
+                # Obtener el siguiente trabajo según prioridad de carriles
+                carril, item = await self.queue.get()
 
-                logger.info(f"Worker {worker_id} procesando job {job_id}")
+                try:
+                    if "servicio" in item:
+                        await self._ejecutar_subtarea(worker_id, item["job_id"], item["servicio"])
+                    else:
+                        await self._ejecutar_job(worker_id, item["job_id"], item["tipo"], item["params"])
+                finally:
+                    await self.queue.task_done(carril)
+                    self._hay_trabajo.set()
 
-                # Actualizar estado a "processing"
-                self.jobs[job_id]["status"] = "processing"
-                self.jobs[job_id]["started_at"] = datetime.now().isoformat()
-                self.jobs[job_id]["worker_id"] = worker_id
+            except Exception as e:
+                logger.error(f"Error en worker {worker_id}: {str(e)}")
+                await asyncio.sleep(1)  # Evitar loop infinito en caso de error
 
-                try:
-                    processor = BatchProcessor()
+    async def _ejecutar_job(self, worker_id: int, job_id: str, tipo: str, params: Dict):
+        """
+        Procesa un trabajo completo, o lo descompone en sub-tareas por servicio
 
-                    # Procesar según tipo
-                    if tipo == "propiedad":
-                        propiedad_id = params.get("propiedad_id")
-                        resultados = await processor.procesar_propiedad(propiedad_id)
+        Args:
+            worker_id: ID del worker
+            job_id: ID del trabajo
+            tipo: Tipo de trabajo
+            params: Parámetros del trabajo
+        """
+        from batch_processor import BatchProcessor
 
-                    elif tipo == "servicios":
-                        servicio_ids = params.get("servicio_ids")
-                        resultados = await processor.procesar_servicios_especificos(servicio_ids)
+        logger.info(f"Worker {worker_id} procesando job {job_id}")
+
+        # Actualizar estado a "processing"
+        self._cambiar_status(job_id, "processing")
+        ahora = datetime.now()
+        self.jobs[job_id]["started_at"] = ahora.isoformat()
+        self.jobs[job_id]["worker_id"] = worker_id
+        metricas.cola_espera.labels(carril=self.jobs[job_id].get("carril"), tipo=tipo).observe(
+            (ahora - datetime.fromisoformat(self.jobs[job_id]["created_at"])).total_seconds()
+        )
+        self._persistir(job_id)
+        self._emitir(job_id, "status", {"status": "processing"})
+
+        if self._es_descomponible(tipo, params):
+            # El coordinador encola una sub-tarea por servicio y el worker queda libre
+            tarea = asyncio.create_task(self._coordinar_subtareas(job_id, tipo, params))
+            self._coordinadores[job_id] = tarea
+            tarea.add_done_callback(lambda _: self._coordinadores.pop(job_id, None))
+            logger.info(f"Job {job_id} descompuesto en sub-tareas por worker {worker_id}")
+            return
+
+        # Los IDs pedidos son una cota: los servicios inactivos no se consultan
+        total = len(params.get("servicio_ids") or []) if tipo == "servicios" else None
+        self.jobs[job_id]["progreso"] = {"completados": 0, "total": total}
+
+        try:
+            processor = BatchProcessor(
+                propietario=job_id,
+                on_servicio=lambda resultado: self._registrar_resultado_servicio(job_id, resultado)
+            )
+
+            # Procesar según tipo
+            if tipo == "propiedad":
+                propiedad_id = params.get("propiedad_id")
+                resultados = await processor.procesar_propiedad(propiedad_id)
+
+            elif tipo == "servicios":
+                servicio_ids = params.get("servicio_ids")
+                resultados = await processor.procesar_servicios_especificos(servicio_ids)
+
+            elif tipo == "todas":
+                resultados = await processor.procesar_todas_propiedades()
+
+            else:
+                raise ValueError(f"Tipo de trabajo no soportado: {tipo}")
+
+            await processor.close()
+
+        except Exception as e:
+            logger.error(f"Job {job_id} falló en worker {worker_id}: {str(e)}")
+            self._finalizar_job(job_id, error=str(e))
+            return
+
+        logger.info(f"Job {job_id} completado exitosamente por worker {worker_id}")
+        self._finalizar_job(job_id, resultados=resultados)
+
+    def _finalizar_job(self, job_id: str, resultados=None, error: Optional[str] = None):
+        """
+        Marca un trabajo como completado o fallido y envía su callback
 
-                    elif tipo == "todas":
-                        resultados = await processor.procesar_todas_propiedades()
+        Args:
+            job_id: ID del trabajo
+            resultados: Resultado final (si terminó bien)
+            error: Mensaje de error (si falló)
+        """
+        job = self.jobs[job_id]
+        if error is None:
+            self._cambiar_status(job_id, "completed")
+            job["resultado"] = resultados
+            if job.get("progreso"):
+                # Ya se sabe cuántos servicios se consultaron realmente
+                job["progreso"]["total"] = job["progreso"]["completados"]
+        else:
+            self._cambiar_status(job_id, "failed")
+            job["error"] = error
+        job["completed_at"] = datetime.now().isoformat()
+        metricas.trabajos_terminados.labels(tipo=job["tipo"], status=job["status"]).inc()
+
+        # El payload del callback se arma antes de volcar el resultado a disco u olvidar el job
+        callback = self._preparar_callback(job)
+
+        # Persistir, emitir y liberar primero: si el callback falla, el job no
+        # debe quedar "processing" ni su stream de eventos sin terminar
+        self._retener_resultado(job_id)
+        self._persistir(job_id)
+
+        self._emitir(job_id, "status", {"status": job["status"], "error": job.get("error")})
+
+        if self.store:
+            # El estado final queda en el broker; este proceso ya no lo necesita
+            self.store.liberar(job_id)
+            self._olvidar_job(job_id)
+
+        # Enviar callback también si falló (para notificar el error)
+        if callback:
+            try:
+                self._encolar_callback(job_id, *callback)
+            except Exception as e:
+                logger.error(f"Error encolando callback del job {job_id}: {str(e)}")
 
-                    else:
-                        raise ValueError(f"Tipo de trabajo no soportado: {tipo}")
+    def _es_descomponible(self, tipo: str, params: Dict) -> bool:
+        """Indica si un trabajo se reparte en sub-tareas por servicio"""
+        if tipo == "todas":
+            return True
+        return tipo == "servicios" and len(params.get("servicio_ids") or []) > settings.SUBTAREAS_UMBRAL
 
-                    await processor.close()
+    async def _coordinar_subtareas(self, job_id: str, tipo: str, params: Dict):
+        """
+        Reparte un trabajo masivo en sub-tareas por servicio y agrega sus resultados
 
-                    # Marcar como completado
-                    self.jobs[job_id]["status"] = "completed"
-                    self.jobs[job_id]["resultado"] = resultados
-                    self.jobs[job_id]["completed_at"] = datetime.now().isoformat()
+        Las sub-tareas van al carril del trabajo padre y las toma cualquier
+        worker libre. Se mantienen a lo más SUBTAREAS_EN_VUELO encoladas a la
+        vez, así que el stream de servicios no se materializa completo. Los
+        resultados parciales se persisten: si el proceso se reinicia, el
+        trabajo rehidratado salta los servicios ya consultados.
 
-                    logger.info(f"Job {job_id} completado exitosamente por worker {worker_id}")
+        Args:
+            job_id: ID del trabajo padre
+            tipo: "todas" o "servicios"
+            params: Parámetros del trabajo
+        """
+        from database import db
+
+        job = self.jobs[job_id]
+        previos = self.store.resultados(job_id) if self.store else {}
+        estado = {
+            "resultados": dict(previos),
+            "orden": [],
+            "en_vuelo": 0,
+            "cupo": asyncio.Semaphore(settings.SUBTAREAS_EN_VUELO),
+            "cambio": asyncio.Event()
+        }
+        self._subtareas[job_id] = estado
+        job["progreso"] = {"completados": len(previos), "total": None}
+        if previos:
+            logger.info(f"Job {job_id} retoma con {len(previos)} servicios ya consultados")
+
+        try:
+            if tipo == "todas":
+                servicios = db.iter_servicios_activos()
+            else:
+                servicios = self._como_async(await db.get_servicios_por_ids(params.get("servicio_ids")))
+
+            async for servicio in servicios:
+                estado["orden"].append(servicio["servicio_id"])
+                if servicio["servicio_id"] in estado["resultados"]:
+                    continue
+                await estado["cupo"].acquire()
+                estado["en_vuelo"] += 1
+                await self.queue.put(job["carril"], {"job_id": job_id, "servicio": servicio})
+
+            job["progreso"]["total"] = len(estado["orden"])
+            self._persistir(job_id)
+            self._emitir(job_id, "progreso", dict(job["progreso"]))
+
+            # Esperar a que terminen las sub-tareas en vuelo
+            while estado["en_vuelo"] > 0:
+                estado["cambio"].clear()
+                await estado["cambio"].wait()
+
+            resultados = self._agregar_resultados(tipo, estado)
+
+        except Exception as e:
+            # Las sub-tareas ya encoladas terminan igual; sus resultados se descartan
+            logger.error(f"Job {job_id} falló coordinando sub-tareas: {str(e)}")
+            self._subtareas.pop(job_id, None)
+            self._finalizar_job(job_id, error=str(e))
+            return
+
+        self._subtareas.pop(job_id, None)
+        if self.store:
+            self.store.eliminar_resultados(job_id)
+        logger.info(f"Job {job_id} completado: {len(estado['resultados'])} sub-tareas agregadas")
+        self._finalizar_job(job_id, resultados=resultados)
+
+    @staticmethod
+    async def _como_async(items: List[Dict]):
+        """Recorre una lista como iterador asíncrono"""
+        for item in items:
+            yield item
+
+    @staticmethod
+    def _agregar_resultados(tipo: str, estado: Dict):
+        """
+        Arma el resultado final del padre con la misma forma que el procesamiento monolítico
 
-                    # Enviar callback si está configurado
-                    if self.jobs[job_id].get("callback_url"):
-                        await self._send_callback(job_id)
+        Returns:
+            Lista en el orden de los servicios ("servicios") o resumen con
+            totales ordenado por servicio_id ("todas")
+        """
+        if tipo == "servicios":
+            return [estado["resultados"][sid] for sid in estado["orden"] if sid in estado["resultados"]]
+
+        resultados = sorted(
+            (estado["resultados"][sid] for sid in estado["orden"] if sid in estado["resultados"]),
+            key=lambda r: r["servicio_id"]
+        )
+        total = len(resultados)
+        exitosos = sum(1 for r in resultados if r["exito"])
+        return {
+            "total": total,
+            "exitosos": exitosos,
+            "fallidos": total - exitosos,
+            "resultados": resultados
+        }
 
-                except Exception as e:
-                    # Marcar como fallido
-                    self.jobs[job_id]["status"] = "failed"
-                    self.jobs[job_id]["error"] = str(e)
-                    self.jobs[job_id]["completed_at"] = datetime.now().isoformat()
+    async def _ejecutar_subtarea(self, worker_id: int, job_id: str, servicio: Dict):
+        """
+        Consulta un servicio de un trabajo descompuesto y entrega el resultado al padre
 
-                    logger.error(f"Job {job_id} falló en worker {worker_id}: {str(e)}")
+        Args:
+            worker_id: ID del worker
+            job_id: ID del trabajo padre
+            servicio: Registro del servicio a consultar
+        """
+        from batch_processor import BatchProcessor
 
-                    # Enviar callback incluso si falló (para notificar el error)
-                    if self.jobs[job_id].get("callback_url"):
-                        await self._send_callback(job_id)
+        estado = self._subtareas.get(job_id)
+        if estado is None:
+            # El padre falló o ya no existe
+            return
 
-                finally:
-                    self.queue.task_done()
+        try:
+            processor = BatchProcessor(propietario=job_id)
+            try:
+                resultado = await processor.procesar_servicio(servicio)
+            finally:
+                await processor.close()
 
-            except Exception as e:
-                logger.error(f"Error en worker {worker_id}: {str(e)}")
-                await asyncio.sleep(1)  # Evitar loop infinito en caso de error
+            servicio_id = servicio["servicio_id"]
+            estado["resultados"][servicio_id] = resultado
+            if self.store:
+                try:
+                    self.store.guardar_resultado(job_id, servicio_id, resultado)
+                except Exception as e:
+                    logger.error(f"Error persistiendo resultado de servicio {servicio_id} del job {job_id}: {str(e)}")
+
+            self._registrar_resultado_servicio(job_id, resultado)
+            logger.debug(f"Worker {worker_id} completó servicio {servicio_id} del job {job_id}")
+        finally:
+            # Aunque la sub-tarea falle, el padre no debe esperarla para siempre
+            estado["en_vuelo"] -= 1
+            estado["cupo"].release()
+            estado["cambio"].set()
 
     def get_job_status(self, job_id: str) -> Optional[Dict]:
         """
@@ -214,18 +823,41 @@ class JobQueue:
         Returns:
             Información del trabajo o None si no existe
         """
+        if self.store:
+            # El broker tiene el estado de trabajos de cualquier proceso; la
+            # posición la cuenta el broker (ver JobStore.posicion)
+            job = self.store.obtener(job_id)
+            if job and job["status"] == "pending":
+                job["queue_position"] = self.store.posicion(job_id)
+            return job
+
         job = self.jobs.get(job_id)
 
         if job and job["status"] == "pending":
-            # Calcular posición actual en la cola
-            pending_jobs = [j for j in self.jobs.values() if j["status"] == "pending"]
-            pending_jobs.sort(key=lambda x: x["created_at"])
+            # Posición actual dentro de su carril en O(log n)
+            job["queue_position"] = self._pendientes[job["carril"]].posicion(job_id)
 
-            for idx, pending_job in enumerate(pending_jobs):
-                if pending_job["job_id"] == job_id:
-                    job["queue_position"] = idx + 1
-                    break
+        return job
+
+    async def obtener_job(self, job_id: str) -> Optional[Dict]:
+        """
+        Obtiene un trabajo con su resultado, cargándolo desde disco si fue volcado
 
+        El resultado cargado no vuelve a quedar en memoria del proceso.
+
+        Args:
+            job_id: ID del trabajo
+
+        Returns:
+            Información del trabajo o None si no existe
+        """
+        job = self.get_job_status(job_id)
+        if not job or not job.get("resultado_archivo") or job.get("resultado") is not None:
+            return job
+
+        ruta = job["resultado_archivo"]
+        job = {k: v for k, v in job.items() if k != "resultado_archivo"}
+        job["resultado"] = await asyncio.to_thread(self.archivo_resultados.cargar, ruta)
         return job
 
     def get_all_jobs(self, status: Optional[str] = None, limit: int = 50) -> List[Dict]:
@@ -239,6 +871,9 @@ class JobQueue:
         Returns:
             Lista de trabajos
         """
+        if self.store:
+            return self.store.listar(status=[status] if status else None, limite=limit, recientes=True)
+
         jobs = list(self.jobs.values())
 
         if status:
@@ -256,23 +891,45 @@ class JobQueue:
         Returns:
             Diccionario con estadísticas
         """
-        total_jobs = len(self.jobs)
-        pending = sum(1 for j in self.jobs.values() if j["status"] == "pending")
-        processing = sum(1 for j in self.jobs.values() if j["status"] == "processing")
-        completed = sum(1 for j in self.jobs.values() if j["status"] == "completed")
-        failed = sum(1 for j in self.jobs.values() if j["status"] == "failed")
+        # Con broker los conteos son de toda la flota; carriles y workers, de este proceso
+        conteos = self.store.conteos() if self.store else self._conteo_status
+        pending = conteos.get("pending", 0)
+        processing = conteos.get("processing", 0)
+        completed = conteos.get("completed", 0)
+        failed = conteos.get("failed", 0)
 
         return {
-            "total_jobs": total_jobs,
+            "total_jobs": pending + processing + completed + failed,
             "pending": pending,
             "processing": processing,
             "completed": completed,
             "failed": failed,
-            "queue_size": self.queue.qsize(),
+            "queue_size": pending if self.store else self.queue.pendientes(),
+            "carriles": self.queue.stats(),
             "max_workers": self.max_workers,
+            "jobs_descompuestos": len(self._subtareas),
+            "callbacks": self.callbacks.stats(),
+            "consumidor": self.consumidor if self.consumir else None,
             "workers_active": self.workers_started
         }
 
+    def actualizar_metricas(self):
+        """Actualiza los gauges de los carriles locales (se llama en cada scrape de /metrics)"""
+        for carril, stats in self.queue.stats().items():
+            metricas.cola_pendientes_carril.labels(carril=carril).set(stats["pendientes"])
+
+    def actualizar_metricas_broker(self):
+        """
+        Actualiza el gauge de trabajos por estado de todo el broker
+
+        Los conteos son los mismos desde cualquier proceso, así que solo la API
+        registra este recolector: si cada worker los exportara, Prometheus
+        sumaría una copia por instancia.
+        """
+        conteos = self.store.conteos() if self.store else self._conteo_status
+        for status in ("pending", "processing", "completed", "failed"):
+            metricas.cola_trabajos.labels(status=status).set(conteos.get(status, 0))
+
     async def clear_old_jobs(self, hours: int = 24):
         """
         Limpia trabajos completados/fallidos más antiguos que X horas
@@ -285,16 +942,98 @@ class JobQueue:
         cutoff_time = datetime.now() - timedelta(hours=hours)
         removed = 0
 
+        if self.store:
+            eliminados = self.store.eliminar_terminados(antes_de=cutoff_time.isoformat())
+            self._eliminar_archivos(eliminados)
+            logger.info(f"Limpiados {len(eliminados)} trabajos antiguos (>{hours}h)")
+            return len(eliminados)
+
         for job_id, job in list(self.jobs.items()):
             if job["status"] in ["completed", "failed"]:
                 completed_at = datetime.fromisoformat(job["completed_at"])
                 if completed_at < cutoff_time:
-                    del self.jobs[job_id]
+                    self._eliminar_job(job_id)
                     removed += 1
 
         logger.info(f"Limpiados {removed} trabajos antiguos (>{hours}h)")
         return removed
 
+    def _limitar_terminados(self, maximo: int) -> int:
+        """
+        Elimina los trabajos terminados más antiguos sobre un máximo
+
+        Args:
+            maximo: Cantidad de trabajos completados/fallidos a conservar
+
+        Returns:
+            Cantidad de trabajos eliminados
+        """
+        if self.store:
+            eliminados = self.store.eliminar_terminados(conservar=maximo)
+            self._eliminar_archivos(eliminados)
+            if eliminados:
+                logger.info(f"Eliminados {len(eliminados)} trabajos terminados sobre el máximo de {maximo}")
+            return len(eliminados)
+
+        terminados = [j for j in self.jobs.values() if j["status"] in ["completed", "failed"]]
+        if len(terminados) <= maximo:
+            return 0
+
+        terminados.sort(key=lambda j: j["completed_at"])
+        sobrantes = terminados[:len(terminados) - maximo]
+        for job in sobrantes:
+            self._eliminar_job(job["job_id"])
+
+        logger.info(f"Eliminados {len(sobrantes)} trabajos terminados sobre el máximo de {maximo}")
+        return len(sobrantes)
+
+    def _eliminar_archivos(self, jobs: List[Dict]):
+        """Borra los resultados en disco de trabajos eliminados del broker"""
+        for job in jobs:
+            if job.get("resultado_archivo") and self.archivo_resultados:
+                self.archivo_resultados.eliminar(job["resultado_archivo"])
+
+    async def _limpiar_periodicamente(self):
+        """Aplica la retención por antigüedad y cantidad cada JOB_LIMPIEZA_INTERVALO segundos"""
+        while True:
+            await asyncio.sleep(settings.JOB_LIMPIEZA_INTERVALO)
+            try:
+                await self.clear_old_jobs(hours=settings.JOB_RETENCION_HORAS)
+                self._limitar_terminados(settings.JOB_RETENCION_MAX)
+            except Exception as e:
+                logger.error(f"Error aplicando retención de trabajos: {str(e)}")
+
+    async def close(self):
+        """
+        Detiene workers, coordinadores y el despacho de callbacks
+
+        Los trabajos en curso quedan en "processing" y otro consumidor los
+        retoma al vencer su lease; los callbacks pendientes quedan en el store.
+        """
+        tareas = self._workers + list(self._coordinadores.values())
+        if self.store and self.jobs:
+            # Vencer los leases propios para que otro consumidor los retome de inmediato
+            try:
+                self.store.renovar(self.consumidor, list(self.jobs), 0)
+            except Exception as e:
+                logger.error(f"Error liberando leases en el broker: {str(e)}")
+        if self._limpieza:
+            tareas.append(self._limpieza)
+            self._limpieza = None
+        for tarea in tareas:
+            tarea.cancel()
+        if tareas:
+            await asyncio.gather(*tareas, return_exceptions=True)
+        self._workers = []
+        self.workers_started = False
+        await self.callbacks.close()
+        await coordinador.close()
+
 
 # Singleton instance
-job_queue = JobQueue(max_workers=3)
+job_queue = JobQueue(
+    max_workers=settings.JOB_MAX_WORKERS,
+    store=crear_job_store(),
+    resultados_dir=settings.JOB_RESULTADOS_DIR or None
+)
+metricas.metricas.al_exponer(job_queue.actualizar_metricas)
@@ -0,0 +1,661 @@
+"""
+Almacenamiento persistente de trabajos de la cola (SQLite en modo WAL)
+"""
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Segundos que se conservan los avisos entre procesos en el broker
+AVISOS_RETENCION_SEGUNDOS = 3600
+
+
+class JobStore:
+    """
+    Persiste cada trabajo de JobQueue en SQLite y actúa como broker compartido
+
+    El documento completo del trabajo se guarda como JSON; status y
+    created_at van en columnas indexadas. Los trabajos publicados tienen una
+    prioridad y los procesos consumidores los reclaman con un lease que
+    renuevan mientras trabajan: si un worker muere, el lease vence y otro
+    proceso retoma el trabajo. Varios procesos pueden compartir el archivo
+    (mismo host o volumen compartido con locks confiables).
+    """
+
+    def __init__(self, ruta: str):
+        """
+        Args:
+            ruta: Archivo SQLite (se crea si no existe)
+        """
+        self.ruta = ruta
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                tipo TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                datos TEXT NOT NULL
+            )
+        """)
+        self._migrar_columnas_broker()
+        self._migrar_columna_carril()
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs (created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_prioridad ON jobs (prioridad) WHERE prioridad IS NOT NULL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_carril ON jobs (carril, prioridad) WHERE prioridad IS NOT NULL")
+        # Solo los pendientes en cola: la posición cuenta los que van adelante sin leer el historial
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_cola ON jobs (prioridad) WHERE status = 'pending' AND prioridad IS NOT NULL"
+        )
+        self._crear_conteos()
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_terminado_en ON jobs (terminado_en) WHERE terminado_en IS NOT NULL")
+        # Resultados parciales de sub-tareas de trabajos descompuestos
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS job_resultados (
+                job_id TEXT NOT NULL,
+                servicio_id INTEGER NOT NULL,
+                datos TEXT NOT NULL,
+                PRIMARY KEY (job_id, servicio_id)
+            )
+        """)
+        # Eventos de progreso de cada trabajo (para streaming a clientes)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS job_eventos (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                tipo TEXT NOT NULL,
+                datos TEXT NOT NULL,
+                PRIMARY KEY (job_id, seq)
+            )
+        """)
+        # Callbacks pendientes de entrega (cola de reintentos); cada uno lo
+        # entrega el consumidor que tiene su lease
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS callbacks (
+                job_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                intentos INTEGER NOT NULL,
+                proximo_intento REAL NOT NULL,
+                reclamado_por TEXT,
+                reclamado_hasta REAL
+            )
+        """)
+        self._migrar_columnas_callbacks()
+        # Procesos consumidores vivos (último latido con su estado) y avisos
+        # entre procesos (ver coordinacion.Coordinador)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS consumidores (
+                consumidor TEXT PRIMARY KEY,
+                estado TEXT NOT NULL,
+                vence_en REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS avisos (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                tipo TEXT NOT NULL,
+                datos TEXT NOT NULL,
+                creado_en REAL NOT NULL
+            )
+        """)
+
+    def _migrar_columnas_broker(self):
+        """Agrega las columnas de broker a bases creadas antes de que existieran"""
+        columnas = {fila[1] for fila in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "prioridad" in columnas:
+            return
+
+        self._conn.execute("ALTER TABLE jobs ADD COLUMN prioridad REAL")
+        self._conn.execute("ALTER TABLE jobs ADD COLUMN reclamado_por TEXT")
+        self._conn.execute("ALTER TABLE jobs ADD COLUMN reclamado_hasta REAL")
+        self._conn.execute("ALTER TABLE jobs ADD COLUMN terminado_en TEXT")
+
+        # Los trabajos sin terminar vuelven a quedar disponibles en orden de creación
+        filas = self._conn.execute(
+            "SELECT job_id, created_at FROM jobs WHERE status IN ('pending', 'processing')"
+        ).fetchall()
+        for job_id, created_at in filas:
+            self._conn.execute(
+                "UPDATE jobs SET prioridad = ? WHERE job_id = ?",
+                (datetime.fromisoformat(created_at).timestamp(), job_id)
+            )
+        self._conn.execute(
+            """
+            UPDATE jobs SET terminado_en = json_extract(datos, '$.completed_at')
+            WHERE status IN ('completed', 'failed')
+            """
+        )
+
+    def _migrar_columna_carril(self):
+        """Agrega el carril de cada trabajo como columna (para reclamar por carril)"""
+        columnas = {fila[1] for fila in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "carril" in columnas:
+            return
+
+        self._conn.execute("ALTER TABLE jobs ADD COLUMN carril TEXT")
+        # Trabajos anteriores a los carriles: el carril por defecto según el tipo
+        self._conn.execute(
+            """
+            UPDATE jobs SET carril = COALESCE(
+                json_extract(datos, '$.carril'),
+                CASE WHEN tipo = 'todas' THEN 'background' ELSE 'interactive' END
+            )
+            """
+        )
+
+    def _crear_conteos(self):
+        """
+        Crea la tabla de trabajos por estado y los triggers que la mantienen
+
+        Los triggers la actualizan en la misma transacción que cada insert,
+        cambio de estado o borrado de jobs, así conteos() no recorre la tabla.
+        """
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            existe = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'job_conteos'"
+            ).fetchone()
+            if not existe:
+                self._conn.execute("CREATE TABLE job_conteos (status TEXT PRIMARY KEY, total INTEGER NOT NULL)")
+                self._conn.execute("INSERT INTO job_conteos SELECT status, COUNT(*) FROM jobs GROUP BY status")
+                self._conn.execute("""
+                    CREATE TRIGGER trg_jobs_conteo_insert AFTER INSERT ON jobs BEGIN
+                        INSERT INTO job_conteos (status, total) VALUES (NEW.status, 1)
+                        ON CONFLICT(status) DO UPDATE SET total = total + 1;
+                    END
+                """)
+                self._conn.execute("""
+                    CREATE TRIGGER trg_jobs_conteo_update AFTER UPDATE OF status ON jobs
+                    WHEN OLD.status <> NEW.status BEGIN
+                        UPDATE job_conteos SET total = total - 1 WHERE status = OLD.status;
+                        INSERT INTO job_conteos (status, total) VALUES (NEW.status, 1)
+                        ON CONFLICT(status) DO UPDATE SET total = total + 1;
+                    END
+                """)
+                self._conn.execute("""
+                    CREATE TRIGGER trg_jobs_conteo_delete AFTER DELETE ON jobs BEGIN
+                        UPDATE job_conteos SET total = total - 1 WHERE status = OLD.status;
+                    END
+                """)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _migrar_columnas_callbacks(self):
+        """Agrega las columnas de lease a tablas de callbacks creadas antes de que existieran"""
+        columnas = {fila[1] for fila in self._conn.execute("PRAGMA table_info(callbacks)")}
+        if "reclamado_por" not in columnas:
+            # Sin lease, los callbacks existentes quedan disponibles para el primer consumidor
+            self._conn.execute("ALTER TABLE callbacks ADD COLUMN reclamado_por TEXT")
+            self._conn.execute("ALTER TABLE callbacks ADD COLUMN reclamado_hasta REAL")
+
+    def guardar(self, job: Dict):
+        """Inserta o actualiza un trabajo"""
+        terminado_en = job.get("completed_at") if job["status"] in ("completed", "failed") else None
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO jobs (job_id, tipo, status, created_at, datos, terminado_en) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(job_id) DO UPDATE SET
+                    status = excluded.status, datos = excluded.datos, terminado_en = excluded.terminado_en
+                """,
+                (job["job_id"], job["tipo"], job["status"], job["created_at"], json.dumps(job, default=str), terminado_en)
+            )
+
+    def publicar(self, job: Dict, prioridad: float):
+        """
+        Guarda un trabajo nuevo y lo deja disponible para los consumidores
+
+        Args:
+            job: Documento del trabajo
+            prioridad: Menor = se reclama antes (epoch de creación más el peso del carril)
+        """
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO jobs (job_id, tipo, status, created_at, datos, prioridad, carril) VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    job["job_id"], job["tipo"], job["status"], job["created_at"],
+                    json.dumps(job, default=str), prioridad, job["carril"]
+                )
+            )
+
+    def reclamar(self, consumidor: str, lease: float, carriles: Optional[List[str]] = None) -> Optional[Dict]:
+        """
+        Reclama el siguiente trabajo disponible (o con lease vencido)
+
+        Args:
+            consumidor: Identificador del proceso que reclama
+            lease: Segundos de validez del reclamo si no se renueva
+            carriles: Solo reclamar trabajos de estos carriles (todos si es None)
+
+        Returns:
+            Documento del trabajo reclamado o None si no hay disponibles
+        """
+        ahora = time.time()
+        filtro = f"AND carril IN ({','.join('?' * len(carriles))})" if carriles is not None else ""
+        with self._lock:
+            # BEGIN IMMEDIATE toma el lock de escritura: dos procesos no reclaman el mismo trabajo
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                fila = self._conn.execute(
+                    f"""
+                    SELECT job_id, datos FROM jobs
+                    WHERE prioridad IS NOT NULL AND (reclamado_hasta IS NULL OR reclamado_hasta < ?) {filtro}
+                    ORDER BY prioridad LIMIT 1
+                    """,
+                    (ahora, *(carriles or []))
+                ).fetchone()
+                if fila:
+                    self._conn.execute(
+                        "UPDATE jobs SET reclamado_por = ?, reclamado_hasta = ? WHERE job_id = ?",
+                        (consumidor, ahora + lease, fila[0])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return json.loads(fila[1]) if fila else None
+
+    def renovar(self, consumidor: str, job_ids: List[str], lease: float):
+        """Extiende el lease de los trabajos que un consumidor sigue procesando"""
+        if not job_ids:
+            return
+        marcadores = ",".join("?" * len(job_ids))
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET reclamado_hasta = ? WHERE reclamado_por = ? AND job_id IN ({marcadores})",
+                [time.time() + lease, consumidor, *job_ids]
+            )
+
+    def liberar(self, job_id: str):
+        """Saca de la cola un trabajo terminado"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET prioridad = NULL, reclamado_por = NULL, reclamado_hasta = NULL WHERE job_id = ?",
+                (job_id,)
+            )
+
+    def posicion(self, job_id: str) -> Optional[int]:
+        """
+        Posición de un trabajo pendiente en la cola compartida (1 = el próximo)
+
+        Cuenta sobre idx_jobs_cola solo los pendientes que van adelante (sin
+        leer filas ni trabajos terminados): O(k) en los k que van adelante.
+        No usa IndicePosiciones porque la cola la modifican todos los procesos
+        conectados al broker y un índice en memoria solo vería los cambios
+        propios.
+        """
+        with self._lock:
+            fila = self._conn.execute(
+                """
+                SELECT COUNT(*) + 1 FROM jobs INDEXED BY idx_jobs_cola
+                WHERE status = 'pending' AND prioridad IS NOT NULL
+                    AND prioridad < (SELECT prioridad FROM jobs WHERE job_id = ?)
+                """,
+                (job_id,)
+            ).fetchone()
+        return fila[0] if fila else None
+
+    def conteos(self) -> Dict[str, int]:
+        """Cantidad de trabajos por estado (tabla mantenida por triggers)"""
+        with self._lock:
+            filas = self._conn.execute("SELECT status, total FROM job_conteos WHERE total > 0").fetchall()
+        return dict(filas)
+
+    def obtener(self, job_id: str) -> Optional[Dict]:
+        """Obtiene un trabajo por su ID"""
+        with self._lock:
+            fila = self._conn.execute("SELECT datos FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(fila[0]) if fila else None
+
+    def listar(
+        self,
+        status: Optional[List[str]] = None,
+        limite: Optional[int] = None,
+        recientes: bool = False
+    ) -> List[Dict]:
+        """
+        Lista trabajos en orden de creación
+
+        Args:
+            status: Estados a incluir (todos si es None)
+            limite: Cantidad máxima de trabajos (todos si es None)
+            recientes: Si es True, los más recientes primero
+        """
+        filtro = ""
+        parametros: List = []
+        if status:
+            filtro = f"WHERE status IN ({','.join('?' * len(status))})"
+            parametros.extend(status)
+        orden = "DESC" if recientes else "ASC"
+        parametros.append(limite if limite is not None else -1)
+
+        with self._lock:
+            filas = self._conn.execute(
+                f"SELECT datos FROM jobs {filtro} ORDER BY created_at {orden} LIMIT ?",
+                parametros
+            ).fetchall()
+        return [json.loads(fila[0]) for fila in filas]
+
+    def eliminar(self, job_id: str):
+        """Elimina un trabajo y sus resultados parciales"""
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM job_resultados WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM job_eventos WHERE job_id = ?", (job_id,))
+
+    def eliminar_terminados(self, antes_de: Optional[str] = None, conservar: Optional[int] = None) -> List[Dict]:
+        """
+        Elimina trabajos terminados por antigüedad y/o sobre una cantidad máxima
+
+        Args:
+            antes_de: Fecha ISO; se eliminan los terminados antes de ella
+            conservar: Cantidad de terminados más recientes a conservar
+
+        Returns:
+            Documentos de los trabajos eliminados
+        """
+        with self._lock:
+            filas = []
+            if antes_de is not None:
+                filas += self._conn.execute(
+                    "SELECT job_id, datos FROM jobs WHERE terminado_en IS NOT NULL AND terminado_en < ?",
+                    (antes_de,)
+                ).fetchall()
+            if conservar is not None:
+                filas += self._conn.execute(
+                    "SELECT job_id, datos FROM jobs WHERE terminado_en IS NOT NULL ORDER BY terminado_en DESC LIMIT -1 OFFSET ?",
+                    (conservar,)
+                ).fetchall()
+
+            eliminados = {job_id: datos for job_id, datos in filas}
+            for job_id in eliminados:
+                self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+                self._conn.execute("DELETE FROM job_resultados WHERE job_id = ?", (job_id,))
+                self._conn.execute("DELETE FROM job_eventos WHERE job_id = ?", (job_id,))
+        return [json.loads(datos) for datos in eliminados.values()]
+
+    def guardar_resultado(self, job_id: str, servicio_id: int, resultado: Dict):
+        """Guarda el resultado de una sub-tarea (un servicio) de un trabajo"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO job_resultados (job_id, servicio_id, datos) VALUES (?, ?, ?)",
+                (job_id, servicio_id, json.dumps(resultado, default=str))
+            )
+
+    def resultados(self, job_id: str) -> Dict[int, Dict]:
+        """Resultados parciales ya guardados de un trabajo, por servicio_id"""
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT servicio_id, datos FROM job_resultados WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        return {servicio_id: json.loads(datos) for servicio_id, datos in filas}
+
+    def eliminar_resultados(self, job_id: str):
+        """Elimina los resultados parciales de un trabajo (ya agregados en el padre)"""
+        with self._lock:
+            self._conn.execute("DELETE FROM job_resultados WHERE job_id = ?", (job_id,))
+
+    def agregar_evento(self, job_id: str, tipo: str, datos: Dict) -> int:
+        """
+        Agrega un evento al historial de un trabajo
+
+        Returns:
+            Número de secuencia del evento (1, 2, ...)
+        """
+        with self._lock:
+            fila = self._conn.execute(
+                """
+                INSERT INTO job_eventos (job_id, seq, tipo, datos)
+                SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ? FROM job_eventos WHERE job_id = ?
+                RETURNING seq
+                """,
+                (job_id, tipo, json.dumps(datos, default=str), job_id)
+            ).fetchone()
+        return fila[0]
+
+    def eventos(
+        self,
+        job_id: str,
+        despues_de: int = 0,
+        tipo: Optional[str] = None,
+        limite: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        Eventos de un trabajo posteriores a una secuencia
+
+        Args:
+            job_id: ID del trabajo
+            despues_de: Secuencia desde la cual leer (exclusiva)
+            tipo: Solo eventos de este tipo (todos si es None)
+            limite: Cantidad máxima de eventos (todos si es None)
+        """
+        filtro = "AND tipo = ?" if tipo else ""
+        parametros = [job_id, despues_de, *([tipo] if tipo else []), limite if limite is not None else -1]
+        with self._lock:
+            filas = self._conn.execute(
+                f"SELECT seq, tipo, datos FROM job_eventos WHERE job_id = ? AND seq > ? {filtro} ORDER BY seq LIMIT ?",
+                parametros
+            ).fetchall()
+        return [{"seq": seq, "tipo": tipo, "datos": json.loads(datos)} for seq, tipo, datos in filas]
+
+    def guardar_callback(
+        self,
+        job_id: str,
+        url: str,
+        payload: Dict,
+        intentos: int,
+        proximo_intento: float,
+        consumidor: Optional[str] = None,
+        lease: float = 0
+    ):
+        """
+        Inserta o actualiza un callback pendiente de entrega
+
+        Args:
+            consumidor: Proceso que lo entrega; queda reclamado por él durante el lease
+            lease: Segundos de validez del reclamo si no se renueva
+        """
+        reclamado_hasta = time.time() + lease if consumidor else None
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO callbacks (job_id, url, payload, intentos, proximo_intento, reclamado_por, reclamado_hasta)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (job_id, url, json.dumps(payload, default=str), intentos, proximo_intento, consumidor, reclamado_hasta)
+            )
+
+    def reclamar_callbacks(self, consumidor: str, lease: float) -> List[Dict]:
+        """
+        Reclama los callbacks sin dueño o con lease vencido
+
+        Args:
+            consumidor: Identificador del proceso que reclama
+            lease: Segundos de validez del reclamo si no se renueva
+
+        Returns:
+            Callbacks reclamados en orden de próximo intento
+        """
+        ahora = time.time()
+        with self._lock:
+            # Mismo patrón que reclamar(): dos procesos no entregan el mismo callback
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                filas = self._conn.execute(
+                    """
+                    SELECT job_id, url, payload, intentos, proximo_intento FROM callbacks
+                    WHERE reclamado_hasta IS NULL OR reclamado_hasta < ?
+                    ORDER BY proximo_intento
+                    """,
+                    (ahora,)
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE callbacks SET reclamado_por = ?, reclamado_hasta = ? WHERE job_id = ?",
+                    [(consumidor, ahora + lease, fila[0]) for fila in filas]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [
+            {"job_id": job_id, "url": url, "payload": json.loads(payload), "intentos": intentos, "proximo_intento": proximo}
+            for job_id, url, payload, intentos, proximo in filas
+        ]
+
+    def renovar_callbacks(self, consumidor: str, job_ids: List[str], lease: float):
+        """Extiende el lease de los callbacks que un consumidor sigue entregando (0 = soltarlos)"""
+        if not job_ids:
+            return
+        marcadores = ",".join("?" * len(job_ids))
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE callbacks SET reclamado_hasta = ? WHERE reclamado_por = ? AND job_id IN ({marcadores})",
+                [time.time() + lease, consumidor, *job_ids]
+            )
+
+    def eliminar_callback(self, job_id: str):
+        """Elimina un callback ya entregado o descartado"""
+        with self._lock:
+            self._conn.execute("DELETE FROM callbacks WHERE job_id = ?", (job_id,))
+
+    def latido(self, consumidor: str, estado: Dict, ttl: float):
+        """
+        Registra que un consumidor sigue vivo, con su estado compartido
+
+        Args:
+            consumidor: Identificador del proceso
+            estado: Estado que el proceso comparte con los demás (JSON)
+            ttl: Segundos tras los cuales, sin otro latido, se lo da por caído
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO consumidores (consumidor, estado, vence_en) VALUES (?, ?, ?)",
+                (consumidor, json.dumps(estado, default=str), time.time() + ttl)
+            )
+
+    def consumidores(self) -> Dict[str, Dict]:
+        """Estado de cada consumidor vivo (los vencidos se eliminan)"""
+        with self._lock:
+            self._conn.execute("DELETE FROM consumidores WHERE vence_en < ?", (time.time(),))
+            filas = self._conn.execute("SELECT consumidor, estado FROM consumidores").fetchall()
+        return {consumidor: json.loads(estado) for consumidor, estado in filas}
+
+    def quitar_consumidor(self, consumidor: str):
+        """Da de baja a un consumidor que se detiene"""
+        with self._lock:
+            self._conn.execute("DELETE FROM consumidores WHERE consumidor = ?", (consumidor,))
+
+    def publicar_aviso(self, tipo: str, datos: Dict) -> int:
+        """
+        Publica un aviso para todos los procesos (se conservan AVISOS_RETENCION_SEGUNDOS)
+
+        Returns:
+            Número de secuencia del aviso
+        """
+        ahora = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM avisos WHERE creado_en < ?", (ahora - AVISOS_RETENCION_SEGUNDOS,))
+            fila = self._conn.execute(
+                "INSERT INTO avisos (tipo, datos, creado_en) VALUES (?, ?, ?) RETURNING seq",
+                (tipo, json.dumps(datos, default=str), ahora)
+            ).fetchone()
+        return fila[0]
+
+    def avisos(self, despues_de: int = 0) -> List[Dict]:
+        """Avisos posteriores a una secuencia, en orden"""
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT seq, tipo, datos FROM avisos WHERE seq > ? ORDER BY seq", (despues_de,)
+            ).fetchall()
+        return [{"seq": seq, "tipo": tipo, "datos": json.loads(datos)} for seq, tipo, datos in filas]
+
+    def ultimo_aviso(self) -> int:
+        """Secuencia del último aviso publicado (0 si no hay)"""
+        with self._lock:
+            fila = self._conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'avisos'").fetchone()
+        return fila[0] if fila else 0
+
+    def close(self):
+        """Cierra la conexión"""
+        with self._lock:
+            self._conn.close()
+
+
+def crear_job_store():
+    """
+    Crea el store/broker de trabajos según configuración
+
+    Returns:
+        RedisJobStore si COLA_BROKER es "redis", JobStore (SQLite) si hay
+        JOB_STORE_PATH, o None para una cola solo en memoria
+    """
+    if settings.COLA_BROKER == "redis":
+        from job_store_redis import RedisJobStore
+        return RedisJobStore(settings.REDIS_URL, prefijo=settings.REDIS_PREFIJO)
+    if settings.JOB_STORE_PATH:
+        return JobStore(settings.JOB_STORE_PATH)
+    return None
+
+
+class ArchivoResultados:
+    """
+    Guarda resultados grandes de trabajos como JSON comprimido (gzip) en disco
+
+    Así el resultado de un trabajo "todas" no ocupa memoria del proceso; se
+    carga solo cuando alguien consulta ese trabajo.
+    """
+
+    def __init__(self, directorio: str):
+        """
+        Args:
+            directorio: Carpeta de los archivos (se crea si no existe)
+        """
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+
+    def guardar(self, job_id: str, contenido: str) -> str:
+        """
+        Escribe el resultado ya serializado de un trabajo
+
+        Returns:
+            Ruta del archivo
+        """
+        ruta = os.path.join(self.directorio, f"{job_id}.json.gz")
+        temporal = f"{ruta}.tmp"
+        with gzip.open(temporal, "wt", encoding="utf-8") as archivo:
+            archivo.write(contenido)
+        os.replace(temporal, ruta)
+        return ruta
+
+    def cargar(self, ruta: str):
+        """Lee un resultado guardado"""
+        with gzip.open(ruta, "rt", encoding="utf-8") as archivo:
+            return json.load(archivo)
+
+    def eliminar(self, ruta: str):
+        """Elimina el archivo de un resultado (si existe)"""
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,408 @@
+"""
+Store/broker de trabajos sobre Redis (o compatibles: Valkey, KeyDB)
+
+Requiere el extra opcional `redis` (uv sync --extra redis).
+"""
+import json
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from carriles import CARRILES
+from job_store import AVISOS_RETENCION_SEGUNDOS
+import logging
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+STATUS = ["pending", "processing", "completed", "failed"]
+
+# Reencola los reclamos vencidos en su carril y reclama el trabajo de menor
+# prioridad entre los carriles pedidos, en una sola operación atómica.
+# KEYS: reclamados, prioridad, reclamado_por, carril y un zset de pendientes
+# por carril (en el orden de ARGV[4..]); ARGV: ahora, vencimiento del lease,
+# consumidor y, por carril, "nombre=1" si se puede reclamar de él o "nombre=0"
+SCRIPT_RECLAMAR = """
+local carriles = {}
+for i = 4, #ARGV do
+    local nombre, permitido = string.match(ARGV[i], '^(.*)=(%d)$')
+    carriles[nombre] = {clave = KEYS[i + 1], permitido = permitido == '1'}
+end
+
+local vencidos = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, job_id in ipairs(vencidos) do
+    redis.call('ZREM', KEYS[1], job_id)
+    local prioridad = redis.call('HGET', KEYS[2], job_id)
+    local carril = carriles[redis.call('HGET', KEYS[4], job_id) or ''] or carriles['interactive']
+    if prioridad then
+        redis.call('ZADD', carril.clave, prioridad, job_id)
+    end
+end
+
+local mejor, mejor_prioridad
+for _, carril in pairs(carriles) do
+    if carril.permitido then
+        local primero = redis.call('ZRANGE', carril.clave, 0, 0, 'WITHSCORES')
+        if #primero > 0 and (not mejor_prioridad or tonumber(primero[2]) < mejor_prioridad) then
+            mejor, mejor_prioridad = carril.clave, tonumber(primero[2])
+        end
+    end
+end
+if not mejor then
+    return false
+end
+local siguiente = redis.call('ZPOPMIN', mejor)
+redis.call('ZADD', KEYS[1], ARGV[2], siguiente[1])
+redis.call('HSET', KEYS[3], siguiente[1], ARGV[3])
+return siguiente[1]
+"""
+
+# Reclama los callbacks sin dueño o con lease vencido en una sola operación atómica
+SCRIPT_RECLAMAR_CALLBACKS = """
+local reclamados = {}
+for _, job_id in ipairs(redis.call('HKEYS', KEYS[1])) do
+    local hasta = redis.call('ZSCORE', KEYS[2], job_id)
+    if (not hasta) or tonumber(hasta) < tonumber(ARGV[1]) then
+        redis.call('ZADD', KEYS[2], ARGV[2], job_id)
+        redis.call('HSET', KEYS[3], job_id, ARGV[3])
+        table.insert(reclamados, job_id)
+    end
+end
+return reclamados
+"""
+
+
+def _epoch(fecha_iso: Optional[str]) -> float:
+    return datetime.fromisoformat(fecha_iso).timestamp() if fecha_iso else time.time()
+
+
+class RedisJobStore:
+    """
+    Misma interfaz que JobStore, con Redis como almacenamiento y broker
+
+    Permite que réplicas de la API y workers en distintos nodos compartan la
+    cola. Claves (con prefijo):
+        job:{id}            documento JSON del trabajo
+        status              hash job_id -> status
+        status:{status}     zset por estado (score = creación)
+        terminados          zset de terminados (score = término)
+        pendientes:{carril} zset de la cola de cada carril (score = prioridad)
+        reclamados          zset de reclamos (score = vencimiento del lease)
+        prioridad           hash job_id -> prioridad (para reencolar)
+        carril              hash job_id -> carril (para reencolar)
+        reclamado_por       hash job_id -> consumidor
+        resultados:{id}     hash servicio_id -> resultado de sub-tarea
+        eventos:{id}        lista de eventos de progreso del trabajo
+        callbacks           hash job_id -> callback pendiente
+        cb_reclamados       zset de reclamos de callbacks (score = vencimiento del lease)
+        cb_reclamado_por    hash job_id -> consumidor que entrega el callback
+        consumidores        hash consumidor -> estado compartido (JSON)
+        consumidores_vencen zset de consumidores (score = vencimiento del latido)
+        avisos              zset de avisos entre procesos (score = secuencia)
+        avisos_seq          contador de secuencia de avisos
+    """
+
+    def __init__(self, url: str, prefijo: str = "deudas"):
+        """
+        Args:
+            url: URL de conexión (redis://host:6379/0)
+            prefijo: Prefijo de todas las claves
+        """
+        if redis is None:
+            raise RuntimeError(
+                "COLA_BROKER=redis requiere el paquete 'redis', que no está instalado: "
+                "instalarlo con `uv sync --extra redis` (o `pip install redis`) o usar COLA_BROKER=sqlite"
+            )
+
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._prefijo = prefijo
+        self._reclamar = self._redis.register_script(SCRIPT_RECLAMAR)
+        self._reclamar_callbacks = self._redis.register_script(SCRIPT_RECLAMAR_CALLBACKS)
+        self._migrar_pendientes()
+
+    def _k(self, *partes) -> str:
+        return ":".join([self._prefijo, *[str(p) for p in partes]])
+
+    def _migrar_pendientes(self):
+        """Reparte la cola de un solo zset (anterior a los carriles) en la de cada carril"""
+        legado = self._k("pendientes")
+        for job_id, prioridad in self._redis.zrange(legado, 0, -1, withscores=True):
+            job = self.obtener(job_id) or {}
+            carril = job.get("carril") or ("background" if job.get("tipo") == "todas" else "interactive")
+            pipe = self._redis.pipeline()
+            pipe.hset(self._k("carril"), job_id, carril)
+            pipe.zadd(self._k("pendientes", carril), {job_id: prioridad})
+            pipe.zrem(legado, job_id)
+            pipe.execute()
+
+    def guardar(self, job: Dict):
+        """Inserta o actualiza un trabajo"""
+        job_id = job["job_id"]
+        anterior = self._redis.hget(self._k("status"), job_id)
+
+        pipe = self._redis.pipeline()
+        pipe.set(self._k("job", job_id), json.dumps(job, default=str))
+        pipe.hset(self._k("status"), job_id, job["status"])
+        if anterior and anterior != job["status"]:
+            pipe.zrem(self._k("status", anterior), job_id)
+        pipe.zadd(self._k("status", job["status"]), {job_id: _epoch(job["created_at"])})
+        if job["status"] in ("completed", "failed"):
+            pipe.zadd(self._k("terminados"), {job_id: _epoch(job.get("completed_at"))})
+        pipe.execute()
+
+    def publicar(self, job: Dict, prioridad: float):
+        """Guarda un trabajo nuevo y lo deja disponible para los consumidores"""
+        self.guardar(job)
+        pipe = self._redis.pipeline()
+        pipe.hset(self._k("prioridad"), job["job_id"], prioridad)
+        pipe.hset(self._k("carril"), job["job_id"], job["carril"])
+        pipe.zadd(self._k("pendientes", job["carril"]), {job["job_id"]: prioridad})
+        pipe.execute()
+
+    def reclamar(self, consumidor: str, lease: float, carriles: Optional[List[str]] = None) -> Optional[Dict]:
+        """Reclama el siguiente trabajo disponible (o con lease vencido), solo de `carriles` si se indican"""
+        ahora = time.time()
+        permitidos = CARRILES if carriles is None else carriles
+        job_id = self._reclamar(
+            keys=[
+                self._k("reclamados"), self._k("prioridad"), self._k("reclamado_por"), self._k("carril"),
+                *[self._k("pendientes", carril) for carril in CARRILES]
+            ],
+            args=[ahora, ahora + lease, consumidor, *[f"{carril}={int(carril in permitidos)}" for carril in CARRILES]]
+        )
+        return self.obtener(job_id) if job_id else None
+
+    def renovar(self, consumidor: str, job_ids: List[str], lease: float):
+        """Extiende el lease de los trabajos que un consumidor sigue procesando"""
+        if not job_ids:
+            return
+        duenos = self._redis.hmget(self._k("reclamado_por"), job_ids)
+        propios = {job_id: time.time() + lease for job_id, dueno in zip(job_ids, duenos) if dueno == consumidor}
+        if propios:
+            self._redis.zadd(self._k("reclamados"), propios, xx=True)
+
+    def liberar(self, job_id: str):
+        """Saca de la cola un trabajo terminado"""
+        pipe = self._redis.pipeline()
+        pipe.zrem(self._k("reclamados"), job_id)
+        for carril in CARRILES:
+            pipe.zrem(self._k("pendientes", carril), job_id)
+        pipe.hdel(self._k("prioridad"), job_id)
+        pipe.hdel(self._k("carril"), job_id)
+        pipe.hdel(self._k("reclamado_por"), job_id)
+        pipe.execute()
+
+    def posicion(self, job_id: str) -> Optional[int]:
+        """
+        Posición de un trabajo pendiente en la cola compartida (1 = el próximo)
+
+        Un ZCOUNT por carril: O(log n) en Redis, sin índice en memoria.
+        """
+        carril = self._redis.hget(self._k("carril"), job_id)
+        prioridad = self._redis.zscore(self._k("pendientes", carril), job_id) if carril else None
+        if prioridad is None:
+            return None
+
+        # Los pendientes de todos los carriles comparten la escala de prioridad
+        pipe = self._redis.pipeline()
+        for otro in CARRILES:
+            pipe.zcount(self._k("pendientes", otro), "-inf", f"({prioridad}")
+        return sum(pipe.execute()) + 1
+
+    def conteos(self) -> Dict[str, int]:
+        """Cantidad de trabajos por estado"""
+        pipe = self._redis.pipeline()
+        for status in STATUS:
+            pipe.zcard(self._k("status", status))
+        return {status: total for status, total in zip(STATUS, pipe.execute()) if total}
+
+    def obtener(self, job_id: str) -> Optional[Dict]:
+        """Obtiene un trabajo por su ID"""
+        datos = self._redis.get(self._k("job", job_id))
+        return json.loads(datos) if datos else None
+
+    def listar(
+        self,
+        status: Optional[List[str]] = None,
+        limite: Optional[int] = None,
+        recientes: bool = False
+    ) -> List[Dict]:
+        """Lista trabajos en orden de creación"""
+        ids = []
+        for estado in status or STATUS:
+            ids.extend(self._redis.zrange(self._k("status", estado), 0, -1, withscores=True))
+        ids.sort(key=lambda par: par[1], reverse=recientes)
+        if limite is not None:
+            ids = ids[:limite]
+        if not ids:
+            return []
+
+        documentos = self._redis.mget([self._k("job", job_id) for job_id, _ in ids])
+        return [json.loads(datos) for datos in documentos if datos]
+
+    def eliminar(self, job_id: str):
+        """Elimina un trabajo y sus resultados parciales"""
+        pipe = self._redis.pipeline()
+        pipe.delete(self._k("job", job_id), self._k("resultados", job_id), self._k("eventos", job_id))
+        pipe.hdel(self._k("status"), job_id)
+        for status in STATUS:
+            pipe.zrem(self._k("status", status), job_id)
+        pipe.zrem(self._k("terminados"), job_id)
+        pipe.execute()
+        self.liberar(job_id)
+
+    def eliminar_terminados(self, antes_de: Optional[str] = None, conservar: Optional[int] = None) -> List[Dict]:
+        """Elimina trabajos terminados por antigüedad y/o sobre una cantidad máxima"""
+        ids = set()
+        if antes_de is not None:
+            ids.update(self._redis.zrangebyscore(self._k("terminados"), "-inf", _epoch(antes_de)))
+        if conservar is not None:
+            sobrantes = self._redis.zcard(self._k("terminados")) - conservar
+            if sobrantes > 0:
+                ids.update(self._redis.zrange(self._k("terminados"), 0, sobrantes - 1))
+
+        eliminados = []
+        for job_id in ids:
+            job = self.obtener(job_id)
+            self.eliminar(job_id)
+            if job:
+                eliminados.append(job)
+        return eliminados
+
+    def guardar_resultado(self, job_id: str, servicio_id: int, resultado: Dict):
+        """Guarda el resultado de una sub-tarea (un servicio) de un trabajo"""
+        self._redis.hset(self._k("resultados", job_id), servicio_id, json.dumps(resultado, default=str))
+
+    def resultados(self, job_id: str) -> Dict[int, Dict]:
+        """Resultados parciales ya guardados de un trabajo, por servicio_id"""
+        filas = self._redis.hgetall(self._k("resultados", job_id))
+        return {int(servicio_id): json.loads(datos) for servicio_id, datos in filas.items()}
+
+    def eliminar_resultados(self, job_id: str):
+        """Elimina los resultados parciales de un trabajo (ya agregados en el padre)"""
+        self._redis.delete(self._k("resultados", job_id))
+
+    def agregar_evento(self, job_id: str, tipo: str, datos: Dict) -> int:
+        """Agrega un evento al historial de un trabajo y retorna su secuencia"""
+        return self._redis.rpush(self._k("eventos", job_id), json.dumps({"tipo": tipo, "datos": datos}, default=str))
+
+    def eventos(
+        self,
+        job_id: str,
+        despues_de: int = 0,
+        tipo: Optional[str] = None,
+        limite: Optional[int] = None
+    ) -> List[Dict]:
+        """Eventos de un trabajo posteriores a una secuencia (opcionalmente de un tipo)"""
+        filas = self._redis.lrange(self._k("eventos", job_id), despues_de, -1)
+        eventos = [{"seq": despues_de + i + 1, **json.loads(fila)} for i, fila in enumerate(filas)]
+        if tipo:
+            eventos = [evento for evento in eventos if evento["tipo"] == tipo]
+        return eventos[:limite] if limite is not None else eventos
+
+    def guardar_callback(
+        self,
+        job_id: str,
+        url: str,
+        payload: Dict,
+        intentos: int,
+        proximo_intento: float,
+        consumidor: Optional[str] = None,
+        lease: float = 0
+    ):
+        """Inserta o actualiza un callback pendiente, reclamado por `consumidor` durante el lease"""
+        pipe = self._redis.pipeline()
+        pipe.hset(self._k("callbacks"), job_id, json.dumps({
+            "job_id": job_id,
+            "url": url,
+            "payload": payload,
+            "intentos": intentos,
+            "proximo_intento": proximo_intento
+        }, default=str))
+        if consumidor:
+            pipe.zadd(self._k("cb_reclamados"), {job_id: time.time() + lease})
+            pipe.hset(self._k("cb_reclamado_por"), job_id, consumidor)
+        pipe.execute()
+
+    def reclamar_callbacks(self, consumidor: str, lease: float) -> List[Dict]:
+        """Reclama los callbacks sin dueño o con lease vencido, en orden de próximo intento"""
+        ahora = time.time()
+        job_ids = self._reclamar_callbacks(
+            keys=[self._k("callbacks"), self._k("cb_reclamados"), self._k("cb_reclamado_por")],
+            args=[ahora, ahora + lease, consumidor]
+        )
+        if not job_ids:
+            return []
+        entradas = [json.loads(datos) for datos in self._redis.hmget(self._k("callbacks"), job_ids) if datos]
+        return sorted(entradas, key=lambda e: e["proximo_intento"])
+
+    def renovar_callbacks(self, consumidor: str, job_ids: List[str], lease: float):
+        """Extiende el lease de los callbacks que un consumidor sigue entregando (0 = soltarlos)"""
+        if not job_ids:
+            return
+        duenos = self._redis.hmget(self._k("cb_reclamado_por"), job_ids)
+        propios = {job_id: time.time() + lease for job_id, dueno in zip(job_ids, duenos) if dueno == consumidor}
+        if propios:
+            self._redis.zadd(self._k("cb_reclamados"), propios, xx=True)
+
+    def eliminar_callback(self, job_id: str):
+        """Elimina un callback ya entregado o descartado"""
+        pipe = self._redis.pipeline()
+        pipe.hdel(self._k("callbacks"), job_id)
+        pipe.zrem(self._k("cb_reclamados"), job_id)
+        pipe.hdel(self._k("cb_reclamado_por"), job_id)
+        pipe.execute()
+
+    def latido(self, consumidor: str, estado: Dict, ttl: float):
+        """Registra que un consumidor sigue vivo, con su estado compartido"""
+        pipe = self._redis.pipeline()
+        pipe.hset(self._k("consumidores"), consumidor, json.dumps(estado, default=str))
+        pipe.zadd(self._k("consumidores_vencen"), {consumidor: time.time() + ttl})
+        pipe.execute()
+
+    def consumidores(self) -> Dict[str, Dict]:
+        """Estado de cada consumidor vivo (los vencidos se eliminan)"""
+        vencidos = self._redis.zrangebyscore(self._k("consumidores_vencen"), "-inf", time.time())
+        if vencidos:
+            pipe = self._redis.pipeline()
+            pipe.zrem(self._k("consumidores_vencen"), *vencidos)
+            pipe.hdel(self._k("consumidores"), *vencidos)
+            pipe.execute()
+        filas = self._redis.hgetall(self._k("consumidores"))
+        return {consumidor: json.loads(estado) for consumidor, estado in filas.items()}
+
+    def quitar_consumidor(self, consumidor: str):
+        """Da de baja a un consumidor que se detiene"""
+        pipe = self._redis.pipeline()
+        pipe.zrem(self._k("consumidores_vencen"), consumidor)
+        pipe.hdel(self._k("consumidores"), consumidor)
+        pipe.execute()
+
+    def publicar_aviso(self, tipo: str, datos: Dict) -> int:
+        """Publica un aviso para todos los procesos y retorna su secuencia"""
+        ahora = time.time()
+        seq = self._redis.incr(self._k("avisos_seq"))
+        aviso = json.dumps({"seq": seq, "tipo": tipo, "datos": datos, "creado_en": ahora}, default=str)
+        self._redis.zadd(self._k("avisos"), {aviso: seq})
+        # Podar los avisos más viejos que la retención
+        for viejo in self._redis.zrange(self._k("avisos"), 0, 99):
+            if json.loads(viejo)["creado_en"] >= ahora - AVISOS_RETENCION_SEGUNDOS:
+                break
+            self._redis.zrem(self._k("avisos"), viejo)
+        return seq
+
+    def avisos(self, despues_de: int = 0) -> List[Dict]:
+        """Avisos posteriores a una secuencia, en orden"""
+        filas = self._redis.zrangebyscore(self._k("avisos"), f"({despues_de}", "+inf")
+        return [{clave: aviso[clave] for clave in ("seq", "tipo", "datos")} for aviso in map(json.loads, filas)]
+
+    def ultimo_aviso(self) -> int:
+        """Secuencia del último aviso publicado (0 si no hay)"""
+        return int(self._redis.get(self._k("avisos_seq")) or 0)
+
+    def close(self):
+        """Cierra la conexión"""
+        self._redis.close()
@@ -0,0 +1,219 @@
+"""
+Límites del agente por empresa aprendidos de corridas anteriores
+
+step_timeout, max_failures y max_actions_per_step salen de los perfiles de
+corridas exitosas guardados en consultas_deuda.metadata["perfil"] (percentil
+más un margen), con columnas opcionales de empresas_servicio que tienen
+prioridad y Settings como valor por defecto.
+"""
+import asyncio
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from database import db
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Columnas opcionales de empresas_servicio que fijan cada límite a mano
+COLUMNAS_OVERRIDE = {
+    "step_timeout": "agente_step_timeout",
+    "max_failures": "agente_max_failures",
+    "max_actions_per_step": "agente_max_acciones_paso"
+}
+
+
+def _percentil(valores: List[float], percentil: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * percentil))]
+
+
+class LimitesAgente:
+    """
+    Calcula y sirve los límites del Agent de cada empresa
+
+    Solo se aprende de corridas exitosas: el máximo de cada corrida (paso más
+    lento, pasos con error, acciones en un paso) es lo que esa corrida
+    necesitó para terminar, así que un percentil alto de esos máximos más un
+    margen corta antes las corridas colgadas sin hacer fallar las que
+    habrían terminado. Como el margen deja el límite por encima del
+    percentil, las corridas cortadas por el límite no lo desplazan hacia abajo.
+    Solo las corridas del agente guardan perfil: los scripts y las trazas
+    no usan estos límites (salvo el step_timeout de una traza, que corre
+    pasos ya conocidos) y sus tiempos subestimarían lo que necesita el agente.
+    """
+
+    def __init__(
+        self,
+        percentil: float = 0.95,
+        margen: float = 0.5,
+        min_corridas: int = 10,
+        dias: int = 14,
+        ttl_segundos: int = 3600
+    ):
+        """
+        Args:
+            percentil: Percentil de los máximos por corrida (0-1)
+            margen: Fracción que se suma sobre el percentil (0.5 = +50%)
+            min_corridas: Corridas exitosas mínimas para aprender los límites de una empresa
+            dias: Días de historial a considerar
+            ttl_segundos: Cada cuánto se recalculan los límites
+        """
+        self.percentil = percentil
+        self.margen = margen
+        self.min_corridas = min_corridas
+        self.dias = dias
+        self.ttl_segundos = ttl_segundos
+        self._aprendidos: Dict[str, Dict] = {}
+        self._cargado_en: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def por_defecto(self) -> Dict:
+        """Límites globales de Settings"""
+        return {
+            "step_timeout": settings.STEP_TIMEOUT,
+            "max_failures": settings.MAX_FAILURES,
+            "max_actions_per_step": settings.MAX_ACTIONS_PER_STEP
+        }
+
+    def _acotar(self, limite: str, valor: float) -> int:
+        """Redondea hacia arriba y limita a [mínimo, global × AGENTE_LIMITES_FACTOR_MAX]"""
+        minimos = {
+            "step_timeout": settings.AGENTE_LIMITES_STEP_TIMEOUT_MIN,
+            # Un solo fallo transitorio no debería cortar la corrida aunque el historial no tenga ninguno
+            "max_failures": min(2, settings.MAX_FAILURES),
+            "max_actions_per_step": 1
+        }
+        minimo = minimos[limite]
+        maximo = max(minimo, int(self.por_defecto()[limite] * settings.AGENTE_LIMITES_FACTOR_MAX))
+        return max(minimo, min(maximo, math.ceil(valor)))
+
+    def calcular(self, perfiles: List[Dict]) -> Optional[Dict]:
+        """
+        Calcula los límites de una empresa a partir de sus perfiles
+
+        Args:
+            perfiles: Perfiles de corridas del agente (ver perfil_agente.construir_perfil)
+
+        Returns:
+            Dict con los límites aprendidos (solo los que tienen datos) y
+            'corridas', o None si no hay suficientes corridas exitosas
+        """
+        exitosas = [p for p in perfiles if not p.get("causa_fallo") and p.get("pasos_segundos")]
+        if len(exitosas) < self.min_corridas:
+            return None
+
+        factor = 1 + self.margen
+        paso_mas_lento = [max(p["pasos_segundos"]) for p in exitosas]
+        pasos_con_error = [p.get("pasos_con_error", 0) for p in exitosas]
+        limites = {
+            "step_timeout": self._acotar("step_timeout", _percentil(paso_mas_lento, self.percentil) * factor),
+            # max_failures cuenta fallos consecutivos: con uno más que los pasos
+            # con error que tuvo una corrida exitosa, esa corrida no se corta
+            "max_failures": self._acotar("max_failures", _percentil(pasos_con_error, self.percentil) * factor + 1),
+            "corridas": len(exitosas)
+        }
+
+        # Perfiles anteriores a acciones_por_paso_max no sirven para este límite
+        acciones = [p["acciones_por_paso_max"] for p in exitosas if p.get("acciones_por_paso_max")]
+        if len(acciones) >= self.min_corridas:
+            limites["max_actions_per_step"] = self._acotar(
+                "max_actions_per_step", _percentil(acciones, self.percentil) * factor
+            )
+
+        return limites
+
+    def _vigente(self) -> bool:
+        return self._cargado_en is not None and (time.monotonic() - self._cargado_en) < self.ttl_segundos
+
+    async def refresh(self):
+        """Recalcula los límites de todas las empresas desde el historial"""
+        async with self._lock:
+            await self._cargar()
+
+    async def _cargar(self):
+        # Si la consulta falla se conservan los límites anteriores hasta el próximo TTL
+        self._cargado_en = time.monotonic()
+        try:
+            filas = await db.get_perfiles_agente(datetime.now() - timedelta(days=self.dias))
+        except Exception as e:
+            logger.warning(f"No se pudieron cargar los perfiles para los límites del agente: {str(e)}")
+            return
+
+        por_empresa: Dict[str, List[Dict]] = {}
+        for fila in filas:
+            if fila.get("empresa") and fila.get("perfil"):
+                por_empresa.setdefault(fila["empresa"], []).append(fila["perfil"])
+
+        aprendidos = {}
+        for empresa, perfiles in por_empresa.items():
+            limites = self.calcular(perfiles)
+            if limites:
+                aprendidos[empresa] = limites
+
+        self._aprendidos = aprendidos
+        logger.info(f"Límites del agente recalculados: {len(aprendidos)} empresas con historial suficiente")
+
+    async def obtener(self, empresa_info: Optional[Dict]) -> Dict:
+        """
+        Límites a usar para el Agent de una empresa
+
+        Prioridad por límite: columna de empresas_servicio, valor aprendido y
+        luego Settings.
+
+        Args:
+            empresa_info: Registro de empresas_servicio (None = límites globales)
+
+        Returns:
+            Dict con step_timeout, max_failures, max_actions_per_step y
+            'origen' de cada uno ("empresa", "aprendido" o "global")
+        """
+        limites = self.por_defecto()
+        origen = dict.fromkeys(limites, "global")
+        if not empresa_info:
+            return {**limites, "origen": origen}
+
+        if settings.AGENTE_LIMITES_ADAPTATIVOS:
+            if not self._vigente():
+                async with self._lock:
+                    # Otro llamador pudo haber recalculado mientras esperábamos el lock
+                    if not self._vigente():
+                        await self._cargar()
+
+            aprendidos = self._aprendidos.get(empresa_info.get("nombre"), {})
+            for limite in limites:
+                if limite in aprendidos:
+                    limites[limite] = aprendidos[limite]
+                    origen[limite] = "aprendido"
+
+        for limite, columna in COLUMNAS_OVERRIDE.items():
+            if empresa_info.get(columna):
+                limites[limite] = int(empresa_info[columna])
+                origen[limite] = "empresa"
+
+        return {**limites, "origen": origen}
+
+    def stats(self) -> Dict:
+        """Límites aprendidos por empresa y configuración del cálculo"""
+        return {
+            "habilitado": settings.AGENTE_LIMITES_ADAPTATIVOS,
+            "percentil": self.percentil,
+            "margen": self.margen,
+            "min_corridas": self.min_corridas,
+            "dias": self.dias,
+            "edad_segundos": round(time.monotonic() - self._cargado_en, 1) if self._cargado_en else None,
+            "global": self.por_defecto(),
+            "empresas": self._aprendidos
+        }
+
+
+# Singleton instance
+limites_agente = LimitesAgente(
+    percentil=settings.AGENTE_LIMITES_PERCENTIL,
+    margen=settings.AGENTE_LIMITES_MARGEN,
+    min_corridas=settings.AGENTE_LIMITES_MIN_CORRIDAS,
+    dias=settings.AGENTE_LIMITES_DIAS,
+    ttl_segundos=settings.AGENTE_LIMITES_TTL
+)
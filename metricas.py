@@ -0,0 +1,218 @@
+"""
+Métricas de Prometheus (contadores, gauges e histogramas) sobre prometheus_client
+
+Cada proceso (API o worker.py) expone sus propias métricas y Prometheus las
+agrega por instancia. Con varios procesos de uvicorn (API_WORKERS > 1) se
+define PROMETHEUS_MULTIPROC_DIR y cada scrape suma los de todos.
+"""
+import asyncio
+import os
+from typing import Callable, List, Optional, Tuple
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, start_http_server
+from prometheus_client.exposition import choose_encoder
+from prometheus_client.multiprocess import MultiProcessCollector
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Buckets en segundos: desde llamadas a BD (ms) hasta esperas en cola (horas)
+BUCKETS_SEGUNDOS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600
+)
+
+
+class _Recolectores:
+    """Colector sin métricas propias que corre los recolectores antes de cada scrape"""
+
+    def __init__(self):
+        self.funciones: List[Callable[[], None]] = []
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def describe(self):
+        # Sin describe(), registrarlo llamaría a collect() en el import
+        return []
+
+    def collect(self):
+        try:
+            asyncio.get_running_loop()
+            en_otro_hilo = False
+        except RuntimeError:
+            en_otro_hilo = True
+
+        if en_otro_hilo and self.loop and self.loop.is_running():
+            # El servidor de worker.py atiende en su propio hilo: el estado
+            # de la cola y de los circuitos se lee en el loop que lo modifica
+            async def recolectar():
+                self.recolectar()
+            try:
+                asyncio.run_coroutine_threadsafe(recolectar(), self.loop).result(timeout=5)
+            except Exception as e:
+                logger.warning(f"Error actualizando métricas: {str(e)}")
+        else:
+            self.recolectar()
+        return []
+
+    def recolectar(self):
+        for funcion in self.funciones:
+            try:
+                funcion()
+            except Exception as e:
+                logger.warning(f"Error actualizando métricas: {str(e)}")
+
+
+class RegistroMetricas:
+    """Conjunto de métricas del proceso"""
+
+    def __init__(self):
+        self.registro = CollectorRegistry()
+        self._recolectores = _Recolectores()
+        # Primero: así los gauges quedan al día antes de leer las demás métricas
+        self.registro.register(self._recolectores)
+
+    def contador(self, nombre: str, ayuda: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return Counter(nombre, ayuda, labels, registry=self.registro)
+
+    def gauge(self, nombre: str, ayuda: str, labels: Tuple[str, ...] = (), modo: str = "livesum") -> Gauge:
+        """
+        Args:
+            modo: Cómo se combinan los valores de cada proceso en modo
+                multiproceso (ej: livesum, mostrecent)
+        """
+        return Gauge(nombre, ayuda, labels, registry=self.registro, multiprocess_mode=modo)
+
+    def histograma(
+        self,
+        nombre: str,
+        ayuda: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = BUCKETS_SEGUNDOS
+    ) -> Histogram:
+        return Histogram(nombre, ayuda, labels, registry=self.registro, buckets=buckets)
+
+    def al_exponer(self, recolector: Callable[[], None]):
+        """
+        Registra una función que actualiza gauges justo antes de cada scrape
+
+        Args:
+            recolector: Función sin argumentos (ej: lee el estado de la cola)
+        """
+        self._recolectores.funciones.append(recolector)
+
+    def exponer(self, accept: Optional[str] = None) -> Tuple[bytes, str]:
+        """
+        Todas las métricas en el formato que pide el scraper
+
+        Args:
+            accept: Header Accept del scrape (texto de Prometheus u OpenMetrics)
+
+        Returns:
+            Tupla (cuerpo, content type)
+        """
+        registro = self.registro
+        if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            # Varios procesos de uvicorn: sumar los archivos de todos
+            registro = CollectorRegistry()
+            registro.register(self._recolectores)
+            MultiProcessCollector(registro)
+        codificar, tipo = choose_encoder(accept or "")
+        return codificar(registro), tipo
+
+    def servir(self, puerto: int, host: str = "0.0.0.0"):
+        """
+        Servidor HTTP de /metrics para procesos sin API (como worker.py)
+
+        Args:
+            puerto: Puerto donde escuchar
+            host: Interfaz donde escuchar
+
+        Returns:
+            Servidor ya escuchando en su propio hilo (detener con shutdown())
+        """
+        self._recolectores.loop = asyncio.get_running_loop()
+        servidor, _ = start_http_server(puerto, host, registry=self.registro)
+        logger.info(f"Métricas disponibles en http://{host}:{puerto}/metrics")
+        return servidor
+
+
+# Singleton instance
+metricas = RegistroMetricas()
+
+# Cola de trabajos
+cola_espera = metricas.histograma(
+    "deudas_cola_espera_segundos",
+    "Tiempo desde que un trabajo se encola hasta que un worker lo toma",
+    ("carril", "tipo")
+)
+cola_trabajos = metricas.gauge(
+    "deudas_cola_trabajos",
+    "Trabajos por estado en todo el broker (lo exporta solo la API: no sumar entre instancias)",
+    ("status",),
+    modo="mostrecent"
+)
+cola_pendientes_carril = metricas.gauge(
+    "deudas_cola_pendientes_carril",
+    "Trabajos y sub-tareas esperando en cada carril local de este proceso",
+    ("carril",)
+)
+trabajos_terminados = metricas.contador(
+    "deudas_trabajos_total",
+    "Trabajos terminados por tipo y resultado",
+    ("tipo", "status")
+)
+
+# Consultas de deuda (script, traza o agente)
+agente_duracion = metricas.histograma(
+    "deudas_agente_duracion_segundos",
+    "Duración de cada consulta de deuda por compañía y fuente (script, traza o agente)",
+    ("compania", "fuente")
+)
+agente_pasos = metricas.histograma(
+    "deudas_agente_pasos",
+    "Pasos que usó cada corrida del agente LLM por compañía",
+    ("compania",),
+    buckets=(1, 2, 3, 5, 8, 10, 15, 20, 30, 50, 100)
+)
+consultas = metricas.contador(
+    "deudas_consultas_total",
+    "Consultas de deuda por compañía y resultado",
+    ("compania", "resultado")
+)
+
+circuito_estado = metricas.gauge(
+    "deudas_circuito_estado",
+    "Circuit breaker por compañía: 0 cerrado, 1 semi-abierto, 2 abierto",
+    ("compania",),
+    modo="livemax"
+)
+
+agentes_en_uso = metricas.gauge(
+    "deudas_agentes_en_uso",
+    "Cupos del presupuesto global de agentes en uso"
+)
+browsers_en_uso = metricas.gauge(
+    "deudas_browsers_en_uso",
+    "Browsers del pool prestados a una consulta"
+)
+
+# Base de datos
+db_latencia = metricas.histograma(
+    "deudas_db_latencia_segundos",
+    "Latencia de cada llamada a Supabase por método de SupabaseClient",
+    ("metodo", "resultado")
+)
+
+# Callbacks
+callback_latencia = metricas.histograma(
+    "deudas_callback_latencia_segundos",
+    "Latencia de cada intento de entrega de callback",
+    ("resultado",)
+)
+callback_reintentos = metricas.contador(
+    "deudas_callback_reintentos_total",
+    "Reintentos de entrega de callbacks"
+)
+callbacks = metricas.contador(
+    "deudas_callbacks_total",
+    "Callbacks terminados por resultado (enviado o fallido)",
+    ("resultado",)
+)
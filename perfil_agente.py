@@ -0,0 +1,158 @@
+"""
+Perfil compacto de cada corrida del agente browser-use
+
+Resume el AgentHistoryList de una corrida (pasos, tiempo por paso, llamadas y
+tokens del LLM, tiempo de navegación y causa de fallo) para guardarlo en
+consultas_deuda.metadata["perfil"], y agrega esos perfiles por empresa.
+"""
+import asyncio
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+# Acciones cuyo paso se cuenta como tiempo de navegación
+ACCIONES_NAVEGACION = {"navigate", "go_back", "search", "switch"}
+
+# Largo máximo del detalle de fallo guardado en el perfil
+MAX_DETALLE = 300
+
+
+def _percentil(valores: List[float], percentil: float) -> Optional[float]:
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * percentil))]
+
+
+def _promedio(valores: List[float]) -> Optional[float]:
+    return round(sum(valores) / len(valores), 2) if valores else None
+
+
+def causa_de_fallo(history, excepcion: Optional[BaseException] = None, resultado_valido: bool = True) -> Optional[str]:
+    """
+    Clasifica por qué una corrida no obtuvo la deuda
+
+    Args:
+        history: AgentHistoryList de la corrida (o None si no llegó a correr)
+        excepcion: Excepción que cortó la corrida, si hubo
+        resultado_valido: False si el agente terminó pero su resultado no tenía la deuda
+
+    Returns:
+        "timeout", "excepcion", "sin_terminar" (agotó pasos o fallos),
+        "agente_sin_exito", "resultado_invalido" o None si no falló
+    """
+    if excepcion is not None:
+        return "timeout" if isinstance(excepcion, asyncio.TimeoutError) else "excepcion"
+    if history is None or not history.is_done():
+        return "sin_terminar"
+    if history.is_successful() is False:
+        return "agente_sin_exito"
+    if not resultado_valido:
+        return "resultado_invalido"
+    return None
+
+
+def ultimo_error(history) -> Optional[str]:
+    """Último error de un paso del historial, o None si ningún paso falló"""
+    errores = [e for e in history.errors() if e] if history else []
+    return errores[-1] if errores else None
+
+
+def construir_perfil(history, causa: Optional[str] = None, detalle: Optional[str] = None) -> Dict:
+    """
+    Arma el perfil de una corrida a partir de su historial
+
+    Args:
+        history: AgentHistoryList de la corrida (puede ser None)
+        causa: Causa de fallo (ver causa_de_fallo) o None si tuvo éxito
+        detalle: Mensaje de error asociado al fallo
+
+    Returns:
+        Dict serializable a JSON con pasos, tiempos, LLM y fallo
+    """
+    items = history.history if history else []
+    pasos_segundos = []
+    navegacion = 0.0
+    acciones = Counter()
+    acciones_por_paso_max = 0
+    pasos_con_error = 0
+
+    for item in items:
+        duracion = item.metadata.duration_seconds if item.metadata else 0.0
+        pasos_segundos.append(round(duracion, 2))
+
+        nombres = [
+            next(iter(accion.model_dump(exclude_none=True)), "desconocida")
+            for accion in (item.model_output.action if item.model_output else [])
+        ]
+        acciones.update(nombres)
+        acciones_por_paso_max = max(acciones_por_paso_max, len(nombres))
+        if ACCIONES_NAVEGACION.intersection(nombres):
+            navegacion += duracion
+        if any(r.error for r in item.result):
+            pasos_con_error += 1
+
+    usage = history.usage if history else None
+    if detalle is None and causa:
+        # Sin excepción propia, el último error de un paso explica el fallo
+        detalle = ultimo_error(history)
+
+    return {
+        "pasos": len(items),
+        "duracion_segundos": round(sum(pasos_segundos), 2),
+        "pasos_segundos": pasos_segundos,
+        "navegacion_segundos": round(navegacion, 2),
+        "acciones": dict(acciones),
+        "acciones_por_paso_max": acciones_por_paso_max,
+        "pasos_con_error": pasos_con_error,
+        "llamadas_llm": usage.entry_count if usage else sum(1 for item in items if item.model_output),
+        "tokens_prompt": usage.total_prompt_tokens if usage else None,
+        "tokens_completion": usage.total_completion_tokens if usage else None,
+        "tokens_total": usage.total_tokens if usage else None,
+        "costo": round(usage.total_cost, 6) if usage and usage.total_cost else None,
+        "causa_fallo": causa,
+        "detalle_fallo": detalle[:MAX_DETALLE] if detalle else None
+    }
+
+
+def resumir_perfiles(filas: List[Dict]) -> List[Dict]:
+    """
+    Agrega perfiles de corridas por empresa
+
+    Args:
+        filas: Dicts con 'empresa' y 'perfil' (de consultas_deuda.metadata)
+
+    Returns:
+        Resumen por empresa, ordenado por pasos totales (las que más gastan primero)
+    """
+    por_empresa = defaultdict(list)
+    for fila in filas:
+        if fila.get("perfil"):
+            por_empresa[fila.get("empresa") or "desconocida"].append(fila["perfil"])
+
+    resumen = []
+    for empresa, perfiles in por_empresa.items():
+        pasos = [p["pasos"] for p in perfiles]
+        duraciones = [p["duracion_segundos"] for p in perfiles]
+        tokens = [p["tokens_total"] for p in perfiles if p.get("tokens_total") is not None]
+        acciones = Counter()
+        for p in perfiles:
+            acciones.update(p.get("acciones") or {})
+
+        resumen.append({
+            "empresa": empresa,
+            "corridas": len(perfiles),
+            "fallidas": sum(1 for p in perfiles if p.get("causa_fallo")),
+            "pasos_total": sum(pasos),
+            "pasos_promedio": _promedio(pasos),
+            "pasos_p95": _percentil(pasos, 0.95),
+            "duracion_promedio_segundos": _promedio(duraciones),
+            "duracion_p95_segundos": _percentil(duraciones, 0.95),
+            "navegacion_promedio_segundos": _promedio([p.get("navegacion_segundos", 0) for p in perfiles]),
+            "llamadas_llm_promedio": _promedio([p.get("llamadas_llm", 0) for p in perfiles]),
+            "tokens_promedio": _promedio(tokens),
+            "tokens_total": sum(tokens) if tokens else None,
+            "acciones_frecuentes": dict(acciones.most_common(5)),
+            "causas_fallo": dict(Counter(p["causa_fallo"] for p in perfiles if p.get("causa_fallo")))
+        })
+
+    return sorted(resumen, key=lambda r: r["pasos_total"], reverse=True)
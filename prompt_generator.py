@@ -2,6 +2,7 @@
 Generador dinámico de prompts para consultar deudas de servicios
 """
 from typing import Dict
+from extractores import url_portal
 
 
 class PromptGenerator:
@@ -58,7 +59,7 @@ class PromptGenerator:
         identificador = servicio.get("credenciales", {}).get("identificador", "")
 
         return PromptGenerator.generate_prompt(
-            url=empresa_info["url_servipag"],
+            url=url_portal(empresa_info),
             identificador=identificador,
             campo_identificador=empresa_info["campo_identificador"]
         )
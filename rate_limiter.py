@@ -0,0 +1,123 @@
+"""
+Límites de tasa por compañía (token bucket) para respetar los portales de Servipag
+"""
+import asyncio
+import time
+from typing import Dict, Optional
+from config import settings
+from coordinacion import coordinador
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket asíncrono: permite ráfagas de hasta `capacidad` consultas y
+    luego una tasa sostenida de `tasa_por_minuto`
+    """
+
+    def __init__(self, tasa_por_minuto: float, capacidad: int):
+        self.tasa_por_minuto = tasa_por_minuto
+        self.capacidad = capacidad
+        self._tokens = float(capacidad)
+        self._actualizado = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def configurar(self, tasa_por_minuto: float, capacidad: int):
+        """Actualiza la tasa y capacidad sin perder los tokens acumulados"""
+        self._rellenar()
+        self.tasa_por_minuto = tasa_por_minuto
+        self.capacidad = capacidad
+        self._tokens = min(self._tokens, float(capacidad))
+
+    def _rellenar(self):
+        ahora = time.monotonic()
+        self._tokens = min(
+            float(self.capacidad),
+            self._tokens + (ahora - self._actualizado) * self.tasa_por_minuto / 60.0
+        )
+        self._actualizado = ahora
+
+    async def acquire(self) -> float:
+        """
+        Espera hasta obtener un token
+
+        Returns:
+            Segundos esperados
+        """
+        inicio = time.monotonic()
+        # El lock mantiene el orden de llegada entre los que esperan
+        async with self._lock:
+            while True:
+                self._rellenar()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return time.monotonic() - inicio
+                faltante = 1 - self._tokens
+                await asyncio.sleep(faltante * 60.0 / self.tasa_por_minuto)
+
+
+class CompaniaRateLimiter:
+    """
+    Mantiene un token bucket por compañía
+
+    La configuración sale de las columnas opcionales `rate_limit_por_minuto`
+    y `rate_limit_rafaga` de empresas_servicio, o de Settings si no existen.
+    Los límites valen para toda la flota: cada proceso consumidor usa su
+    parte según las réplicas vivas en el broker (ver coordinacion), así N
+    workers juntos no superan la tasa permitida del portal.
+    """
+
+    def __init__(self, tasa_por_minuto: float, rafaga: int):
+        self.tasa_por_minuto = tasa_por_minuto
+        self.rafaga = rafaga
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def _config(self, empresa_info: Optional[Dict]):
+        empresa_info = empresa_info or {}
+        tasa = empresa_info.get("rate_limit_por_minuto") or self.tasa_por_minuto
+        rafaga = empresa_info.get("rate_limit_rafaga") or self.rafaga
+        replicas = coordinador.replicas
+        return float(tasa) / replicas, max(1, int(rafaga) // replicas)
+
+    async def acquire(self, compania: str, empresa_info: Optional[Dict] = None):
+        """
+        Espera el turno para consultar una compañía
+
+        Args:
+            compania: Nombre de la compañía (servicios.compania)
+            empresa_info: Registro de empresas_servicio (para límites por fila)
+        """
+        tasa, rafaga = self._config(empresa_info)
+        bucket = self._buckets.get(compania)
+
+        if bucket is None:
+            bucket = TokenBucket(tasa, rafaga)
+            self._buckets[compania] = bucket
+        elif (bucket.tasa_por_minuto, bucket.capacidad) != (tasa, rafaga):
+            bucket.configurar(tasa, rafaga)
+
+        esperado = await bucket.acquire()
+        if esperado >= 1:
+            logger.info(f"Rate limit {compania}: esperó {esperado:.1f}s")
+
+    def stats(self) -> Dict:
+        """Tokens disponibles y configuración de cada compañía (la parte de este proceso)"""
+        stats = {}
+        for compania, bucket in self._buckets.items():
+            bucket._rellenar()
+            stats[compania] = {
+                "replicas": coordinador.replicas,
+                "tasa_por_minuto": bucket.tasa_por_minuto,
+                "rafaga": bucket.capacidad,
+                "tokens_disponibles": round(bucket._tokens, 2)
+            }
+        return stats
+
+
+# Singleton instance (compartido por todos los jobs del proceso)
+rate_limiter = CompaniaRateLimiter(
+    tasa_por_minuto=settings.COMPANIA_RATE_POR_MINUTO,
+    rafaga=settings.COMPANIA_RATE_RAFAGA
+)
@@ -0,0 +1,310 @@
+"""
+Portal Servipag simulado para benchmarks de extracción de punta a punta
+
+Imita el flujo /paymentexpress/category/<cat>/company/<empresa>: un
+formulario con el identificador y una página de resultado con montos en
+formato chileno. Permite inyectar latencia, errores y variantes de layout
+para medir páginas por minuto y la precisión del parseo de montos sin tocar
+portal.servipag.com.
+
+Uso:
+    python servipag_mock.py --puerto 8100 --latencia-ms 800 --tasa-error 0.05 --variante aleatoria
+
+Luego apuntar scripts y agente al mock con SERVIPAG_BASE_URL=http://localhost:8100
+(con BROWSER_USE_CLOUD=false: un browser en la nube no alcanza localhost).
+
+El monto de cada (empresa, identificador) es determinístico; GET
+/__mock/esperado?empresa=...&identificador=... retorna el valor correcto.
+"""
+import argparse
+import asyncio
+import hashlib
+import html
+import random
+from typing import Dict, Optional
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import HTMLResponse, JSONResponse
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Layouts del portal: formulario + resultado por fetch, formulario clásico con
+# página de resultado (tabla de documentos), SPA con render demorado y montos
+# partidos en varios elementos, y montos con decimales ("4.713,00")
+VARIANTES = ["estandar", "clasica", "spa", "decimales"]
+
+
+class ConfigMock:
+    """Parámetros del portal simulado (modificables en caliente vía /__mock/config)"""
+
+    def __init__(
+        self,
+        latencia_ms: float = 500,
+        jitter: float = 0.5,
+        latencia_pagina_ms: float = 50,
+        tasa_error: float = 0.0,
+        tasa_sin_deuda: float = 0.15,
+        variante: str = "estandar",
+        semilla: Optional[int] = None
+    ):
+        """
+        Args:
+            latencia_ms: Latencia media de la consulta del identificador
+            jitter: Variación relativa de la latencia (0.5 = ±50%)
+            latencia_pagina_ms: Latencia de la página del formulario
+            tasa_error: Fracción de consultas que responden "servicio no disponible"
+            tasa_sin_deuda: Fracción de identificadores sin deuda
+            variante: Una de VARIANTES, "aleatoria" (por request) o "por_empresa"
+            semilla: Semilla del generador aleatorio (latencia, errores, variantes)
+        """
+        self.latencia_ms = latencia_ms
+        self.jitter = jitter
+        self.latencia_pagina_ms = latencia_pagina_ms
+        self.tasa_error = tasa_error
+        self.tasa_sin_deuda = tasa_sin_deuda
+        self.variante = variante
+        self.rng = random.Random(semilla)
+
+    def como_dict(self) -> Dict:
+        return {k: v for k, v in vars(self).items() if k != "rng"}
+
+
+def _hash(*partes: str) -> int:
+    return int(hashlib.sha256("|".join(partes).encode("utf-8")).hexdigest()[:12], 16)
+
+
+def monto_esperado(empresa: str, identificador: str, tasa_sin_deuda: float = 0.15) -> float:
+    """
+    Deuda que el portal simulado muestra para una empresa e identificador
+
+    Args:
+        empresa: Slug de la empresa en la URL
+        identificador: Número de cliente/RUT ingresado
+        tasa_sin_deuda: Fracción de identificadores sin deuda
+
+    Returns:
+        Monto en pesos (0 si no hay deuda)
+    """
+    valor = _hash(empresa, identificador)
+    if (valor % 1000) / 1000 < tasa_sin_deuda:
+        return 0.0
+    # Montos de $1.000 a $1.500.000, redondeados a 10 pesos
+    return float(1000 + (valor // 1000) % 149900 * 10)
+
+
+def formato_clp(monto: float, decimales: bool = False) -> str:
+    """Formatea un monto como en Chile: punto de miles y coma decimal"""
+    if decimales:
+        entero, _, fraccion = f"{monto:,.2f}".partition(".")
+        return f"{entero.replace(',', '.')},{fraccion}"
+    return f"{int(round(monto)):,}".replace(",", ".")
+
+
+def _variante(config: ConfigMock, empresa: str, forzada: Optional[str]) -> str:
+    if forzada in VARIANTES:
+        return forzada
+    if config.variante == "aleatoria":
+        return config.rng.choice(VARIANTES)
+    if config.variante == "por_empresa":
+        return VARIANTES[_hash(empresa) % len(VARIANTES)]
+    return config.variante if config.variante in VARIANTES else "estandar"
+
+
+async def _esperar(config: ConfigMock, media_ms: float):
+    if media_ms <= 0:
+        return
+    factor = 1 + config.rng.uniform(-config.jitter, config.jitter)
+    await asyncio.sleep(max(0.0, media_ms * factor) / 1000)
+
+
+def _pagina(titulo: str, cuerpo: str) -> str:
+    return f"""<!DOCTYPE html>
+<html lang="es">
+<head><meta charset="utf-8"><title>{html.escape(titulo)} - Servipag</title></head>
+<body>
+<header><h1>Servipag</h1><p>Paga tus cuentas en línea de forma rápida y segura</p></header>
+<main>{cuerpo}</main>
+<footer><p>Servipag (portal simulado para pruebas)</p></footer>
+</body>
+</html>"""
+
+
+def _html_resultado(variante: str, empresa: str, identificador: str, monto: float) -> str:
+    """Fragmento HTML con el resultado de la consulta en el formato de la variante"""
+    cliente = html.escape(identificador)
+    if monto == 0:
+        return f'<div id="resultado"><p>Cliente {cliente}</p><p>El cliente no registra deuda pendiente.</p></div>'
+
+    if variante == "clasica":
+        # Varias boletas y el total al final, como la vista de documentos
+        valor = _hash(empresa, identificador, "documentos")
+        partes = [round(monto * p) for p in (0.5, 0.3)] if valor % 2 else [round(monto * 0.6)]
+        partes.append(monto - sum(partes))
+        filas = "".join(
+            f"<tr><td>Boleta {i}</td><td>{10 + i:02d}-10-2026</td><td>${formato_clp(parte)}</td></tr>"
+            for i, parte in enumerate(partes, start=1)
+        )
+        return (
+            f'<div id="resultado"><p>Cliente {cliente}</p>'
+            f"<table><tr><th>Documento</th><th>Vencimiento</th><th>Monto</th></tr>{filas}</table>"
+            f"<p><strong>Deuda total: ${formato_clp(monto)}</strong></p></div>"
+        )
+
+    if variante == "spa":
+        return (
+            f'<div id="resultado"><p>Cliente {cliente}</p><div class="monto">'
+            f'<span class="etiqueta">Monto a pagar</span> <span class="moneda">$</span>'
+            f'<span class="valor">{formato_clp(monto)}</span></div></div>'
+        )
+
+    if variante == "decimales":
+        return f'<div id="resultado"><p>Cliente {cliente}</p><p>Total a pagar: $ {formato_clp(monto, decimales=True)}</p></div>'
+
+    return f'<div id="resultado"><p>Cliente {cliente}</p><p>Total a pagar: $ {formato_clp(monto)}</p></div>'
+
+
+def _html_error() -> str:
+    return '<div id="resultado"><p>Servicio no disponible temporalmente. Intente más tarde.</p></div>'
+
+
+def _html_formulario(variante: str, categoria: str, empresa: str) -> str:
+    """Página del formulario de identificador en el layout de la variante"""
+    nombre = html.escape(empresa.replace("-", " ").title())
+    api = f"/paymentexpress/api/consulta?categoria={categoria}&empresa={empresa}&variante={variante}"
+
+    if variante == "clasica":
+        return _pagina(nombre, f"""
+<h2>{nombre}</h2>
+<form method="get" action="/paymentexpress/category/{categoria}/company/{empresa}/resultado">
+  <input type="hidden" name="variante" value="clasica">
+  <label for="identificador">Número de Cliente</label>
+  <input type="text" id="identificador" name="identificador" required>
+  <button type="submit">Continuar</button>
+</form>""")
+
+    # estandar, spa y decimales: el resultado se inserta en la misma página
+    tipo_input = "" if variante == "spa" else ' type="text"'
+    tipo_boton = "button" if variante == "spa" else "submit"
+    demora_render = 600 if variante == "spa" else 0
+    return _pagina(nombre, f"""
+<h2>{nombre}</h2>
+<form id="consulta" onsubmit="return false;">
+  <label for="identificador">Número de Cliente</label>
+  <input{tipo_input} id="identificador" name="identificador" autocomplete="off">
+  <button type="{tipo_boton}" id="continuar">Continuar</button>
+</form>
+<section id="contenedor"></section>
+<script>
+document.getElementById("continuar").addEventListener("click", async () => {{
+  const identificador = document.getElementById("identificador").value;
+  const contenedor = document.getElementById("contenedor");
+  contenedor.innerHTML = "<p>Consultando...</p>";
+  const respuesta = await fetch("{api}&identificador=" + encodeURIComponent(identificador));
+  const datos = await respuesta.json();
+  setTimeout(() => {{ contenedor.innerHTML = datos.html; }}, {demora_render});
+}});
+</script>""")
+
+
+def crear_app(config: Optional[ConfigMock] = None) -> FastAPI:
+    """
+    Crea la app del portal simulado
+
+    Args:
+        config: Parámetros del mock (por defecto ConfigMock())
+
+    Returns:
+        App FastAPI lista para uvicorn o httpx.ASGITransport
+    """
+    config = config or ConfigMock()
+    stats = {"formularios": 0, "consultas": 0, "errores": 0, "por_variante": {v: 0 for v in VARIANTES}}
+    app = FastAPI(title="Servipag simulado")
+    app.state.config = config
+    app.state.stats = stats
+
+    async def consultar(empresa: str, identificador: str, variante: str):
+        """Resuelve una consulta: (html del resultado, status HTTP)"""
+        await _esperar(config, config.latencia_ms)
+        stats["consultas"] += 1
+        stats["por_variante"][variante] += 1
+        if config.rng.random() < config.tasa_error:
+            stats["errores"] += 1
+            return _html_error(), 503
+        monto = monto_esperado(empresa, identificador, config.tasa_sin_deuda)
+        return _html_resultado(variante, empresa, identificador, monto), 200
+
+    @app.get("/paymentexpress/category/{categoria}/company/{empresa}", response_class=HTMLResponse)
+    async def formulario(categoria: str, empresa: str, variante: Optional[str] = None):
+        await _esperar(config, config.latencia_pagina_ms)
+        stats["formularios"] += 1
+        return HTMLResponse(_html_formulario(_variante(config, empresa, variante), categoria, empresa))
+
+    @app.get("/paymentexpress/category/{categoria}/company/{empresa}/resultado", response_class=HTMLResponse)
+    async def resultado(categoria: str, empresa: str, identificador: str = "", variante: Optional[str] = None):
+        variante = _variante(config, empresa, variante)
+        contenido, status = await consultar(empresa, identificador, variante)
+        return HTMLResponse(_pagina(empresa, contenido), status_code=status)
+
+    @app.get("/paymentexpress/api/consulta")
+    async def api_consulta(empresa: str, identificador: str = "", variante: Optional[str] = None, categoria: str = ""):
+        variante = _variante(config, empresa, variante)
+        contenido, status = await consultar(empresa, identificador, variante)
+        return JSONResponse({"html": contenido, "variante": variante}, status_code=status)
+
+    @app.get("/__mock/esperado")
+    async def esperado(empresa: str, identificador: str):
+        return {"empresa": empresa, "identificador": identificador, "deuda": monto_esperado(empresa, identificador, config.tasa_sin_deuda)}
+
+    @app.get("/__mock/config")
+    async def ver_config():
+        return config.como_dict()
+
+    @app.post("/__mock/config")
+    async def cambiar_config(request: Request):
+        for clave, valor in (await request.json()).items():
+            if clave in config.como_dict():
+                setattr(config, clave, valor)
+        return config.como_dict()
+
+    @app.get("/__mock/stats")
+    async def ver_stats():
+        return stats
+
+    return app
+
+
+def slug_empresa(url: str) -> str:
+    """Slug de la empresa en una URL /paymentexpress/category/<cat>/company/<empresa>"""
+    partes = url.rstrip("/").split("/")
+    return partes[partes.index("company") + 1] if "company" in partes else partes[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Portal Servipag simulado")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8100)
+    parser.add_argument("--latencia-ms", type=float, default=500)
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--latencia-pagina-ms", type=float, default=50)
+    parser.add_argument("--tasa-error", type=float, default=0.0)
+    parser.add_argument("--tasa-sin-deuda", type=float, default=0.15)
+    parser.add_argument("--variante", default="estandar", choices=VARIANTES + ["aleatoria", "por_empresa"])
+    parser.add_argument("--semilla", type=int)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = ConfigMock(
+        latencia_ms=args.latencia_ms,
+        jitter=args.jitter,
+        latencia_pagina_ms=args.latencia_pagina_ms,
+        tasa_error=args.tasa_error,
+        tasa_sin_deuda=args.tasa_sin_deuda,
+        variante=args.variante,
+        semilla=args.semilla
+    )
+    uvicorn.run(crear_app(config), host=args.host, port=args.puerto)
+
+
+if __name__ == "__main__":
+    main()
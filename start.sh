@@ -1,4 +1,20 @@
 #!/bin/bash
 # Script de inicio para producción
+# Uso: ./start.sh [api|worker]
+#   api     API REST (por defecto). Con API_CONSUMIR_COLA=false solo encola y
+#           puede correr con varios procesos (API_WORKERS)
+#   worker  Proceso consumidor de la cola; escalar levantando más réplicas
 
-exec uvicorn api:app --host 0.0.0.0 --port 8000 --workers 1
+case "${1:-api}" in
+    worker)
+        exec python worker.py
+        ;;
+    *)
+        if [ "${API_WORKERS:-1}" -gt 1 ]; then
+            # /metrics suma los contadores de todos los procesos de uvicorn
+            export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/metricas}"
+            rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+        fi
+        exec uvicorn api:app --host 0.0.0.0 --port 8000 --workers "${API_WORKERS:-1}"
+        ;;
+esac
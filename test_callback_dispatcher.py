@@ -0,0 +1,116 @@
+"""
+Pruebas del CallbackDispatcher con un JobStore SQLite temporal y HTTP simulado
+
+Ejecutar: python -m unittest test_callback_dispatcher
+"""
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from collections import Counter
+
+os.environ.setdefault("SUPABASE_URL", "https://test.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "test")
+
+import httpx
+from callback_dispatcher import CallbackDispatcher
+from job_store import JobStore
+
+
+class TestCallbackDispatcher(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.store = JobStore(os.path.join(directorio.name, "jobs.db"))
+        self.addCleanup(self.store.close)
+        self.entregas = Counter()
+        self.fallar_primeros = 0
+
+    def responder(self, request: httpx.Request) -> httpx.Response:
+        if self.fallar_primeros > 0:
+            self.fallar_primeros -= 1
+            return httpx.Response(503)
+        self.entregas[request.url.path] += 1
+        return httpx.Response(200)
+
+    def crear(self, consumidor: str, lease: float = 30, resultados=None) -> CallbackDispatcher:
+        dispatcher = CallbackDispatcher(
+            store=self.store,
+            on_resultado=lambda job_id, enviado, error: resultados.append((job_id, enviado)) if resultados is not None else None,
+            consumidor=consumidor,
+            lease=lease,
+            backoff_base=0.01,
+            backoff_max=0.01
+        )
+        dispatcher._client = httpx.AsyncClient(transport=httpx.MockTransport(self.responder))
+        self.addAsyncCleanup(dispatcher.close)
+        return dispatcher
+
+    async def esperar(self, condicion, timeout: float = 3):
+        async def ciclo():
+            while not condicion():
+                await asyncio.sleep(0.01)
+        await asyncio.wait_for(ciclo(), timeout)
+
+    async def test_dos_consumidores_no_duplican_entregas(self):
+        for i in range(10):
+            self.store.guardar_callback(f"job-{i}", f"http://destino/cb/{i}", {"resultados": []}, 0, time.time())
+
+        a, b = self.crear("a"), self.crear("b")
+        await asyncio.gather(a.start(), b.start())
+        await self.esperar(lambda: sum(self.entregas.values()) == 10 and not a._tareas and not b._tareas)
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(set(self.entregas.values()), {1})
+        self.assertEqual(self.store.reclamar_callbacks("c", 30), [])
+
+    async def test_no_reclama_entregas_con_lease_vigente(self):
+        self.store.guardar_callback("job-1", "http://destino/cb/1", {}, 0, time.time(), consumidor="otro", lease=30)
+
+        dispatcher = self.crear("nuevo")
+        await dispatcher.start()
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(self.entregas, Counter())
+        self.assertEqual(dispatcher.stats()["pendientes"], 0)
+
+    async def test_retoma_entregas_de_un_consumidor_caido(self):
+        self.store.guardar_callback("job-1", "http://destino/cb/1", {}, 0, time.time(), consumidor="caido", lease=0.1)
+
+        dispatcher = self.crear("vivo", lease=0.15)
+        await dispatcher.start()
+        await self.esperar(lambda: self.entregas["/cb/1"] == 1)
+
+        self.assertEqual(self.store.reclamar_callbacks("otro", 30), [])
+
+    async def test_reintenta_y_elimina_al_entregar(self):
+        resultados = []
+        self.fallar_primeros = 2
+        dispatcher = self.crear("a", resultados=resultados)
+        await dispatcher.start()
+
+        dispatcher.enviar("job-1", "http://destino/cb/1", {"resultados": [1]})
+        await self.esperar(lambda: resultados)
+
+        self.assertEqual(resultados, [("job-1", True)])
+        self.assertEqual(dispatcher.stats()["reintentos"], 2)
+        self.assertEqual(self.store.reclamar_callbacks("otro", 30), [])
+
+    async def test_close_suelta_los_leases(self):
+        self.fallar_primeros = 1000
+        a = self.crear("a")
+        a.backoff_base = a.backoff_max = 5
+        await a.start()
+        a.enviar("job-1", "http://destino/cb/1", {})
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(self.store.reclamar_callbacks("b", 30), [])
+        await a.close()
+        time.sleep(0.01)
+        self.assertEqual([e["job_id"] for e in self.store.reclamar_callbacks("b", 30)], ["job-1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Pruebas del planificador de carriles (reservas, envejecimiento y capacidad por carril)
+
+Ejecutar: python -m unittest test_carriles
+"""
+import unittest
+
+from carriles import PlanificadorCarriles
+
+
+class TestPlanificadorCarriles(unittest.IsolatedAsyncioTestCase):
+
+    def crear(self, max_workers=3, reservas=None, aging_segundos=300):
+        return PlanificadorCarriles(
+            max_workers=max_workers,
+            reservas=reservas if reservas is not None else {"interactive": 1},
+            aging_segundos=aging_segundos
+        )
+
+    async def test_prioridad_por_carril(self):
+        planificador = self.crear()
+        await planificador.put("background", "b")
+        await planificador.put("batch", "l")
+        await planificador.put("interactive", "i")
+
+        self.assertEqual([(await planificador.get())[1] for _ in range(3)], ["i", "l", "b"])
+
+    async def test_reserva_deja_un_worker_para_interactivo(self):
+        planificador = self.crear(max_workers=2)
+        for i in range(3):
+            await planificador.put("background", f"b{i}")
+
+        self.assertEqual(await planificador.get(), ("background", "b0"))
+        # El segundo worker es la reserva de interactive: background no lo toma
+        self.assertEqual(planificador._elegibles(), [])
+
+        await planificador.put("interactive", "i")
+        self.assertEqual(await planificador.get(), ("interactive", "i"))
+
+    async def test_envejecimiento(self):
+        planificador = self.crear(aging_segundos=0.001)
+        await planificador.put("background", "viejo")
+        planificador._pendientes["background"][0] = (0.0, "viejo")
+        await planificador.put("interactive", "nuevo")
+
+        self.assertEqual((await planificador.get())[1], "viejo")
+
+    async def test_libres_por_carril(self):
+        planificador = self.crear(max_workers=3)
+        self.assertEqual(planificador.libres(), 3)
+        self.assertEqual(planificador.libres("interactive"), 3)
+        self.assertEqual(planificador.libres("background"), 2)
+
+        # Un trabajo masivo: 2 sub-tareas corriendo y varias esperando en background
+        for i in range(6):
+            await planificador.put("background", i)
+        await planificador.get()
+        await planificador.get()
+
+        self.assertLessEqual(planificador.libres(), 0)
+        self.assertLessEqual(planificador.libres("background"), 0)
+        self.assertEqual(planificador.libres("batch"), 0)
+        # La reserva de interactive sigue disponible para reclamar
+        self.assertEqual(planificador.libres("interactive"), 1)
+
+        await planificador.put("interactive", "i")
+        self.assertEqual(planificador.libres("interactive"), 0)
+
+    async def test_task_done_libera_capacidad(self):
+        planificador = self.crear(max_workers=1, reservas={})
+        await planificador.put("batch", "l")
+        carril, _ = await planificador.get()
+        self.assertEqual(planificador.libres("batch"), 0)
+
+        await planificador.task_done(carril)
+
+        self.assertEqual(planificador.libres("batch"), 1)
+        self.assertEqual(planificador.stats()["batch"], {"pendientes": 0, "corriendo": 0, "reservados": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+"""
+Pruebas del circuit breaker por compañía (solo las fallas de portal lo abren)
+
+Ejecutar: python -m unittest test_circuit_breaker
+"""
+import asyncio
+import os
+import unittest
+
+os.environ.setdefault("SUPABASE_URL", "https://test.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "test")
+
+import httpx
+
+import agent_runner
+import circuit_breaker as modulo
+from circuit_breaker import CompaniaCircuitBreaker, es_falla_de_portal, ABIERTO, CERRADO, SEMI_ABIERTO
+from extractores import ExtraccionError
+
+
+def consulta(resultado=None, excepcion=None):
+    async def consultar():
+        if excepcion is not None:
+            raise excepcion
+        return resultado
+    return consultar
+
+
+class HistorialFalso:
+    """Historial de una corrida que terminó sin resultado y sin excepción"""
+
+    def __init__(self, errores):
+        self._errores = errores
+        self.history = []
+        self.usage = None
+
+    def errors(self):
+        return self._errores
+
+    def is_done(self):
+        return False
+
+    def final_result(self):
+        return None
+
+
+class SesionFalsa:
+    browser = None
+
+    def marcar_error(self):
+        pass
+
+
+def agente_falso(errores):
+    class AgenteFalso:
+        def __init__(self, **kwargs):
+            pass
+
+        async def run(self):
+            return HistorialFalso(errores)
+    return AgenteFalso
+
+
+EXITO = {"deuda": 1000, "error": None}
+FALLA_PORTAL = {"deuda": 0, "error": "Timeout navegando al portal", "falla_portal": True}
+FALLA_IDENTIFICADOR = {"deuda": 0, "error": "No se pudo obtener resultado del agente", "falla_portal": False}
+
+
+class TestCircuitBreaker(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        original = modulo.settings.CIRCUITO_HABILITADO
+        modulo.settings.CIRCUITO_HABILITADO = True
+        self.addCleanup(setattr, modulo.settings, "CIRCUITO_HABILITADO", original)
+        self.breaker = CompaniaCircuitBreaker(umbral_fallos=3, enfriamiento_segundos=0.05)
+
+    def estado(self, compania="Enel"):
+        return self.breaker.stats()["companias"][compania]["estado"]
+
+    async def test_fallas_de_portal_abren_y_rechazan(self):
+        for _ in range(3):
+            await self.breaker.ejecutar("Enel", consulta(FALLA_PORTAL))
+        self.assertEqual(self.estado(), ABIERTO)
+
+        llamadas = []
+        async def no_deberia_correr():
+            llamadas.append(1)
+            return EXITO
+        rechazo = await self.breaker.ejecutar("Enel", no_deberia_correr)
+
+        self.assertEqual(llamadas, [])
+        self.assertEqual(rechazo["fuente"], "circuito")
+        self.assertIn("Timeout navegando al portal", rechazo["error"])
+
+    async def test_errores_de_identificador_no_abren(self):
+        for _ in range(10):
+            await self.breaker.ejecutar("Enel", consulta(FALLA_IDENTIFICADOR))
+        with self.assertRaises(ExtraccionError):
+            await self.breaker.ejecutar("Enel", consulta(excepcion=ExtraccionError("Montos en conflicto")))
+
+        self.assertEqual(self.estado(), CERRADO)
+        self.assertEqual(self.breaker.stats()["companias"]["Enel"]["fallos_consecutivos"], 0)
+
+    async def test_error_de_identificador_no_corta_la_racha(self):
+        await self.breaker.ejecutar("Enel", consulta(FALLA_PORTAL))
+        await self.breaker.ejecutar("Enel", consulta(FALLA_IDENTIFICADOR))
+        await self.breaker.ejecutar("Enel", consulta(FALLA_PORTAL))
+        self.assertEqual(self.estado(), CERRADO)
+
+        await self.breaker.ejecutar("Enel", consulta(EXITO))
+        self.assertEqual(self.breaker.stats()["companias"]["Enel"]["fallos_consecutivos"], 0)
+
+    async def test_excepciones_de_portal_cuentan(self):
+        for excepcion in (asyncio.TimeoutError(), httpx.ConnectError("sin conexión"), RuntimeError("net::ERR_CONNECTION_REFUSED")):
+            with self.assertRaises(type(excepcion)):
+                await self.breaker.ejecutar("Enel", consulta(excepcion=excepcion))
+        self.assertEqual(self.estado(), ABIERTO)
+
+    async def test_sonda_cierra_o_reabre(self):
+        for _ in range(3):
+            await self.breaker.ejecutar("Enel", consulta(FALLA_PORTAL))
+        await asyncio.sleep(0.06)
+        self.assertEqual(self.estado(), SEMI_ABIERTO)
+
+        # Una sonda que falla por el identificador no decide: sigue semi-abierto
+        await self.breaker.ejecutar("Enel", consulta(FALLA_IDENTIFICADOR))
+        self.assertEqual(self.estado(), SEMI_ABIERTO)
+
+        await self.breaker.ejecutar("Enel", consulta(FALLA_PORTAL))
+        self.assertEqual(self.estado(), ABIERTO)
+
+        await asyncio.sleep(0.06)
+        await self.breaker.ejecutar("Enel", consulta(EXITO))
+        self.assertEqual(self.estado(), CERRADO)
+
+    async def test_circuitos_independientes_por_compania(self):
+        for _ in range(3):
+            await self.breaker.ejecutar("Enel", consulta(FALLA_PORTAL))
+        resultado = await self.breaker.ejecutar("Aguas Andinas", consulta(EXITO))
+
+        self.assertEqual(resultado, EXITO)
+        self.assertEqual(self.breaker.stats()["abiertos"], ["Enel"])
+
+    async def agente_sin_excepcion(self, errores):
+        original = agent_runner.Agent
+        agent_runner.Agent = agente_falso(errores)
+        self.addCleanup(setattr, agent_runner, "Agent", original)
+        runner = agent_runner.AgentRunner()
+
+        async def consultar():
+            resultado, _ = await runner._ejecutar_agente("prompt", SesionFalsa())
+            return resultado
+        return consultar
+
+    async def test_agente_que_se_rinde_por_errores_de_portal_abre(self):
+        consultar = await self.agente_sin_excepcion([
+            None,
+            "Navigation failed: net::ERR_CONNECTION_TIMED_OUT at https://portal.servipag.com",
+            "TimeoutError: Page.goto: Timeout 30000ms exceeded"
+        ])
+        for _ in range(3):
+            resultado = await self.breaker.ejecutar("Enel", consultar)
+
+        self.assertTrue(resultado["falla_portal"])
+        self.assertEqual(self.estado(), ABIERTO)
+
+    async def test_agente_que_se_rinde_por_otros_errores_no_abre(self):
+        consultar = await self.agente_sin_excepcion(["Element with index 12 does not exist", None])
+        for _ in range(5):
+            resultado = await self.breaker.ejecutar("Enel", consultar)
+
+        self.assertFalse(resultado["falla_portal"])
+        self.assertEqual(self.estado(), CERRADO)
+
+    def test_clasificacion_de_excepciones(self):
+        self.assertTrue(es_falla_de_portal(asyncio.TimeoutError()))
+        self.assertTrue(es_falla_de_portal(httpx.ReadTimeout("lento")))
+        self.assertTrue(es_falla_de_portal(Exception("Navigation failed because page crashed")))
+        self.assertFalse(es_falla_de_portal(ExtraccionError("No se encontró el monto de la deuda")))
+        self.assertFalse(es_falla_de_portal(ValueError("identificador inválido")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+"""
+Pruebas del índice de posiciones en cola (árbol de Fenwick) contra una lista
+
+Ejecutar: python -m unittest test_cola_posiciones
+"""
+import random
+import unittest
+
+from cola_posiciones import IndicePosiciones
+
+
+class TestIndicePosiciones(unittest.TestCase):
+
+    def test_posiciones_en_orden_de_llegada(self):
+        indice = IndicePosiciones()
+        for clave in "abcd":
+            indice.agregar(clave)
+
+        self.assertEqual([indice.posicion(c) for c in "abcd"], [1, 2, 3, 4])
+        self.assertEqual(len(indice), 4)
+
+    def test_quitar_adelanta_a_los_siguientes(self):
+        indice = IndicePosiciones()
+        for clave in "abcd":
+            indice.agregar(clave)
+        indice.quitar("b")
+
+        self.assertEqual(indice.posicion("a"), 1)
+        self.assertEqual(indice.posicion("c"), 2)
+        self.assertEqual(indice.posicion("d"), 3)
+        self.assertEqual(indice.posicion("b"), 0)
+        self.assertNotIn("b", indice)
+
+    def test_agregar_repetido_y_quitar_ausente_no_cambian_nada(self):
+        indice = IndicePosiciones()
+        indice.agregar("a")
+        indice.agregar("b")
+        indice.agregar("a")
+        indice.quitar("z")
+
+        self.assertEqual(len(indice), 2)
+        self.assertEqual(indice.posicion("a"), 1)
+        self.assertEqual(indice.posicion("b"), 2)
+
+    def test_crece_y_compacta_mas_alla_de_la_capacidad(self):
+        indice = IndicePosiciones(capacidad=4)
+        for i in range(10):
+            indice.agregar(i)
+            if i % 2:
+                indice.quitar(i - 1)
+
+        self.assertEqual(len(indice), 5)
+        self.assertEqual([indice.posicion(i) for i in (1, 3, 5, 7, 9)], [1, 2, 3, 4, 5])
+
+    def test_coincide_con_una_lista_en_operaciones_al_azar(self):
+        azar = random.Random(12)
+        indice = IndicePosiciones(capacidad=8)
+        cola = []
+        siguiente = 0
+
+        for _ in range(2000):
+            if cola and azar.random() < 0.45:
+                clave = azar.choice(cola)
+                cola.remove(clave)
+                indice.quitar(clave)
+            else:
+                cola.append(siguiente)
+                indice.agregar(siguiente)
+                siguiente += 1
+
+            if cola:
+                clave = azar.choice(cola)
+                self.assertEqual(indice.posicion(clave), cola.index(clave) + 1)
+        self.assertEqual(len(indice), len(cola))
+
+
+if __name__ == "__main__":
+    unittest.main()
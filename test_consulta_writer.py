@@ -0,0 +1,109 @@
+"""
+Pruebas del ConsultaWriter (inserts en lote de consultas_deuda) con una BD falsa
+
+Ejecutar: python -m unittest test_consulta_writer
+"""
+import asyncio
+import os
+import time
+import unittest
+
+os.environ.setdefault("SUPABASE_URL", "https://test.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "test")
+
+import consulta_writer as modulo
+from consulta_writer import ConsultaWriter
+
+
+class BDFalsa:
+    """Registra cada insert; puede fallar o retornar menos filas de las insertadas"""
+
+    def __init__(self, latencia: float = 0.05, retornar_max: int = None, fallar_lote: bool = False, fila_invalida: int = None):
+        self.latencia = latencia
+        self.retornar_max = retornar_max
+        self.fallar_lote = fallar_lote
+        self.fila_invalida = fila_invalida
+        self.inserts = []
+        self.filas = []
+
+    def construir_consulta(self, servicio_id, propiedad_id, monto_deuda, metadata=None, error=None):
+        return {"servicio_id": servicio_id, "propiedad_id": propiedad_id, "monto_deuda": monto_deuda}
+
+    async def guardar_consultas_deuda(self, filas):
+        await asyncio.sleep(self.latencia)
+        self.inserts.append(len(filas))
+        if len(filas) > 1 and self.fallar_lote:
+            raise RuntimeError("lote rechazado")
+        if any(fila["servicio_id"] == self.fila_invalida for fila in filas):
+            raise RuntimeError("fila inválida")
+        self.filas.extend(filas)
+        insertadas = [{"consulta_id": f"c-{fila['servicio_id']}"} for fila in filas]
+        return insertadas[:self.retornar_max] if self.retornar_max is not None else insertadas
+
+
+class TestConsultaWriter(unittest.IsolatedAsyncioTestCase):
+
+    def usar_bd(self, bd: BDFalsa):
+        original = modulo.db
+        modulo.db = bd
+        self.addCleanup(setattr, modulo, "db", original)
+
+    async def test_group_commit_no_espera_intervalo(self):
+        bd = BDFalsa(latencia=0.05)
+        self.usar_bd(bd)
+        writer = ConsultaWriter(max_lote=50)
+
+        inicio = time.perf_counter()
+        primera = asyncio.create_task(writer.guardar(1, 1, 100))
+        await asyncio.sleep(0.01)
+        # Llegan mientras el primer insert está en curso: salen juntas en el siguiente
+        resto = await asyncio.gather(*(writer.guardar(i, 1, 100) for i in range(2, 12)))
+        await primera
+        duracion = time.perf_counter() - inicio
+
+        self.assertLess(duracion, 0.5)
+        self.assertEqual(bd.inserts, [1, 10])
+        self.assertEqual(resto[0]["consulta_id"], "c-2")
+        await writer.close()
+
+    async def test_insert_con_menos_filas_retornadas_no_duplica(self):
+        bd = BDFalsa(latencia=0.01, retornar_max=0)
+        self.usar_bd(bd)
+        writer = ConsultaWriter(max_lote=3, intervalo_segundos=10)
+
+        resultados = await asyncio.gather(*(writer.guardar(i, 1, 0) for i in range(3)))
+
+        self.assertEqual(bd.inserts, [3])
+        self.assertEqual(len(bd.filas), 3)
+        self.assertTrue(all(r["guardado"] for r in resultados))
+        self.assertTrue(all(r["consulta_id"] is None for r in resultados))
+        await writer.close()
+
+    async def test_lote_fallido_reintenta_fila_por_fila(self):
+        bd = BDFalsa(latencia=0.01, fallar_lote=True, fila_invalida=2)
+        self.usar_bd(bd)
+        writer = ConsultaWriter(max_lote=3, intervalo_segundos=10)
+
+        resultados = await asyncio.gather(*(writer.guardar(i, 1, 0) for i in range(3)), return_exceptions=True)
+
+        self.assertEqual(bd.inserts, [3, 1, 1, 1])
+        self.assertEqual([f["servicio_id"] for f in bd.filas], [0, 1])
+        self.assertEqual(resultados[0]["consulta_id"], "c-0")
+        self.assertIsInstance(resultados[2], RuntimeError)
+        await writer.close()
+
+    async def test_close_escribe_lo_pendiente(self):
+        bd = BDFalsa(latencia=0.01)
+        self.usar_bd(bd)
+        writer = ConsultaWriter(max_lote=50, intervalo_segundos=30)
+
+        pendiente = asyncio.create_task(writer.guardar(7, 1, 0))
+        await asyncio.sleep(0)
+        await writer.close()
+
+        self.assertEqual((await pendiente)["consulta_id"], "c-7")
+        self.assertEqual(writer._tareas, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
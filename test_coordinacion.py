@@ -0,0 +1,155 @@
+"""
+Pruebas de la coordinación entre procesos (latidos y avisos) sobre un broker
+SQLite y de los límites de flota repartidos entre réplicas
+
+Ejecutar: python -m unittest test_coordinacion
+"""
+import asyncio
+import os
+import tempfile
+import unittest
+
+os.environ.setdefault("SUPABASE_URL", "https://test.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "test")
+
+import coordinacion
+from agent_budget import AgentBudget
+from consulta_cache import consulta_cache
+from coordinacion import Coordinador
+from job_store import JobStore
+from rate_limiter import CompaniaRateLimiter
+
+
+class TestCoordinador(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.ruta = os.path.join(directorio.name, "jobs.db")
+
+    def proceso(self, nombre: str, consume: bool = True):
+        """Un Coordinador con su propia conexión al broker, como otro proceso"""
+        store = JobStore(self.ruta)
+        self.addCleanup(store.close)
+        coordinador = Coordinador(intervalo_segundos=60)
+        coordinador.compartir_estado("circuitos", lambda: {"proceso": nombre})
+        return coordinador, store, nombre, consume
+
+    async def iniciar(self, proceso):
+        coordinador, store, nombre, consume = proceso
+        await coordinador.start(store, nombre, consume=consume)
+        self.addCleanup(coordinador._tarea.cancel)
+        return coordinador
+
+    async def test_replicas_y_estados_de_los_consumidores(self):
+        w1 = await self.iniciar(self.proceso("w1"))
+        w2 = await self.iniciar(self.proceso("w2"))
+        api = await self.iniciar(self.proceso("api", consume=False))
+        await w1._sincronizar()
+
+        self.assertEqual((w1.replicas, w2.replicas), (2, 2))
+        # La API no consume: no cuenta como réplica ni publica estado
+        self.assertEqual(api.estados("circuitos"), {"w1": {"proceso": "w1"}, "w2": {"proceso": "w2"}})
+
+        await w2.close()
+        await w1._sincronizar()
+        self.assertEqual(w1.replicas, 1)
+        self.assertEqual(list(api.estados("circuitos")), ["w1"])
+
+    async def test_avisos_llegan_a_los_demas_procesos(self):
+        recibidos = {"w1": [], "api": []}
+        w1 = await self.iniciar(self.proceso("w1"))
+        api = await self.iniciar(self.proceso("api", consume=False))
+        w1.al_avisar("circuito_reset", lambda datos: recibidos["w1"].append(datos["compania"]))
+        api.al_avisar("circuito_reset", lambda datos: recibidos["api"].append(datos["compania"]))
+
+        await api.avisar("circuito_reset", {"compania": "Enel"})
+        self.assertEqual(recibidos, {"w1": [], "api": ["Enel"]})
+
+        await w1._sincronizar()
+        await api._sincronizar()
+        await w1._sincronizar()
+        # Cada proceso lo aplica una sola vez, también el que lo publicó
+        self.assertEqual(recibidos, {"w1": ["Enel"], "api": ["Enel"]})
+
+    async def test_manejadores_async_y_con_error(self):
+        recargas = []
+        w1 = await self.iniciar(self.proceso("w1"))
+        api = await self.iniciar(self.proceso("api", consume=False))
+
+        async def recargar(datos):
+            recargas.append(datos["recargar"])
+
+        def fallar(datos):
+            raise RuntimeError("no se pudo")
+
+        w1.al_avisar("cache_empresas", fallar)
+        w1.al_avisar("cache_empresas", recargar)
+
+        await api.avisar("cache_empresas", {"recargar": True})
+        await w1._sincronizar()
+        self.assertEqual(recargas, [True])
+
+    async def test_un_proceso_nuevo_ignora_avisos_anteriores(self):
+        api = await self.iniciar(self.proceso("api", consume=False))
+        await api.avisar("circuito_reset", {"compania": "Enel"})
+
+        recibidos = []
+        nuevo, store, nombre, consume = self.proceso("w1")
+        nuevo.al_avisar("circuito_reset", recibidos.append)
+        await self.iniciar((nuevo, store, nombre, consume))
+        await nuevo._sincronizar()
+
+        self.assertEqual(recibidos, [])
+
+    async def test_sin_broker_todo_es_local(self):
+        recibidos = []
+        local = Coordinador()
+        local.compartir_estado("circuitos", lambda: {"abiertos": []})
+        local.al_avisar("cache_consultas", recibidos.append)
+        await local.start(None, "api-1", consume=True)
+
+        await local.avisar("cache_consultas")
+
+        self.assertEqual(recibidos, [{}])
+        self.assertEqual(local.estados("circuitos"), {"api-1": {"abiertos": []}})
+        self.assertEqual(local.replicas, 1)
+
+
+class TestLimitesDeFlota(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.coordinador = coordinacion.coordinador
+        original = self.coordinador.replicas
+        self.addCleanup(setattr, self.coordinador, "replicas", original)
+
+    def test_rate_limit_se_reparte_entre_replicas(self):
+        limiter = CompaniaRateLimiter(tasa_por_minuto=30, rafaga=4)
+        self.coordinador.replicas = 3
+
+        self.assertEqual(limiter._config(None), (10.0, 1))
+        self.assertEqual(limiter._config({"rate_limit_por_minuto": 60, "rate_limit_rafaga": 6}), (20.0, 2))
+
+    async def test_presupuesto_de_agentes_se_reparte_y_se_libera(self):
+        budget = AgentBudget(max_agentes=4)
+        self.coordinador.replicas = 2
+        await budget.acquire("a")
+        await budget.acquire("a")
+        esperando = asyncio.create_task(budget.acquire("b"))
+        await asyncio.sleep(0)
+        self.assertFalse(esperando.done())
+
+        # Un worker se cayó: este proceso toma también su parte
+        self.coordinador._actualizar_replicas(1)
+        budget._despachar()
+        await asyncio.wait_for(esperando, 1)
+        self.assertEqual(budget.stats()["limite_proceso"], 4)
+
+    async def test_invalidar_cache_de_consultas_por_aviso(self):
+        consulta_cache._recientes["llave"] = object()
+        await self.coordinador._aplicar("cache_consultas", {"origen": "api"})
+        self.assertEqual(len(consulta_cache._recientes), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
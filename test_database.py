@@ -0,0 +1,93 @@
+"""
+Pruebas de la paginación de SupabaseClient con un cliente falso
+
+Ejecutar: python -m unittest test_database
+"""
+import os
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("SUPABASE_URL", "https://test.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "test")
+
+from database import SupabaseClient
+
+
+class _Respuesta:
+    def __init__(self, data):
+        self.data = data
+
+
+class ConsultaFalsa:
+    """Imita el query builder de postgrest; corta cada página en max_rows como el servidor"""
+
+    def __init__(self, filas, max_rows, llamadas):
+        self.filas = filas
+        self.max_rows = max_rows
+        self.llamadas = llamadas
+        self.desde = 0
+        self.limite = None
+
+    def select(self, *args):
+        return self
+
+    def eq(self, *args):
+        return self
+
+    def order(self, *args):
+        return self
+
+    def gt(self, columna, valor):
+        self.desde = valor
+        return self
+
+    def limit(self, limite):
+        self.limite = limite
+        return self
+
+    def execute(self):
+        self.llamadas.append(self.desde)
+        restantes = [f for f in self.filas if f["servicio_id"] > self.desde]
+        return _Respuesta(restantes[:min(self.limite, self.max_rows)])
+
+
+class ClienteFalso:
+    def __init__(self, filas, max_rows):
+        self.filas = filas
+        self.max_rows = max_rows
+        self.llamadas = []
+
+    def table(self, nombre):
+        return ConsultaFalsa(self.filas, self.max_rows, self.llamadas)
+
+
+class TestIterServiciosActivos(unittest.IsolatedAsyncioTestCase):
+
+    def crear_db(self, filas, max_rows):
+        db = SupabaseClient.__new__(SupabaseClient)
+        db.client = ClienteFalso(filas, max_rows)
+        db._executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(db._executor.shutdown)
+        return db
+
+    async def test_pagina_corta_no_termina_la_iteracion(self):
+        filas = [{"servicio_id": i} for i in range(1, 26)]
+        # El servidor devuelve como máximo 7 filas aunque se pidan 10
+        db = self.crear_db(filas, max_rows=7)
+
+        ids = [s["servicio_id"] async for s in db.iter_servicios_activos(page_size=10)]
+
+        self.assertEqual(ids, list(range(1, 26)))
+        self.assertEqual(db.client.llamadas, [0, 7, 14, 21, 25])
+
+    async def test_sin_servicios(self):
+        db = self.crear_db([], max_rows=1000)
+
+        ids = [s async for s in db.iter_servicios_activos(page_size=10)]
+
+        self.assertEqual(ids, [])
+        self.assertEqual(db.client.llamadas, [0])
+
+
+if __name__ == "__main__":
+    unittest.main()
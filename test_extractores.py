@@ -0,0 +1,104 @@
+"""
+Pruebas del parseo de montos de las páginas de Servipag
+
+Ejecutar: python -m unittest test_extractores
+"""
+import os
+import unittest
+
+os.environ.setdefault("SUPABASE_URL", "https://test.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "test")
+
+from extractores import (
+    ExtraccionError, ServipagScriptExtractor, extraer_monto_de_texto, obtener_extractor, parsear_monto_clp
+)
+from servipag_mock import VARIANTES, _html_formulario, _html_resultado, monto_esperado
+from benchmark import texto_visible
+
+
+class TestParsearMontoClp(unittest.TestCase):
+
+    def test_formatos_chilenos(self):
+        self.assertEqual(parsear_monto_clp("$ 4.713"), 4713.0)
+        self.assertEqual(parsear_monto_clp("4.713,50"), 4713.5)
+        self.assertEqual(parsear_monto_clp("$1.234.567"), 1234567.0)
+
+    def test_sin_digitos(self):
+        with self.assertRaises(ValueError):
+            parsear_monto_clp("$")
+
+
+class TestExtraerMontoDeTexto(unittest.TestCase):
+
+    def test_numero_suelto_tras_etiqueta_no_es_monto(self):
+        self.assertEqual(extraer_monto_de_texto("Total a pagar: $ 4.713 Total documentos: 2"), 4713.0)
+        self.assertEqual(extraer_monto_de_texto("Total: $ 1.500 Saldo 0"), 1500.0)
+
+    def test_monto_con_separador_de_miles_sin_simbolo(self):
+        self.assertEqual(extraer_monto_de_texto("Deuda total 12.345"), 12345.0)
+        self.assertEqual(extraer_monto_de_texto("Total: 4.713,50."), 4713.5)
+
+    def test_prefiere_total_a_pagar(self):
+        texto = "Saldo anterior: $ 3.000 Total: $ 2.000 Total a pagar: $ 5.000"
+        self.assertEqual(extraer_monto_de_texto(texto), 5000.0)
+
+    def test_montos_en_conflicto(self):
+        with self.assertRaises(ExtraccionError):
+            extraer_monto_de_texto("Total a pagar: $ 4.713 Total a pagar: $ 9.999")
+        with self.assertRaises(ExtraccionError):
+            extraer_monto_de_texto("Total: $ 1.000 Saldo: $ 2.000")
+        with self.assertRaises(ExtraccionError):
+            extraer_monto_de_texto("Boleta $ 1.000 Boleta $ 2.000")
+
+    def test_mismo_monto_repetido_no_es_conflicto(self):
+        self.assertEqual(extraer_monto_de_texto("Total: $ 4.713 Total a pagar: $ 4.713 Deuda total: 4.713"), 4713.0)
+
+    def test_sin_deuda(self):
+        self.assertEqual(extraer_monto_de_texto("El cliente no registra deuda pendiente. Total documentos: 0"), 0.0)
+
+    def test_ignora_montos_del_texto_previo(self):
+        previo = "Paga desde $ 1.000 sin comisión"
+        self.assertEqual(extraer_monto_de_texto(previo + " Total a pagar: $ 4.713", previo), 4713.0)
+        self.assertIsNone(extraer_monto_de_texto(previo, previo))
+
+    def test_sin_monto(self):
+        self.assertIsNone(extraer_monto_de_texto("Servicio no disponible temporalmente. Total documentos: 3"))
+
+    def test_variantes_del_portal_simulado(self):
+        for variante in VARIANTES:
+            for identificador in ("12345", "98765432", "555"):
+                with self.subTest(variante=variante, identificador=identificador):
+                    monto = monto_esperado("aguas-andinas", identificador)
+                    formulario = texto_visible(_html_formulario(variante, "agua", "aguas-andinas"))
+                    pagina = formulario + " " + texto_visible(_html_resultado(variante, "aguas-andinas", identificador, monto))
+                    self.assertEqual(extraer_monto_de_texto(pagina, formulario), monto)
+
+
+
+class TestScriptPorEmpresa(unittest.TestCase):
+
+    def test_sin_script_extraccion_usa_el_agente(self):
+        self.assertIsNone(obtener_extractor({"nombre": "Aguas Andinas", "url_servipag": "https://x"}))
+
+    def test_script_habilitado_por_fila(self):
+        extractor = obtener_extractor({
+            "nombre": "Enel",
+            "script_extraccion": {"selector_boton": "#consultar", "selector_monto": ".total", "monto_maximo": 500000}
+        })
+        self.assertIsInstance(extractor, ServipagScriptExtractor)
+        self.assertEqual((extractor.selector_boton, extractor.selector_monto), ("#consultar", ".total"))
+        self.assertEqual(extractor.monto_maximo, 500000)
+
+    def test_monto_no_plausible_vuelve_al_agente(self):
+        extractor = ServipagScriptExtractor(monto_maximo=1_000_000)
+        self.assertEqual(extractor._validar(4713.0, "12345"), 4713.0)
+        self.assertEqual(extractor._validar(0.0, "12345"), 0.0)
+        with self.assertRaises(ExtraccionError):
+            extractor._validar(25_000_000.0, "12345")
+        # El selector leyó el identificador que se acaba de ingresar
+        with self.assertRaises(ExtraccionError):
+            extractor._validar(98765.0, "0098765")
+
+
+if __name__ == "__main__":
+    unittest.main()
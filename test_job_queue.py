@@ -0,0 +1,176 @@
+"""
+Pruebas de JobQueue en memoria con un BatchProcessor y una BD falsos
+
+Ejecutar: python -m unittest test_job_queue
+"""
+import asyncio
+import os
+import tempfile
+import unittest
+
+os.environ.setdefault("SUPABASE_URL", "https://test.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "test")
+os.environ["JOB_STORE_PATH"] = ""
+
+import batch_processor
+import database
+from config import settings
+from job_queue import JobQueue
+from job_store import JobStore
+
+
+class ProcesadorFalso:
+    """Reemplaza a BatchProcessor: consulta servicios sin red y puede fallar en algunos"""
+
+    fallar = set()
+    latencia = 0.01
+
+    def __init__(self, propietario=None, on_servicio=None):
+        self.on_servicio = on_servicio
+
+    async def procesar_servicio(self, servicio):
+        await asyncio.sleep(self.latencia)
+        if servicio["servicio_id"] in self.fallar:
+            raise RuntimeError(f"servicio {servicio['servicio_id']} explotó")
+        return {"servicio_id": servicio["servicio_id"], "deuda": 1000.0, "exito": True, "error": None}
+
+    async def procesar_servicios_especificos(self, servicio_ids):
+        if set(servicio_ids) & self.fallar:
+            raise RuntimeError("batch falló")
+        return [await self.procesar_servicio({"servicio_id": sid}) for sid in servicio_ids]
+
+    async def procesar_propiedad(self, propiedad_id):
+        return [await self.procesar_servicio({"servicio_id": propiedad_id * 100})]
+
+    async def close(self):
+        pass
+
+
+class BaseJobQueue(unittest.IsolatedAsyncioTestCase):
+
+    # True = broker SQLite temporal; False = cola solo en memoria
+    con_store = False
+
+    def parchar(self, objeto, atributo, valor):
+        original = getattr(objeto, atributo)
+        setattr(objeto, atributo, valor)
+        self.addCleanup(setattr, objeto, atributo, original)
+
+    async def asyncSetUp(self):
+        ProcesadorFalso.fallar = set()
+        ProcesadorFalso.latencia = 0.01
+        self.parchar(batch_processor, "BatchProcessor", ProcesadorFalso)
+
+        async def servicios_por_ids(ids):
+            return [{"servicio_id": sid} for sid in ids]
+
+        async def servicios_activos():
+            for sid in range(1, 31):
+                yield {"servicio_id": sid}
+
+        self.parchar(database.db, "get_servicios_por_ids", servicios_por_ids)
+        self.parchar(database.db, "iter_servicios_activos", servicios_activos)
+        self.parchar(settings, "CARRIL_RESERVAS", {"interactive": 1, "batch": 0, "background": 0})
+        self.parchar(settings, "SUBTAREAS_UMBRAL", 10)
+        self.parchar(settings, "SUBTAREAS_EN_VUELO", 3)
+
+        self.store = None
+        if self.con_store:
+            directorio = tempfile.TemporaryDirectory()
+            self.addCleanup(directorio.cleanup)
+            self.store = JobStore(os.path.join(directorio.name, "jobs.db"))
+            self.addCleanup(self.store.close)
+            self.parchar(settings, "COLA_POLL_SEGUNDOS", 0.05)
+
+        self.cola = JobQueue(max_workers=2, store=self.store)
+        await self.cola.start()
+        self.addAsyncCleanup(self.cola.close)
+
+    async def esperar_fin(self, job_id: str, timeout: float = 5) -> dict:
+        async def terminado():
+            while self.cola.get_job_status(job_id)["status"] not in ("completed", "failed"):
+                await asyncio.sleep(0.01)
+        await asyncio.wait_for(terminado(), timeout)
+        return self.cola.get_job_status(job_id)
+
+
+class TestSubtareas(BaseJobQueue):
+
+    async def test_subtarea_que_falla_no_cuelga_al_padre(self):
+        ProcesadorFalso.fallar = {4, 7}
+        job_id = await self.cola.add_job("servicios", {"servicio_ids": list(range(1, 16))})
+
+        job = await self.esperar_fin(job_id)
+
+        self.assertEqual(job["status"], "completed")
+        self.assertEqual([r["servicio_id"] for r in job["resultado"]], [i for i in range(1, 16) if i not in (4, 7)])
+        self.assertEqual(self.cola._subtareas, {})
+
+
+class TestCallbacks(BaseJobQueue):
+
+    async def test_trabajo_fallido_envia_callback(self):
+        enviados = []
+        self.parchar(self.cola.callbacks, "enviar", lambda job_id, url, payload: enviados.append((job_id, url, payload)))
+        ProcesadorFalso.fallar = {2}
+
+        job_id = await self.cola.add_job("servicios", {"servicio_ids": [1, 2]}, callback_url="http://destino/cb")
+        job = await self.esperar_fin(job_id)
+
+        self.assertEqual(job["status"], "failed")
+        self.assertEqual(enviados, [(job_id, "http://destino/cb", {"resultados": []})])
+
+    async def test_callback_lleva_el_resultado_aunque_se_vuelque_a_disco(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.parchar(settings, "JOB_RESULTADO_SPILL_KB", 0)
+        cola = JobQueue(max_workers=1, resultados_dir=directorio.name)
+        self.addAsyncCleanup(cola.close)
+        enviados = []
+        self.parchar(cola.callbacks, "enviar", lambda job_id, url, payload: enviados.append(payload))
+
+        job_id = await cola.add_job("servicios", {"servicio_ids": [1, 2]}, callback_url="http://destino/cb")
+        await asyncio.wait_for(self._esperar_enviados(enviados), 5)
+
+        self.assertIsNone(cola.jobs[job_id]["resultado"])
+        self.assertEqual([r["servicio_id"] for r in enviados[0]["resultados"]], [1, 2])
+
+    @staticmethod
+    async def _esperar_enviados(enviados):
+        while not enviados:
+            await asyncio.sleep(0.01)
+
+
+class TestFinalizarConBroker(BaseJobQueue):
+
+    con_store = True
+
+    async def test_callback_que_falla_no_deja_el_job_en_processing(self):
+        def enviar_roto(job_id, url, payload):
+            raise RuntimeError("dispatcher caído")
+
+        self.parchar(self.cola.callbacks, "enviar", enviar_roto)
+
+        job_id = await self.cola.add_job("servicios", {"servicio_ids": [1]}, callback_url="http://destino/cb")
+        job = await self.esperar_fin(job_id)
+
+        self.assertEqual(job["status"], "completed")
+        self.assertEqual(self.store.eventos(job_id, tipo="status")[-1]["datos"]["status"], "completed")
+        self.assertIsNone(self.store.reclamar("otro", 30))
+        self.assertNotIn(job_id, self.cola.jobs)
+
+    async def test_subtareas_no_bloquean_reclamar_trabajos_interactivos(self):
+        ProcesadorFalso.latencia = 0.1
+        todas = await self.cola.add_job("todas", {})
+        while not self.cola._subtareas.get(todas, {}).get("en_vuelo"):
+            await asyncio.sleep(0.01)
+
+        interactivo = await self.cola.add_job("propiedad", {"propiedad_id": 7})
+        job = await self.esperar_fin(interactivo, timeout=1)
+
+        self.assertEqual(job["status"], "completed")
+        self.assertEqual(self.store.obtener(todas)["status"], "processing")
+
+
+if __name__ == "__main__":
+    unittest.main()
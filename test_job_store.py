@@ -0,0 +1,185 @@
+"""
+Pruebas del JobStore SQLite como broker y de la creación del store configurado
+
+Ejecutar: python -m unittest test_job_store
+"""
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+os.environ.setdefault("SUPABASE_URL", "https://test.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "test")
+
+import job_store_redis
+from config import settings
+from job_store import JobStore, crear_job_store
+
+
+def nuevo_job(job_id: str, carril: str = "interactive", tipo: str = "servicios") -> dict:
+    return {
+        "job_id": job_id,
+        "tipo": tipo,
+        "params": {},
+        "status": "pending",
+        "created_at": "2026-10-01T12:00:00",
+        "carril": carril
+    }
+
+
+class TestJobStoreBroker(unittest.TestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.ruta = os.path.join(directorio.name, "jobs.db")
+        self.store = JobStore(self.ruta)
+        self.addCleanup(self.store.close)
+
+    def test_reclama_por_prioridad_una_sola_vez(self):
+        self.store.publicar(nuevo_job("b", "batch"), 20)
+        self.store.publicar(nuevo_job("a"), 10)
+
+        self.assertEqual(self.store.reclamar("w1", 30)["job_id"], "a")
+        self.assertEqual(self.store.reclamar("w2", 30)["job_id"], "b")
+        self.assertIsNone(self.store.reclamar("w3", 30))
+
+    def test_lease_vencido_se_retoma(self):
+        self.store.publicar(nuevo_job("a"), 10)
+        self.store.reclamar("caido", 0.01)
+        time.sleep(0.02)
+
+        self.assertEqual(self.store.reclamar("vivo", 30)["job_id"], "a")
+
+    def test_renovar_solo_los_propios(self):
+        self.store.publicar(nuevo_job("a"), 10)
+        self.store.reclamar("w1", 0.05)
+        self.store.renovar("w2", ["a"], 30)
+        time.sleep(0.06)
+        self.assertEqual(self.store.reclamar("w2", 30)["job_id"], "a")
+
+        self.store.renovar("w2", ["a"], 30)
+        self.assertIsNone(self.store.reclamar("w3", 30))
+
+    def test_reclamar_por_carril(self):
+        self.store.publicar(nuevo_job("fondo", "background", tipo="todas"), 1)
+        self.store.publicar(nuevo_job("inter"), 5)
+
+        self.assertIsNone(self.store.reclamar("w", 30, []))
+        self.assertEqual(self.store.reclamar("w", 30, ["interactive", "batch"])["job_id"], "inter")
+        self.assertIsNone(self.store.reclamar("w", 30, ["interactive", "batch"]))
+        self.assertEqual(self.store.reclamar("w", 30)["job_id"], "fondo")
+
+    def test_liberar_saca_de_la_cola(self):
+        self.store.publicar(nuevo_job("a"), 10)
+        self.store.publicar(nuevo_job("b"), 20)
+        self.assertEqual(self.store.posicion("b"), 2)
+
+        self.store.reclamar("w", 30)
+        job = self.store.obtener("a")
+        job["status"] = "completed"
+        job["completed_at"] = "2026-10-01T12:01:00"
+        self.store.guardar(job)
+        self.store.liberar("a")
+
+        self.assertEqual(self.store.posicion("b"), 1)
+        self.assertEqual(self.store.conteos(), {"completed": 1, "pending": 1})
+
+    def test_conteos_incrementales(self):
+        for i in range(3):
+            self.store.publicar(nuevo_job(f"j{i}"), i)
+        job = self.store.obtener("j0")
+        job["status"] = "processing"
+        self.store.guardar(job)
+        self.store.guardar(job)
+        job["status"] = "completed"
+        job["completed_at"] = "2026-10-01T11:00:00"
+        self.store.guardar(job)
+        self.store.eliminar("j1")
+
+        self.assertEqual(self.store.conteos(), {"pending": 1, "completed": 1})
+
+        self.assertEqual([j["job_id"] for j in self.store.eliminar_terminados(antes_de="2026-10-02T00:00:00")], ["j0"])
+        self.assertEqual(self.store.conteos(), {"pending": 1})
+
+    def test_conteos_de_una_base_existente(self):
+        self.store.guardar({**nuevo_job("viejo"), "status": "failed", "completed_at": "2026-10-01T12:00:00"})
+        self.store.close()
+        conexion = sqlite3.connect(self.ruta)
+        conexion.execute("DROP TABLE job_conteos")
+        for trigger in ("insert", "update", "delete"):
+            conexion.execute(f"DROP TRIGGER trg_jobs_conteo_{trigger}")
+        conexion.commit()
+        conexion.close()
+
+        self.store = JobStore(self.ruta)
+        self.addCleanup(self.store.close)
+        self.store.publicar(nuevo_job("nuevo"), 1)
+
+        self.assertEqual(self.store.conteos(), {"failed": 1, "pending": 1})
+
+    def test_posicion_solo_cuenta_pendientes_adelante(self):
+        for i in range(5):
+            self.store.publicar(nuevo_job(f"j{i}"), i)
+        job = self.store.obtener("j0")
+        job["status"] = "processing"
+        self.store.guardar(job)
+
+        self.assertEqual([self.store.posicion(f"j{i}") for i in range(1, 5)], [1, 2, 3, 4])
+
+    def test_migra_base_sin_carril(self):
+        self.store.close()
+        conexion = sqlite3.connect(self.ruta)
+        conexion.execute("DROP INDEX idx_jobs_carril")
+        conexion.execute("ALTER TABLE jobs DROP COLUMN carril")
+        conexion.execute(
+            "INSERT INTO jobs (job_id, tipo, status, created_at, datos, prioridad) VALUES (?, ?, ?, ?, ?, ?)",
+            ("viejo", "todas", "pending", "2026-10-01T12:00:00", '{"job_id": "viejo", "tipo": "todas"}', 1)
+        )
+        conexion.commit()
+        conexion.close()
+
+        self.store = JobStore(self.ruta)
+        self.addCleanup(self.store.close)
+
+        self.assertIsNone(self.store.reclamar("w", 30, ["interactive"]))
+        self.assertEqual(self.store.reclamar("w", 30, ["background"])["job_id"], "viejo")
+
+
+class TestCrearJobStore(unittest.TestCase):
+
+    def parchar(self, objeto, atributo, valor):
+        original = getattr(objeto, atributo)
+        setattr(objeto, atributo, valor)
+        self.addCleanup(setattr, objeto, atributo, original)
+
+    def test_redis_sin_paquete_falla_con_mensaje_claro(self):
+        self.parchar(settings, "COLA_BROKER", "redis")
+        self.parchar(job_store_redis, "redis", None)
+
+        with self.assertRaises(RuntimeError) as contexto:
+            crear_job_store()
+
+        self.assertIn("uv sync --extra redis", str(contexto.exception))
+
+    def test_sin_ruta_la_cola_queda_en_memoria(self):
+        self.parchar(settings, "COLA_BROKER", "sqlite")
+        self.parchar(settings, "JOB_STORE_PATH", "")
+
+        self.assertIsNone(crear_job_store())
+
+    def test_sqlite(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.parchar(settings, "COLA_BROKER", "sqlite")
+        self.parchar(settings, "JOB_STORE_PATH", os.path.join(directorio.name, "jobs.db"))
+
+        store = crear_job_store()
+        self.addCleanup(store.close)
+
+        self.assertEqual(store.ruta, settings.JOB_STORE_PATH)
+
+
+if __name__ == "__main__":
+    unittest.main()
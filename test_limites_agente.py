@@ -0,0 +1,150 @@
+"""
+Pruebas de los límites del agente aprendidos por empresa con perfiles sintéticos
+
+Ejecutar: python -m unittest test_limites_agente
+"""
+import os
+import unittest
+
+os.environ.setdefault("SUPABASE_URL", "https://test.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "test")
+
+import limites_agente as modulo
+from limites_agente import LimitesAgente
+
+
+def parchar(prueba, objeto, atributo, valor):
+    original = getattr(objeto, atributo)
+    setattr(objeto, atributo, valor)
+    prueba.addCleanup(setattr, objeto, atributo, original)
+
+
+def perfil(paso_mas_lento=5.0, pasos_con_error=0, acciones=2, causa=None):
+    return {
+        "pasos_segundos": [1.0, paso_mas_lento],
+        "pasos_con_error": pasos_con_error,
+        "acciones_por_paso_max": acciones,
+        "causa_fallo": causa
+    }
+
+
+class BDFalsa:
+    def __init__(self, filas=None, fallar=False):
+        self.filas = filas or []
+        self.fallar = fallar
+        self.llamadas = 0
+
+    async def get_perfiles_agente(self, desde, compania=None, limit=5000):
+        self.llamadas += 1
+        if self.fallar:
+            raise RuntimeError("Supabase no responde")
+        return self.filas
+
+
+class TestLimitesAgente(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        parchar(self, modulo.settings, "STEP_TIMEOUT", 30)
+        parchar(self, modulo.settings, "MAX_FAILURES", 3)
+        parchar(self, modulo.settings, "MAX_ACTIONS_PER_STEP", 5)
+        parchar(self, modulo.settings, "AGENTE_LIMITES_STEP_TIMEOUT_MIN", 10)
+        parchar(self, modulo.settings, "AGENTE_LIMITES_FACTOR_MAX", 3)
+        parchar(self, modulo.settings, "AGENTE_LIMITES_ADAPTATIVOS", True)
+        self.limites = LimitesAgente(percentil=0.95, margen=0.5, min_corridas=10)
+
+    def test_sin_corridas_suficientes_no_aprende(self):
+        perfiles = [perfil() for _ in range(9)] + [perfil(causa="timeout") for _ in range(5)]
+        self.assertIsNone(self.limites.calcular(perfiles))
+
+    def test_percentil_mas_margen(self):
+        perfiles = [perfil(paso_mas_lento=s, pasos_con_error=0, acciones=3) for s in range(11, 31)]
+        limites = self.limites.calcular(perfiles)
+
+        # p95 de 11..30 es 30; ×1.5 = 45
+        self.assertEqual(limites["step_timeout"], 45)
+        self.assertEqual(limites["max_actions_per_step"], 5)
+        self.assertEqual(limites["corridas"], 20)
+
+    def test_solo_aprende_de_corridas_exitosas(self):
+        perfiles = [perfil(paso_mas_lento=8) for _ in range(10)]
+        perfiles += [perfil(paso_mas_lento=300, pasos_con_error=9, causa="timeout") for _ in range(10)]
+        limites = self.limites.calcular(perfiles)
+
+        self.assertEqual(limites["step_timeout"], 12)
+        self.assertEqual(limites["corridas"], 10)
+
+    def test_acota_a_minimos_y_maximos(self):
+        rapidos = self.limites.calcular([perfil(paso_mas_lento=0.5, acciones=1) for _ in range(10)])
+        self.assertEqual(rapidos["step_timeout"], 10)
+        # Sin pasos con error igual se toleran fallos transitorios
+        self.assertEqual(rapidos["max_failures"], 2)
+        self.assertEqual(rapidos["max_actions_per_step"], 2)
+
+        lentos = self.limites.calcular([perfil(paso_mas_lento=500, pasos_con_error=40, acciones=50) for _ in range(10)])
+        self.assertEqual(lentos["step_timeout"], 90)
+        self.assertEqual(lentos["max_failures"], 9)
+        self.assertEqual(lentos["max_actions_per_step"], 15)
+
+    def test_max_failures_nunca_supera_el_minimo_global(self):
+        parchar(self, modulo.settings, "MAX_FAILURES", 1)
+        limites = self.limites.calcular([perfil() for _ in range(10)])
+        self.assertEqual(limites["max_failures"], 1)
+
+    def test_perfiles_sin_acciones_no_fijan_max_actions(self):
+        perfiles = [perfil(acciones=None) for _ in range(10)]
+        self.assertNotIn("max_actions_per_step", self.limites.calcular(perfiles))
+
+    async def test_obtener_prioriza_empresa_luego_aprendido_y_global(self):
+        filas = [{"empresa": "Enel", "perfil": perfil(paso_mas_lento=20)} for _ in range(10)]
+        parchar(self, modulo, "db", BDFalsa(filas))
+
+        limites = await self.limites.obtener({"nombre": "Enel", "agente_max_acciones_paso": 7})
+
+        self.assertEqual(limites["step_timeout"], 30)
+        self.assertEqual(limites["max_actions_per_step"], 7)
+        self.assertEqual(limites["origen"], {
+            "step_timeout": "aprendido",
+            "max_failures": "aprendido",
+            "max_actions_per_step": "empresa"
+        })
+
+        otra = await self.limites.obtener({"nombre": "Aguas Andinas"})
+        self.assertEqual(set(otra["origen"].values()), {"global"})
+        self.assertEqual(otra["step_timeout"], 30)
+
+    async def test_recalcula_solo_al_vencer_el_ttl(self):
+        bd = BDFalsa([{"empresa": "Enel", "perfil": perfil()} for _ in range(10)])
+        parchar(self, modulo, "db", bd)
+
+        await self.limites.obtener({"nombre": "Enel"})
+        await self.limites.obtener({"nombre": "Enel"})
+        self.assertEqual(bd.llamadas, 1)
+
+        self.limites.ttl_segundos = 0
+        await self.limites.obtener({"nombre": "Enel"})
+        self.assertEqual(bd.llamadas, 2)
+
+    async def test_error_de_bd_conserva_limites_anteriores(self):
+        parchar(self, modulo, "db", BDFalsa([{"empresa": "Enel", "perfil": perfil(paso_mas_lento=20)} for _ in range(10)]))
+        await self.limites.refresh()
+
+        parchar(self, modulo, "db", BDFalsa(fallar=True))
+        await self.limites.refresh()
+
+        limites = await self.limites.obtener({"nombre": "Enel"})
+        self.assertEqual(limites["step_timeout"], 30)
+        self.assertEqual(limites["origen"]["step_timeout"], "aprendido")
+
+    async def test_deshabilitado_usa_globales(self):
+        parchar(self, modulo.settings, "AGENTE_LIMITES_ADAPTATIVOS", False)
+        bd = BDFalsa([{"empresa": "Enel", "perfil": perfil(paso_mas_lento=20)} for _ in range(10)])
+        parchar(self, modulo, "db", bd)
+
+        limites = await self.limites.obtener({"nombre": "Enel"})
+
+        self.assertEqual(bd.llamadas, 0)
+        self.assertEqual(set(limites["origen"].values()), {"global"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Pruebas del perfil de corridas del agente (causa y detalle de fallo)
+
+Ejecutar: python -m unittest test_perfil_agente
+"""
+import asyncio
+import os
+import unittest
+
+os.environ.setdefault("SUPABASE_URL", "https://test.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "test")
+
+import agent_runner
+from perfil_agente import causa_de_fallo, construir_perfil, resumir_perfiles
+
+
+class HistorialFalso:
+    """Historial sin pasos registrados, con los errores dados"""
+
+    def __init__(self, errores, terminado=False, exitoso=None):
+        self._errores = errores
+        self._terminado = terminado
+        self._exitoso = exitoso
+        self.history = []
+        self.usage = None
+
+    def errors(self):
+        return self._errores
+
+    def is_done(self):
+        return self._terminado
+
+    def is_successful(self):
+        return self._exitoso
+
+    def final_result(self):
+        return None
+
+
+class SesionFalsa:
+    browser = None
+
+    def marcar_error(self):
+        pass
+
+
+class TestPerfilAgente(unittest.IsolatedAsyncioTestCase):
+
+    def test_causas_de_fallo(self):
+        self.assertEqual(causa_de_fallo(None, excepcion=asyncio.TimeoutError()), "timeout")
+        self.assertEqual(causa_de_fallo(None, excepcion=RuntimeError("x")), "excepcion")
+        self.assertEqual(causa_de_fallo(HistorialFalso([])), "sin_terminar")
+        self.assertEqual(causa_de_fallo(HistorialFalso([], terminado=True, exitoso=False)), "agente_sin_exito")
+        self.assertEqual(
+            causa_de_fallo(HistorialFalso([], terminado=True, exitoso=True), resultado_valido=False),
+            "resultado_invalido"
+        )
+
+    def test_sin_detalle_usa_el_ultimo_error_de_los_pasos(self):
+        perfil = construir_perfil(HistorialFalso([None, "Element 4 not found", None]), "sin_terminar")
+        self.assertEqual(perfil["detalle_fallo"], "Element 4 not found")
+
+        exitoso = construir_perfil(HistorialFalso(["Element 4 not found"]))
+        self.assertIsNone(exitoso["detalle_fallo"])
+
+    async def test_agente_sin_resultado_guarda_el_error_real(self):
+        historial = HistorialFalso([None, "Page.goto: Timeout 30000ms exceeded"])
+
+        class AgenteFalso:
+            def __init__(self, **kwargs):
+                pass
+
+            async def run(self):
+                return historial
+
+        original = agent_runner.Agent
+        agent_runner.Agent = AgenteFalso
+        self.addCleanup(setattr, agent_runner, "Agent", original)
+
+        resultado, _ = await agent_runner.AgentRunner()._ejecutar_agente("prompt", SesionFalsa())
+
+        self.assertEqual(resultado["perfil"]["causa_fallo"], "sin_terminar")
+        self.assertEqual(resultado["perfil"]["detalle_fallo"], "Page.goto: Timeout 30000ms exceeded")
+
+    def test_resumen_por_empresa(self):
+        filas = [
+            {"empresa": "Enel", "perfil": {"pasos": 4, "duracion_segundos": 20.0}},
+            {"empresa": "Enel", "perfil": {"pasos": 8, "duracion_segundos": 40.0, "causa_fallo": "timeout"}},
+            {"empresa": "Metrogas", "perfil": {"pasos": 2, "duracion_segundos": 5.0}}
+        ]
+        resumen = resumir_perfiles(filas)
+
+        self.assertEqual([r["empresa"] for r in resumen], ["Enel", "Metrogas"])
+        self.assertEqual(resumen[0]["fallidas"], 1)
+        self.assertEqual(resumen[0]["causas_fallo"], {"timeout": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
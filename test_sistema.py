@@ -12,7 +12,7 @@ async def test_conexion_db():
     print("=== TEST 1: Conexión a Supabase ===")
     try:
         # Probar obtener empresas
-        empresa = db.get_empresa_servicio("Metrogas")
+        empresa = await db.get_empresa_servicio("Metrogas")
         if empresa:
             print(f"✅ Conexión exitosa a Supabase")
             print(f"   Empresa encontrada: {empresa['nombre']}")
@@ -28,7 +28,7 @@ async def test_prompt_generator():
     """Prueba el generador de prompts"""
     print("=== TEST 2: Generador de Prompts ===")
     try:
-        empresa = db.get_empresa_servicio("Metrogas")
+        empresa = await db.get_empresa_servicio("Metrogas")
         servicio_mock = {
             "servicio_id": 999,
             "propiedad_id": 35,
@@ -50,7 +50,7 @@ async def test_consultar_servicio():
     print("=== TEST 3: Consulta de Servicio Real ===")
     try:
         # Obtener un servicio real de la BD
-        servicios = db.get_todas_propiedades_con_servicios()
+        servicios = await db.get_todas_propiedades_con_servicios()
         if not servicios:
             print("⚠️  No hay servicios registrados en la base de datos")
             return
@@ -78,10 +78,10 @@ async def test_historial():
     print("=== TEST 4: Historial de Consultas ===")
     try:
         # Obtener historial de la primera propiedad con servicios
-        servicios = db.get_todas_propiedades_con_servicios()
+        servicios = await db.get_todas_propiedades_con_servicios()
         if servicios:
             propiedad_id = servicios[0]['propiedad_id']
-            historial = db.get_ultimas_consultas_propiedad(propiedad_id, limit=5)
+            historial = await db.get_ultimas_consultas_propiedad(propiedad_id, limit=5)
             print(f"✅ Historial obtenido")
             print(f"   Propiedad ID: {propiedad_id}")
             print(f"   Registros encontrados: {len(historial)}")
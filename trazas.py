@@ -0,0 +1,170 @@
+"""
+Grabación y reproducción de trazas de acciones exitosas del agente por empresa
+
+Cuando el agente LLM obtiene una deuda, la secuencia de acciones que usó se
+guarda parametrizada (el identificador queda como <secret>identificador</secret>).
+Las consultas siguientes de la misma empresa reproducen esa traza sin llamar
+al LLM y solo vuelven al agente completo si la reproducción diverge.
+"""
+import json
+import os
+import re
+import time
+from typing import Dict, Optional
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Variable con la que se parametriza el identificador en las trazas
+VARIABLE_IDENTIFICADOR = "identificador"
+
+# Acciones determinísticas que se pueden reproducir sin LLM
+ACCIONES_REPRODUCIBLES = {
+    "navigate", "go_back", "click", "input", "send_keys",
+    "scroll", "wait", "select_dropdown", "switch", "close",
+}
+
+
+def _slug(nombre_empresa: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", nombre_empresa.lower()).strip("_")
+
+
+def filtrar_acciones_reproducibles(historia: Dict) -> Dict:
+    """
+    Deja solo las acciones determinísticas de un historial serializado
+
+    Se descartan 'done', 'extract' y cualquier otra acción que dependa del
+    LLM o que devuelva el resultado de la corrida original. La lista de
+    elementos con los que se interactuó se filtra en paralelo para mantener
+    la correspondencia con las acciones.
+
+    Args:
+        historia: Resultado de AgentHistoryList.model_dump()
+
+    Returns:
+        Historial serializado solo con pasos reproducibles
+    """
+    pasos = []
+    for paso in historia.get("history", []):
+        model_output = paso.get("model_output")
+        if not model_output or not model_output.get("action"):
+            continue
+
+        elementos = (paso.get("state") or {}).get("interacted_element") or [None] * len(model_output["action"])
+        acciones, interactuados = [], []
+        for accion, elemento in zip(model_output["action"], elementos):
+            nombre_accion = next(iter(accion), None)
+            if nombre_accion in ACCIONES_REPRODUCIBLES:
+                acciones.append(accion)
+                interactuados.append(elemento)
+
+        if acciones:
+            paso = dict(paso)
+            paso["model_output"] = {**model_output, "action": acciones}
+            paso["state"] = {**paso["state"], "interacted_element": interactuados}
+            paso["result"] = []
+            pasos.append(paso)
+
+    return {"history": pasos}
+
+
+class TrazaStore:
+    """
+    Guarda una traza reproducible por empresa en archivos JSON
+    """
+
+    def __init__(self, directorio: str, max_fallos: int = 3):
+        """
+        Args:
+            directorio: Carpeta donde se guardan las trazas
+            max_fallos: Reproducciones fallidas seguidas antes de descartar la traza
+        """
+        self.directorio = directorio
+        self.max_fallos = max_fallos
+
+    def _ruta(self, nombre_empresa: str) -> str:
+        return os.path.join(self.directorio, f"{_slug(nombre_empresa)}.json")
+
+    def _escribir(self, nombre_empresa: str, datos: Dict):
+        os.makedirs(self.directorio, exist_ok=True)
+        ruta = self._ruta(nombre_empresa)
+        temporal = f"{ruta}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(datos, f)
+        os.replace(temporal, ruta)
+
+    def cargar(self, nombre_empresa: str) -> Optional[Dict]:
+        """Obtiene la traza de una empresa o None si no hay"""
+        try:
+            with open(self._ruta(nombre_empresa), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Traza de {nombre_empresa} ilegible, se descarta: {str(e)}")
+            self.descartar(nombre_empresa)
+            return None
+
+    def guardar(self, nombre_empresa: str, history, identificador: str) -> bool:
+        """
+        Guarda el historial de una corrida exitosa como traza parametrizada
+
+        Args:
+            nombre_empresa: empresas_servicio.nombre
+            history: AgentHistoryList de la corrida
+            identificador: Identificador consultado (se reemplaza por la variable)
+
+        Returns:
+            True si se guardó; False si la traza no era parametrizable
+        """
+        if not identificador:
+            return False
+
+        serializada = history.model_dump(sensitive_data={VARIABLE_IDENTIFICADOR: identificador})
+        traza = filtrar_acciones_reproducibles(serializada)
+
+        marcador = f"<secret>{VARIABLE_IDENTIFICADOR}</secret>"
+        if marcador not in json.dumps(traza):
+            # El agente escribió el identificador con otro formato: no sirve como plantilla
+            logger.info(f"Traza de {nombre_empresa} no parametrizable, no se guarda")
+            return False
+
+        self._escribir(nombre_empresa, {
+            "empresa": nombre_empresa,
+            "creada_en": time.time(),
+            "reproducciones": 0,
+            "fallos_consecutivos": 0,
+            "history": traza["history"]
+        })
+        logger.info(f"Traza guardada para {nombre_empresa} ({len(traza['history'])} pasos)")
+        return True
+
+    def registrar_reproduccion(self, nombre_empresa: str, exito: bool):
+        """Actualiza contadores y descarta la traza tras varios fallos seguidos"""
+        datos = self.cargar(nombre_empresa)
+        if not datos:
+            return
+
+        if exito:
+            datos["reproducciones"] += 1
+            datos["fallos_consecutivos"] = 0
+        else:
+            datos["fallos_consecutivos"] += 1
+            if datos["fallos_consecutivos"] >= self.max_fallos:
+                logger.warning(f"Traza de {nombre_empresa} falló {self.max_fallos} veces seguidas, se descarta")
+                self.descartar(nombre_empresa)
+                return
+
+        self._escribir(nombre_empresa, datos)
+
+    def descartar(self, nombre_empresa: str):
+        """Elimina la traza de una empresa"""
+        try:
+            os.remove(self._ruta(nombre_empresa))
+        except FileNotFoundError:
+            pass
+
+
+# Singleton instance
+traza_store = TrazaStore(directorio=settings.TRAZAS_DIR, max_fallos=settings.TRAZA_MAX_FALLOS)
@@ -0,0 +1,58 @@
+"""
+Proceso worker: consume trabajos del broker compartido (SQLite o Redis)
+
+Se pueden levantar tantas réplicas como se necesite, independientes de las
+réplicas de la API (que con API_CONSUMIR_COLA=false solo encolan).
+"""
+import asyncio
+import signal
+from config import settings
+from database import db
+from consulta_writer import consulta_writer
+from browser_pool import browser_pool
+from job_queue import job_queue
+from metricas import metricas
+import logging
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def ejecutar_worker():
+    """Consume trabajos hasta recibir SIGTERM o SIGINT"""
+    if not job_queue.store:
+        raise RuntimeError("worker.py requiere un broker: configure JOB_STORE_PATH o COLA_BROKER=redis")
+
+    detener = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for senal in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(senal, detener.set)
+
+    logger.info(f"Worker {job_queue.consumidor} conectado al broker {settings.COLA_BROKER} con {job_queue.max_workers} workers")
+
+    await job_queue.start(consumir=True)
+    asyncio.create_task(browser_pool.start())
+
+    servidor_metricas = None
+    if settings.WORKER_METRICS_PORT:
+        servidor_metricas = metricas.servir(settings.WORKER_METRICS_PORT)
+
+    try:
+        await detener.wait()
+    finally:
+        logger.info(f"Deteniendo worker {job_queue.consumidor}")
+        if servidor_metricas:
+            servidor_metricas.shutdown()
+            servidor_metricas.server_close()
+        await job_queue.close()
+        await consulta_writer.close()
+        await browser_pool.close()
+        db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(ejecutar_worker())